@@ -1,5 +1,5 @@
 #!/bin/bash
-# Simple build script that works with any Python 3.7+ version
+# Simple build script that works with any Python 3.8+ version
 
 echo "🔨 Building AIFF Me Please (Simple Method)"
 echo "=========================================="
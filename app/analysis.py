@@ -0,0 +1,373 @@
+"""BPM and musical key estimation from the PCM ffmpeg decodes during conversion.
+
+The conversion's ffmpeg gets a second output: the same decoded audio,
+downmixed to mono at ANALYSIS_RATE, written to a FIFO. A process-pool worker
+reads the FIFO while ffmpeg runs and keeps two streaming spectrograms: a fine
+one in time for onset strength (tempo) and a fine one in frequency for chroma
+(key). So the analysis ends about when the encode does, with no second decode.
+
+Results are written as TBPM/TKEY and cached by source hash (the same hash the
+output store uses), so re-converting a file never analyses it again. NumPy is
+optional: without it the option is simply unavailable.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from mutagen.aiff import AIFF
+from mutagen.id3 import TBPM, TKEY
+
+from app.core import CACHE_DIR, OUTPUT_SAMPLE_RATE
+from app.store import source_hash
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+ANALYSIS_VERSION = 1  # Bump when the estimators change - old cache entries are then ignored
+ANALYSIS_RATE = 11025  # Hz - plenty for onsets and for chroma up to CHROMA_MAX_HZ
+READ_BYTES = ANALYSIS_RATE * 2 * 4  # 4 seconds of s16le mono per read
+ONSET_FRAME = 512
+ONSET_HOP = 128  # ~86 frames/s
+CHROMA_FRAME = 4096  # 2.7 Hz bins - resolves semitones down to ~50 Hz
+CHROMA_HOP = 2048
+CHROMA_MIN_HZ = 55.0
+CHROMA_MAX_HZ = 2000.0
+MIN_BPM = 70.0
+MAX_BPM = 180.0
+MIN_SECONDS = 8.0  # Shorter audio (one-shots) gets no BPM
+KEY_NAMES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+
+# Krumhansl-Kessler key profiles, C major / C minor
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+
+def analysis_args(pcm_path: Path) -> list:
+    """Extra ffmpeg output writing the decoded audio as mono s16le for the analyser."""
+    return [
+        "-map", "0:a",
+        "-ac", "1",
+        "-ar", str(ANALYSIS_RATE),
+        "-c:a", "pcm_s16le",
+        "-f", "s16le",
+        f"file:{pcm_path}"
+    ]
+
+
+class _Spectrogram:
+    """Magnitude spectra of a sample stream fed in blocks of any size."""
+
+    def __init__(self, frame: int, hop: int):
+        self.frame = frame
+        self.hop = hop
+        self.window = np.hanning(frame).astype(np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)  # Samples not yet covered by a full frame
+
+    def feed(self, samples):
+        """Spectra (frames x bins) of every frame completed by these samples."""
+        buffer = np.concatenate([self.pending, samples])
+        if len(buffer) < self.frame:
+            self.pending = buffer
+            return None
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, self.frame)[::self.hop]
+        self.pending = buffer[len(frames) * self.hop:]
+        return np.abs(np.fft.rfft(frames * self.window, axis=1))
+
+
+class _StreamAnalysis:
+    """Onset envelope and chroma totals, accumulated block by block."""
+
+    def __init__(self):
+        self.onset_spec = _Spectrogram(ONSET_FRAME, ONSET_HOP)
+        self.chroma_spec = _Spectrogram(CHROMA_FRAME, CHROMA_HOP)
+        self.onsets = []
+        self.previous = None  # Last log spectrum, for the flux across block edges
+        self.chroma = np.zeros(12)
+        self.samples = 0
+
+        # Pitch class of every chroma bin in range (MIDI note 60 is C)
+        freqs = np.fft.rfftfreq(CHROMA_FRAME, 1.0 / ANALYSIS_RATE)
+        self.chroma_bins = np.nonzero((freqs >= CHROMA_MIN_HZ) & (freqs <= CHROMA_MAX_HZ))[0]
+        midi = 69 + 12 * np.log2(freqs[self.chroma_bins] / 440.0)
+        self.pitch_class = np.round(midi).astype(int) % 12
+
+    def feed(self, samples) -> None:
+        self.samples += len(samples)
+
+        spectra = self.onset_spec.feed(samples)
+        if spectra is not None:
+            # Spectral flux of the log spectrum: how much louder each bin got since the last frame
+            log_spec = np.log1p(100.0 * spectra)
+            if self.previous is not None:
+                log_spec_prev = np.vstack([self.previous, log_spec[:-1]])
+            else:
+                log_spec_prev = np.vstack([log_spec[:1], log_spec[:-1]])
+            self.onsets.append(np.maximum(log_spec - log_spec_prev, 0).sum(axis=1))
+            self.previous = log_spec[-1:]
+
+        spectra = self.chroma_spec.feed(samples)
+        if spectra is not None:
+            energy = np.sqrt(spectra[:, self.chroma_bins]).sum(axis=0)
+            self.chroma += np.bincount(self.pitch_class, weights=energy, minlength=12)
+
+    def bpm(self):
+        """Tempo from the autocorrelation of the onset envelope, or None for short/arrhythmic audio."""
+        if self.samples < MIN_SECONDS * ANALYSIS_RATE or not self.onsets:
+            return None
+        fps = ANALYSIS_RATE / ONSET_HOP
+        envelope = np.concatenate(self.onsets)
+        # Remove the slow loudness contour so only the beat pattern is left
+        width = int(fps)
+        envelope = envelope - np.convolve(envelope, np.ones(width) / width, mode="same")
+        size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+        spectrum = np.fft.rfft(envelope, size)
+        acf = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(envelope)]
+        if acf[0] <= 0:
+            return None
+        acf = acf / acf[0]
+
+        # Score a fine tempo grid by the correlation at one, two and four beats,
+        # interpolated between lags - longer lags pin the tempo down more precisely
+        candidates = np.arange(MIN_BPM, MAX_BPM, 0.05)
+        lags = 60.0 * fps / candidates
+        lag_axis = np.arange(len(acf))
+        score = sum(np.interp(k * lags, lag_axis, acf, right=0.0) for k in (1, 2, 4))
+        # Mild preference for the tempo range most dance music sits in
+        score = score * np.exp(-0.5 * (np.log2(candidates / 125.0) / 1.0) ** 2)
+        best = int(np.argmax(score))
+        if score[best] <= 0:
+            return None
+        return float(candidates[best])
+
+    def key(self):
+        """Best-correlating major/minor key for the track's chroma, e.g. "Am", or None for silence."""
+        if not self.chroma.any():
+            return None
+        profiles = np.array([np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)]
+                            + [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)])
+        profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+        chroma = (self.chroma - self.chroma.mean()) / (self.chroma.std() or 1.0)
+        best = int(np.argmax(profiles @ chroma))
+        return KEY_NAMES[best % 12] + ("m" if best >= 12 else "")
+
+
+def analyze_stream(pcm_path: str, spans: list = None):
+    """Read mono s16le PCM until EOF and estimate tempo and key (runs in a pool worker).
+
+    spans, if given, are (start, end) sample ranges of the stream - end None
+    for the rest of it - estimated one by one, and a list of results is
+    returned. A CUE sheet's tracks are analysed that way from one decode.
+    """
+    ranges = spans or [(0, None)]
+    analyses = [_StreamAnalysis() for _ in ranges]
+    position = 0
+    with open(pcm_path, "rb") as f:
+        carry = b""
+        while True:
+            data = f.read(READ_BYTES)
+            if not data:
+                break
+            data = carry + data
+            usable = len(data) & ~1
+            carry = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+            for (start, end), analysis in zip(ranges, analyses):
+                first = max(start - position, 0)
+                last = len(samples) if end is None else min(end - position, len(samples))
+                if last > first:
+                    analysis.feed(samples[first:last])
+            position += len(samples)
+    results = [{'bpm': analysis.bpm(), 'key': analysis.key()} for analysis in analyses]
+    return results if spans else results[0]
+
+
+def write_analysis_tags(output_path: Path, result: dict) -> None:
+    """Write TBPM (whole beats, as ID3 specifies) and TKEY into the AIFF ID3 chunk."""
+    if not result.get('bpm') and not result.get('key'):
+        return
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        audio.add_tags()
+    if result.get('bpm'):
+        audio.tags.add(TBPM(encoding=3, text=[str(int(round(result['bpm'])))]))
+    if result.get('key'):
+        audio.tags.add(TKEY(encoding=3, text=[result['key']]))
+    audio.save()
+
+
+class AnalysisCache:
+    """Results by source hash in one small JSON file."""
+
+    def __init__(self, path: Path = None):
+        self.path = path or CACHE_DIR / "analysis.json"
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, key: str):
+        with self._lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, key: str, result: dict) -> None:
+        with self._lock:
+            self.entries[key] = result
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(str(tmp), str(self.path))
+            self.dirty = False
+
+
+class PendingAnalysis:
+    """One file's analysis in flight: the FIFO ffmpeg writes to and the worker reading it."""
+
+    def __init__(self, key, pcm_path: Path = None, future=None, result: dict = None):
+        self.key = key  # Cache key (a list of them for a CUE sheet's tracks), or None for archive members
+        self.pcm_path = pcm_path
+        self.future = future
+        self.result = result  # Set straight away on a cache hit
+
+    @property
+    def ffmpeg_args(self) -> list:
+        """Extra output for the conversion command (none on a cache hit)."""
+        return analysis_args(self.pcm_path) if self.pcm_path else []
+
+
+class Analyzer:
+    """Schedules BPM/key analysis next to the conversions of one batch."""
+
+    def __init__(self, workers: int = None):
+        if not HAS_NUMPY:
+            raise RuntimeError("NumPy is not installed (pip3 install --user numpy)")
+        if not hasattr(os, "mkfifo"):
+            raise RuntimeError("needs named pipes (macOS/Linux)")
+        self.cache = AnalysisCache()
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 2)
+        self.fifo_dir = Path(tempfile.mkdtemp(prefix="aiffmeplease-pcm-"))
+        self._count = 0
+        self._lock = threading.Lock()
+        self.analysed = 0
+
+    def start(self, job) -> PendingAnalysis:
+        """Look a job up in the cache, or set up the FIFO and worker for its conversion."""
+        key = None
+        if job.archive is None:
+            try:
+                key = f"v{ANALYSIS_VERSION}-{source_hash(job.source)}"
+            except OSError as e:
+                print(f"Could not hash {job.source.name} for the analysis cache: {e}")
+            if key:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return PendingAnalysis(key, result=cached)
+        pcm_path = self._fifo()
+        return PendingAnalysis(key, pcm_path, self.pool.submit(analyze_stream, str(pcm_path)))
+
+    def start_sheet(self, jobs: list) -> PendingAnalysis:
+        """start() for CUE tracks cut from one decode: one FIFO for the whole file, a result per track.
+
+        jobs are tracks of one sheet in file order; each is cached under its own span.
+        """
+        source = jobs[0].source
+        keys = None
+        try:
+            digest = source_hash(source)
+            keys = [f"v{ANALYSIS_VERSION}-{digest}-{job.cue.span}" for job in jobs]
+        except OSError as e:
+            print(f"Could not hash {source.name} for the analysis cache: {e}")
+        if keys:
+            cached = [self.cache.get(key) for key in keys]
+            if all(result is not None for result in cached):
+                return PendingAnalysis(keys, result=cached)
+        # The FIFO carries the source at ANALYSIS_RATE, cut points are 44.1 kHz samples
+        ratio = OUTPUT_SAMPLE_RATE // ANALYSIS_RATE
+        spans = [(job.cue.start_sample // ratio,
+                  job.cue.end_sample // ratio if job.cue.end_sample is not None else None) for job in jobs]
+        pcm_path = self._fifo()
+        return PendingAnalysis(keys, pcm_path, self.pool.submit(analyze_stream, str(pcm_path), spans))
+
+    def _fifo(self) -> Path:
+        """A new named pipe for ffmpeg's analysis output."""
+        with self._lock:
+            self._count += 1
+            pcm_path = self.fifo_dir / f"{self._count}.pcm"
+        os.mkfifo(str(pcm_path))
+        return pcm_path
+
+    def finish(self, pending: PendingAnalysis, converted: bool):
+        """Result for a finished conversion (a list per track from start_sheet), or None if
+        it failed or could not be analysed.
+
+        If ffmpeg died before opening the FIFO, the worker is still blocked
+        opening it - it is cancelled if it never started, or handed an
+        empty stream otherwise.
+        """
+        if pending.result is not None or pending.future is None:
+            return pending.result
+        future = pending.future
+        try:
+            while not future.done():
+                if future.cancel():
+                    break
+                try:
+                    fd = os.open(str(pending.pcm_path), os.O_WRONLY | os.O_NONBLOCK)
+                    os.close(fd)  # EOF for a reader still waiting in open()
+                    break
+                except OSError:
+                    time.sleep(0.01)  # No reader yet - the worker is just starting
+            if future.cancelled():
+                return None
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Analysis failed: {e}")
+                return None
+        finally:
+            try:
+                pending.pcm_path.unlink()
+            except OSError:
+                pass
+        if not converted:
+            return None
+        if isinstance(result, list):
+            with self._lock:
+                self.analysed += len(result)
+            for key, value in zip(pending.key or [], result):
+                self.cache.put(key, value)
+            return result
+        with self._lock:
+            self.analysed += 1
+        if pending.key:
+            self.cache.put(pending.key, result)
+        return result
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        self.cache.save()
+        shutil.rmtree(str(self.fifo_dir), ignore_errors=True)
@@ -0,0 +1,310 @@
+"""ZIP and TAR inputs: audio members are probed and converted without extracting to disk.
+
+ZIP members and members of uncompressed TARs can be opened anywhere. A
+compressed TAR can only be inflated from the start, though, so opening its
+members one by one would inflate everything before each member again. The
+header of every TAR member is cached after the first full read, and a
+MemberReader walks each compressed TAR once for a batch that reads many of
+its members, streaming them straight out of the archive.
+"""
+import tarfile
+import threading
+import zipfile
+from pathlib import Path
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+AUDIO_SUFFIXES = ('.flac', '.mp3')
+ARCHIVE_WORKERS = 4  # Members converted at once - inflating is cheap next to decoding
+
+_headers = {}  # TAR path -> ((size, mtime_ns), {member name: TarInfo})
+_headers_lock = threading.Lock()
+
+
+def is_archive(path: Path) -> bool:
+    """True for file names this module can open."""
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _tar_stamp(path: Path) -> tuple:
+    st = path.stat()
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _remember_headers(path: Path, infos: list) -> dict:
+    """Cache a TAR's member headers for later opens; returns {name: TarInfo}."""
+    headers = {info.name: info for info in infos}
+    with _headers_lock:
+        _headers[str(path)] = (_tar_stamp(path), headers)
+    return headers
+
+
+def _cached_headers(path: Path):
+    """{name: TarInfo} from the last full read of a TAR, or None if it changed since."""
+    with _headers_lock:
+        stamp, headers = _headers.get(str(path), (None, None))
+    return headers if stamp == _tar_stamp(path) else None
+
+
+def find_audio_inputs(folder: Path) -> list:
+    """FLAC and MP3 files in a folder tree, plus any ZIP/TAR archives holding them."""
+    files = list(folder.rglob("*.flac")) + list(folder.rglob("*.mp3"))
+    files += [p for p in folder.rglob("*") if p.is_file() and is_archive(p)]
+    return files
+
+
+class MemberFile:
+    """Read-only file object for one archive member; closing it closes the archive too."""
+
+    def __init__(self, archive, stream):
+        self._archive = archive
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self._stream.close()
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Archive:
+    """The FLAC/MP3 members of a ZIP or TAR file (compressed TARs too)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._zip = None
+        self._tar = None
+        if zipfile.is_zipfile(str(path)):
+            self._zip = zipfile.ZipFile(str(path))
+        else:
+            self._tar = tarfile.open(str(path), "r:*")
+
+    def members(self) -> list:
+        """Audio member names in archive order, skipping macOS resource forks."""
+        if self._zip:
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            infos = self._tar.getmembers()
+            _remember_headers(self.path, infos)
+            names = [info.name for info in infos if info.isfile()]
+        return [
+            name for name in names
+            if name.lower().endswith(AUDIO_SUFFIXES)
+            and not name.startswith("__MACOSX/")
+            and not Path(name).name.startswith("._")
+        ]
+
+    def open(self, member: str):
+        """Binary stream of a member, decompressed on the fly."""
+        if self._zip:
+            return self._zip.open(member)
+        # With the headers cached, tarfile seeks straight to the member instead of reading
+        # every header before it (which inflates the whole of a compressed TAR)
+        headers = _cached_headers(self.path)
+        if headers is None:
+            headers = _remember_headers(self.path, self._tar.getmembers())
+        stream = self._tar.extractfile(headers.get(member, member))
+        if stream is None:
+            raise KeyError(f"{member} is not a regular file in {self.path.name}")
+        return stream
+
+    def close(self) -> None:
+        if self._zip:
+            self._zip.close()
+        if self._tar:
+            self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_member(archive_path: Path, member: str) -> MemberFile:
+    """Open one member on its own archive handle - safe to use from several threads at once."""
+    archive = Archive(archive_path)
+    try:
+        return MemberFile(archive, archive.open(member))
+    except Exception:
+        archive.close()
+        raise
+
+
+def is_compressed_tar(path: Path) -> bool:
+    """True for gzip, bzip2 and xz TARs, which can only be read from the start."""
+    if zipfile.is_zipfile(str(path)):
+        return False
+    try:
+        with tarfile.open(str(path), "r:"):
+            return False
+    except tarfile.ReadError:
+        return True
+
+
+class TarWalk:
+    """One pass through a compressed TAR, handing out the members asked for as it reaches them.
+
+    A streamed TAR can only be read in order, one member at a time. Members
+    a worker has said it will open (expect) are handed out in archive order,
+    each once the one before it is closed; nothing is copied anywhere - the
+    stream comes straight out of the decompressor. A member asked for ahead
+    of ones nobody expects yet (promoted, say) is left to open_member, so
+    the walk doesn't skip past members still to come.
+    """
+
+    def __init__(self, path: Path, members: list):
+        self.path = path
+        # Archive order when the planner has read the headers, else the order given
+        headers = _cached_headers(path) or {}
+        position = {name: n for n, name in enumerate(headers)}
+        self.queue = sorted(dict.fromkeys(members), key=lambda name: position.get(name, len(position)))  # Not reached yet
+        self.expected = set()  # About to be opened
+        self.busy = False  # A member is out and not closed yet
+        self.turn = threading.Condition()
+        self._tar = None
+
+    def expect(self, member: str) -> None:
+        """A worker will open this member soon - members after it wait for it."""
+        with self.turn:
+            self.expected.add(member)
+
+    def forget(self, member: str) -> None:
+        """A member expected before won't be opened through the walk after all."""
+        with self.turn:
+            self.expected.discard(member)
+            if member in self.queue:
+                self.queue.remove(member)
+            self.turn.notify_all()
+
+    def take(self, member: str):
+        """Stream of a member, or None if the walk can't supply it (out of turn, passed, or missing)."""
+        with self.turn:
+            if member not in self.queue:
+                return None
+            if not self.expected.issuperset(self.queue[:self.queue.index(member)]):
+                self.queue.remove(member)  # Ahead of its turn - opened on its own
+                return None
+            self.turn.wait_for(lambda: member not in self.queue or (not self.busy and self.queue[0] == member))
+            self.expected.discard(member)
+            if member not in self.queue:
+                return None  # Closed while waiting
+            self.queue.pop(0)
+            stream = self._advance(member)
+            if stream is None:
+                self.turn.notify_all()
+                return None
+            self.busy = True
+            return WalkMember(self, stream)
+
+    def _advance(self, member: str):
+        """Read on to a member; its stream, or None if the archive ends first."""
+        if self._tar is None:
+            self._tar = tarfile.open(str(self.path), "r|*")
+        while True:
+            info = self._tar.next()
+            if info is None:
+                self.queue.clear()
+                return None
+            if info.isfile() and info.name == member:
+                return self._tar.extractfile(info)
+
+    def release(self) -> None:
+        """The member handed out last was closed - the next one can go."""
+        with self.turn:
+            self.busy = False
+            self.turn.notify_all()
+
+    def close(self) -> None:
+        with self.turn:
+            self.queue.clear()
+            self.turn.notify_all()
+            if self._tar is not None:
+                self._tar.close()
+
+
+class WalkMember:
+    """Read-only stream of the member a TarWalk handed out; closing it lets the walk go on."""
+
+    def __init__(self, walk, stream):
+        self._walk = walk
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def close(self) -> None:
+        if self._walk is not None:
+            self._walk.release()
+            self._walk = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemberReader:
+    """Opens the archive members a batch will read; each compressed TAR among them is walked once.
+
+    A walk streams the members of its TAR in archive order (see TarWalk);
+    a member it can't supply - asked for out of order, or read twice for a
+    retry - is opened on its own with open_member.
+    """
+
+    def __init__(self, members):
+        """members: (archive path, member name) pairs, in the order they will probably be read."""
+        by_archive = {}
+        for archive_path, member in members:
+            by_archive.setdefault(archive_path, []).append(member)
+        self._walks = {}
+        for archive_path, names in by_archive.items():
+            try:
+                if is_compressed_tar(archive_path):
+                    self._walks[archive_path] = TarWalk(archive_path, names)
+            except OSError:
+                pass  # Reported when the member itself can't be opened
+
+    def expect(self, archive_path: Path, member: str) -> None:
+        """Say a member will be opened soon, so its walk waits for it instead of passing it."""
+        walk = self._walks.get(archive_path)
+        if walk is not None:
+            walk.expect(member)
+
+    def forget(self, archive_path: Path, member: str) -> None:
+        """Drop an expected member that won't be opened (done, or failed before reading)."""
+        walk = self._walks.get(archive_path)
+        if walk is not None:
+            walk.forget(member)
+
+    def open(self, archive_path: Path, member: str):
+        """Binary file object of a member."""
+        walk = self._walks.get(archive_path)
+        stream = walk.take(member) if walk is not None else None
+        return stream if stream is not None else open_member(archive_path, member)
+
+    def close(self) -> None:
+        for walk in self._walks.values():
+            walk.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,196 @@
+"""Cover art extraction, resizing and embedding with a content-hashed cache."""
+import hashlib
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from mutagen.flac import FLAC
+from mutagen.mp3 import MP3
+from mutagen.aiff import AIFF
+from mutagen.id3 import APIC
+
+from app.core import CACHE_DIR, open_audio
+
+ARTWORK_SIZE = 500  # Max edge in pixels - small enough for every CDJ generation
+FRONT_COVER = 3  # ID3/FLAC picture type for the front cover
+
+
+def artwork_from_audio(audio):
+    """Return raw cover image bytes from an opened FLAC or MP3, or None.
+
+    Prefers the front cover, falls back to the first picture present.
+    """
+    if isinstance(audio, FLAC):
+        pictures = audio.pictures
+    elif isinstance(audio, MP3):
+        pictures = audio.tags.getall('APIC') if audio.tags else []
+    else:
+        return None
+
+    if not pictures:
+        return None
+    for picture in pictures:
+        if picture.type == FRONT_COVER:
+            return picture.data
+    return pictures[0].data
+
+
+def extract_artwork(file_path: Path):
+    """Return raw cover image bytes from a FLAC or MP3 file, or None."""
+    return artwork_from_audio(open_audio(file_path))
+
+
+def artwork_digest(data: bytes) -> str:
+    """Cache key for original image bytes."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def embed_artwork(output_path: Path, jpeg: bytes) -> None:
+    """Embed a JPEG as the front cover in the AIFF's ID3 chunk."""
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags.delall('APIC')
+    audio.tags.add(APIC(encoding=3, mime="image/jpeg", type=FRONT_COVER, desc="Cover", data=jpeg))
+    audio.save()
+
+
+class ArtworkCache:
+    """Resized cover art keyed by the SHA-1 of the original image bytes.
+
+    An album repeating the same 3 MB JPEG on every track is resized once;
+    every other track is a cache hit. Entries live on disk with their mtime
+    used as the LRU clock, and the most recent ones are also kept in memory
+    for the current batch. The disk cache is trimmed to max_bytes.
+
+    Conversion threads share one cache. Resizing runs outside its lock, and
+    threads asking for a cover that is already being resized wait for that
+    resize instead of starting their own.
+    """
+
+    def __init__(self, ffmpeg_path: str, cache_dir: Path = None,
+                 max_bytes: int = 200 * 1024 * 1024, memory_entries: int = 64):
+        """Open (and create) the cache directory and measure its size."""
+        self.ffmpeg_path = ffmpeg_path
+        self.cache_dir = cache_dir or CACHE_DIR / "artwork"
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # digest -> resized JPEG bytes
+        self._resizing = {}  # digest -> Event set when its resize is done
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size = sum(p.stat().st_size for p in self.cache_dir.glob("*.jpg"))
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served without resizing."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(self, digest: str):
+        """Return the cached JPEG for an image digest, or None - never resizes."""
+        with self._lock:
+            return self._lookup(digest)
+
+    def _lookup(self, digest: str):
+        """lookup() with the lock held."""
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            self.hits += 1
+            return self._memory[digest]
+
+        path = self.cache_dir / f"{digest}.jpg"
+        try:
+            jpeg = path.read_bytes()
+            os.utime(path)  # Touch for LRU
+        except OSError:
+            return None
+        self.hits += 1
+        self._remember(digest, jpeg)
+        return jpeg
+
+    def get(self, data: bytes):
+        """Return the resized JPEG for original image bytes, or None if resizing fails."""
+        digest = artwork_digest(data)
+        with self._lock:
+            jpeg = self._lookup(digest)
+            if jpeg:
+                return jpeg
+            pending = self._resizing.get(digest)
+            if pending is None:
+                self._resizing[digest] = threading.Event()
+        if pending is not None:
+            # Another thread is resizing this cover - use its result
+            pending.wait()
+            return self.lookup(digest)
+
+        try:
+            jpeg = self._resize(data)
+            if jpeg:
+                with self._lock:
+                    self.misses += 1
+                    self._store(self.cache_dir / f"{digest}.jpg", jpeg)
+                    self._remember(digest, jpeg)
+        finally:
+            with self._lock:
+                self._resizing.pop(digest).set()
+        return jpeg
+
+    def _remember(self, digest: str, jpeg: bytes) -> None:
+        """Keep an entry in the in-memory LRU."""
+        self._memory[digest] = jpeg
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _resize(self, data: bytes):
+        """Downscale an image to ARTWORK_SIZE with ffmpeg (Pillow is not used)."""
+        scale = (f"scale='min({ARTWORK_SIZE},iw)':'min({ARTWORK_SIZE},ih)'"
+                 f":force_original_aspect_ratio=decrease")
+        cmd = [
+            self.ffmpeg_path,
+            "-f", "image2pipe", "-i", "pipe:0",  # Source image on stdin (JPEG or PNG)
+            "-vf", scale,
+            "-frames:v", "1",
+            "-pix_fmt", "yuvj420p",              # Baseline JPEG, readable by older CDJs
+            "-q:v", "3",
+            "-f", "image2pipe", "-c:v", "mjpeg",
+            "pipe:1"
+        ]
+        try:
+            result = subprocess.run(cmd, input=data, capture_output=True, timeout=30)
+        except Exception as e:
+            print(f"Could not resize artwork: {e}")
+            return None
+        if result.returncode != 0 or not result.stdout:
+            return None
+        return result.stdout
+
+    def _store(self, path: Path, jpeg: bytes) -> None:
+        """Write an entry and evict least recently used entries over the size limit."""
+        try:
+            path.write_bytes(jpeg)
+            self._size += len(jpeg)
+        except OSError as e:
+            print(f"Could not cache artwork: {e}")
+            return
+
+        if self._size <= self.max_bytes:
+            return
+
+        entries = sorted(self.cache_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            if entry == path:
+                continue
+            try:
+                size = entry.stat().st_size
+                entry.unlink()
+                self._size -= size
+            except OSError:
+                pass
@@ -0,0 +1,149 @@
+"""Background mode: ffmpeg children at low CPU and I/O priority, adjustable while a batch runs.
+
+Three levers, all read live from one Throttle shared by the GUI and the runners:
+- priority: children start under nice (plus ionice on Linux, taskpolicy -b on
+  macOS); a child already running when background mode is switched on is reniced
+- CPU share: each child is paused with SIGSTOP/SIGCONT for the rest of every
+  DUTY_PERIOD, so it gets at most that fraction of a core
+- I/O cap: sources are fed through ffmpeg's stdin by a token bucket that also
+  charges the AIFF bytes each source will produce, capping reads plus writes
+"""
+import asyncio
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+
+BACKGROUND_NICE = 10
+DUTY_PERIOD = 0.1  # Seconds per run/pause cycle - short enough that playback never notices the bursts
+MIN_CPU_SHARE = 0.05
+
+
+class Throttle:
+    """Live background-mode settings; the GUI writes them, the conversion threads read them."""
+
+    def __init__(self, enabled: bool = False, cpu_share: float = 0.5, io_mbps: float = 0.0):
+        self.enabled = enabled
+        self.cpu_share = cpu_share  # Fraction of one core per ffmpeg process
+        self.io_mbps = io_mbps  # MB/s of disk traffic for all children together, 0 = no cap
+        self._io_lock = threading.Lock()
+        self._io_clock = None  # When the bytes granted so far will have been "paid" for
+
+    @property
+    def share(self) -> float:
+        """CPU share in force right now (1.0 when background mode is off)."""
+        if not self.enabled:
+            return 1.0
+        return min(1.0, max(MIN_CPU_SHARE, self.cpu_share))
+
+    @property
+    def io_limited(self) -> bool:
+        """True if sources should be fed through the I/O cap."""
+        return self.enabled and self.io_mbps > 0
+
+    def command_prefix(self) -> list:
+        """Wrapper that starts a child at low I/O priority (empty when off or unavailable)."""
+        if not self.enabled:
+            return []
+        if sys.platform == "darwin" and shutil.which("taskpolicy"):
+            return ["taskpolicy", "-b"]  # Background QoS: throttled CPU and disk
+        if sys.platform.startswith("linux") and shutil.which("ionice"):
+            return ["ionice", "-c", "2", "-n", "7"]  # Lowest best-effort I/O priority
+        return []
+
+    def preexec(self):
+        """Function run in the child before exec - lowers its CPU priority."""
+        if not self.enabled or not hasattr(os, "nice"):
+            return None
+        return lambda: os.nice(BACKGROUND_NICE)
+
+    def renice(self, pid: int) -> None:
+        """Lower a running child's priority (raising it back needs root, so that is left alone)."""
+        try:
+            if os.getpriority(os.PRIO_PROCESS, pid) < BACKGROUND_NICE:
+                os.setpriority(os.PRIO_PROCESS, pid, BACKGROUND_NICE)
+        except (AttributeError, OSError):
+            pass
+
+    async def govern(self, proc) -> None:
+        """Hold a running child to the CPU share by pausing it for part of every DUTY_PERIOD.
+
+        Returns as soon as the child exits, not at the end of the period.
+        """
+        if not hasattr(signal, "SIGSTOP"):
+            return
+        stopped = False
+        reniced = False
+        exited = asyncio.ensure_future(proc.wait())
+        try:
+            while not exited.done():
+                if self.enabled and not reniced:
+                    self.renice(proc.pid)
+                    reniced = True
+                share = self.share
+                if share >= 1.0:
+                    await asyncio.wait({exited}, timeout=DUTY_PERIOD)
+                    continue
+                await asyncio.wait({exited}, timeout=DUTY_PERIOD * share)
+                if exited.done():
+                    break
+                os.kill(proc.pid, signal.SIGSTOP)
+                stopped = True
+                await asyncio.wait({exited}, timeout=DUTY_PERIOD * (1.0 - share))
+                os.kill(proc.pid, signal.SIGCONT)
+                stopped = False
+        except ProcessLookupError:
+            pass
+        finally:
+            if not exited.done():
+                exited.cancel()
+            if stopped:
+                try:
+                    os.kill(proc.pid, signal.SIGCONT)
+                except ProcessLookupError:
+                    pass
+
+    async def throttle_io(self, nbytes: float) -> None:
+        """Wait until nbytes of disk traffic fit under io_mbps (shared by every child)."""
+        rate = self.io_mbps * 1024 * 1024 if self.io_limited else 0
+        if rate <= 0:
+            return
+        with self._io_lock:
+            now = time.monotonic()
+            if self._io_clock is None or self._io_clock < now:
+                self._io_clock = now
+            self._io_clock += nbytes / rate
+            delay = self._io_clock - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ModeStats:
+    """Audio seconds and encode seconds per mode, to report what background mode cost."""
+
+    def __init__(self):
+        self.audio = {False: 0.0, True: 0.0}
+        self.seconds = {False: 0.0, True: 0.0}
+
+    def add(self, background: bool, audio_seconds: float, wall_seconds: float) -> None:
+        self.audio[background] += audio_seconds
+        self.seconds[background] += wall_seconds
+
+    def rate(self, background: bool):
+        """Audio seconds per wall second in a mode, or None if nothing ran in it."""
+        if self.seconds[background] <= 0 or self.audio[background] <= 0:
+            return None
+        return self.audio[background] / self.seconds[background]
+
+    def summary(self, baseline=None) -> str:
+        """One line comparing background throughput with full speed ("" if background never ran)."""
+        slow = self.rate(True)
+        if slow is None:
+            return ""
+        full = self.rate(False) or baseline
+        text = f"Background mode: {slow:.0f}x realtime"
+        if full:
+            text += f" vs {full:.0f}x at full speed ({slow / full:.0%} of full throughput)"
+        return text
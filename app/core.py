@@ -0,0 +1,570 @@
+"""Conversion logic shared by the GUI and headless runners (no Tk here)."""
+import os
+import re
+import struct
+import subprocess
+from pathlib import Path
+
+from mutagen.flac import FLAC
+from mutagen.mp3 import MP3
+from mutagen.aiff import AIFF, AIFFFile
+from mutagen.id3 import TXXX, TIT2, TPE1, TALB, TPUB, TDRC, TRCK, TCON
+
+CACHE_DIR = Path.home() / ".cache" / "aiffmeplease"  # Artwork cache, output store, ...
+
+# Output format - must match build_ffmpeg_command
+OUTPUT_SAMPLE_RATE = 44100
+OUTPUT_FRAME_BYTES = 4  # 16-bit stereo
+AIFF_HEADER_BYTES = 54  # FORM + COMM + SSND headers as written by ffmpeg's aiff muxer
+
+# Short files share one ffmpeg process - for one-shots, spawn and init cost more than the encode
+GROUP_MAX_SECONDS = 10.0  # Files up to this long are grouped
+GROUP_SIZE = 32  # Files per ffmpeg process (override with AIFFMEPLEASE_GROUP_SIZE)
+
+# Metadata ffmpeg's aiff muxer copies into NAME/AUTH/(c) /ANNO chunks, by source tag.
+# A tuple lists the tags ffmpeg reads for one chunk, preferred first: FLAC comments
+# written by ffmpeg are stored as DESCRIPTION
+AIFF_META_FIELDS = {
+    'flac': ('title', 'author', 'copyright', ('comment', 'description')),
+    'mp3': ('TIT2', 'TCOP', 'COMM'),
+}
+
+
+# ID3 text frames written into every AIFF, by tag field - what Rekordbox and CDJs read
+ID3_TAG_FRAMES = {
+    'title': TIT2,
+    'artist': TPE1,
+    'album': TALB,
+    'label': TPUB,
+    'year': TDRC,
+    'tracknumber': TRCK,
+    'genre': TCON,
+}
+
+# AIFF text chunks a retag rewrites: (chunk, tag field, added when missing). ffmpeg
+# fills AUTH from a source "author" tag, which the artist stands in for
+AIFF_TEXT_CHUNKS = (
+    ('NAME', 'title', True),
+    ('AUTH', 'artist', False),
+)
+
+
+def sanitize_filename(filename: str) -> str:
+    """Sanitize filename - remove ALL non-ASCII and special characters.
+
+    CDJ-safe whitelist (ONLY these allowed):
+    - Basic ASCII letters: A-Z, a-z
+    - Numbers: 0-9
+    - Space
+    - Minimal safe punctuation: - _ ( )
+
+    Everything else is REMOVED:
+    - Emojis (🕊️, etc.)
+    - Accented characters (é, ä, ø, etc.)
+    - Fancy Unicode (𝓶, etc.)
+    - All special symbols: [ ] { } , . ' + & / \ : * ? " < > | % #
+    - Control characters
+    """
+    if not filename:
+        return "Unknown"
+
+    # Strict whitelist: ONLY ASCII letters, numbers, space, and: - _ ( )
+    sanitized = ""
+    for char in filename:
+        # Check if character is basic ASCII letter (A-Z, a-z)
+        if ('A' <= char <= 'Z') or ('a' <= char <= 'z'):
+            sanitized += char
+        # Check if character is number (0-9)
+        elif '0' <= char <= '9':
+            sanitized += char
+        # Allow space
+        elif char == ' ':
+            sanitized += ' '
+        # Allow only these safe punctuation marks
+        elif char in "-_()":
+            sanitized += char
+        # EVERYTHING ELSE IS REMOVED (emojis, Unicode, special chars, etc.)
+
+    # Collapse multiple spaces into single space
+    sanitized = re.sub(r'\s+', ' ', sanitized)
+
+    # Trim spaces at start and end
+    sanitized = sanitized.strip()
+
+    # Remove trailing dots, spaces, dashes, underscores
+    sanitized = sanitized.rstrip('. -_')
+
+    # Ensure it doesn't start with a dot, dash, or underscore
+    sanitized = sanitized.lstrip('.-_')
+
+    # Remove any remaining problematic patterns
+    # Remove multiple dashes/underscores
+    sanitized = re.sub(r'[-_]{2,}', '-', sanitized)
+
+    # If empty after sanitization, use fallback
+    if not sanitized:
+        sanitized = "Unknown"
+
+    # Final check: ensure no forbidden characters remain
+    # This is a safety check - should already be clean
+    final = ""
+    for char in sanitized:
+        if (('A' <= char <= 'Z') or ('a' <= char <= 'z') or 
+            ('0' <= char <= '9') or char == ' ' or char in "-_()"):
+            final += char
+    sanitized = final.strip() or "Unknown"
+
+    return sanitized
+
+
+def open_audio(file_path: Path, fileobj=None):
+    """Open a FLAC or MP3 file with mutagen (None for other types).
+
+    fileobj, if given, is read instead of file_path (archive members); the
+    path's suffix still decides the type.
+    """
+    source = fileobj if fileobj is not None else str(file_path)
+    if file_path.suffix.lower() == '.flac':
+        return FLAC(source)
+    elif file_path.suffix.lower() == '.mp3':
+        return MP3(source)
+    return None
+
+
+def tags_from_audio(audio) -> dict:
+    """Extract the common tag fields from an opened mutagen file."""
+    tags = {}
+
+    # Common tag fields
+    tag_fields = {
+        'artist': ['artist', 'ARTIST', 'TPE1'],
+        'title': ['title', 'TITLE', 'TIT2'],
+        'album': ['album', 'ALBUM', 'TALB'],
+        'label': ['label', 'LABEL', 'TPUB', 'organization', 'ORGANIZATION'],
+        'year': ['year', 'YEAR', 'date', 'DATE', 'TDRC'],
+        'tracknumber': ['tracknumber', 'TRACKNUMBER', 'TRACK', 'TRCK'],
+        'genre': ['genre', 'GENRE', 'TCON'],
+    }
+
+    for key, possible_fields in tag_fields.items():
+        for field in possible_fields:
+            if field in audio:
+                value = audio[field]
+                if isinstance(value, list) and value:
+                    tags[key] = str(value[0]).strip()
+                    break
+            # Try lowercase
+            field_lower = field.lower()
+            for tag_key in audio.keys():
+                if tag_key.lower() == field_lower:
+                    value = audio[tag_key]
+                    if isinstance(value, list) and value:
+                        tags[key] = str(value[0]).strip()
+                        break
+            if key in tags:
+                break
+
+    return tags
+
+
+def get_tags_from_file(file_path: Path) -> dict:
+    """Extract tags from audio file."""
+    tags = {}
+    try:
+        audio = open_audio(file_path)
+        if audio is not None:
+            tags = tags_from_audio(audio)
+    except Exception:
+        pass
+
+    return tags
+
+
+def get_duration(file_path: Path) -> float:
+    """Read audio duration in seconds from the file header (0.0 if unknown)."""
+    try:
+        audio = open_audio(file_path)
+        if audio is not None:
+            return audio.info.length
+    except Exception:
+        pass
+    return 0.0
+
+
+def mp3_gapless_samples(file_path: Path, frame_offset: int, fileobj=None):
+    """Exact sample count from the Xing/Info + LAME header, or None if there is none.
+
+    ffmpeg trims the encoder delay and padding recorded there, so this is the
+    length the conversion will actually produce.
+    """
+    if fileobj is not None:
+        fileobj.seek(frame_offset)
+        frame = fileobj.read(512)
+    else:
+        with open(file_path, "rb") as f:
+            f.seek(frame_offset)
+            frame = f.read(512)
+    if len(frame) < 4:
+        return None
+
+    header = struct.unpack(">I", frame[:4])[0]
+    mpeg1 = (header >> 19) & 3 == 3
+    mono = (header >> 6) & 3 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    samples_per_frame = 1152 if mpeg1 else 576
+
+    xing = frame[4 + side_info:]
+    if xing[:4] not in (b"Xing", b"Info"):
+        return None
+    flags = struct.unpack(">I", xing[4:8])[0]
+    if not flags & 1:
+        return None
+    frames = struct.unpack(">I", xing[8:12])[0]
+
+    # Skip byte count, TOC and quality to reach the LAME extension
+    offset = 12 + (4 if flags & 2 else 0) + (100 if flags & 4 else 0) + (4 if flags & 8 else 0)
+    lame = xing[offset:offset + 24]
+    if len(lame) < 24:
+        return frames * samples_per_frame
+    delay = (lame[21] << 4) | (lame[22] >> 4)
+    padding = ((lame[22] & 0x0F) << 8) | lame[23]
+    return max(0, frames * samples_per_frame - delay - padding)
+
+
+def source_total_samples(file_path: Path, audio, fileobj=None) -> int:
+    """Number of samples per channel in the source."""
+    info = audio.info
+    if isinstance(audio, FLAC) and info.total_samples:
+        return info.total_samples
+    if isinstance(audio, MP3):
+        try:
+            samples = mp3_gapless_samples(file_path, getattr(info, 'frame_offset', 0), fileobj)
+            if samples is not None:
+                return samples
+        except (OSError, struct.error):
+            pass
+    return int(round(info.length * getattr(info, 'sample_rate', 0)))
+
+
+def aiff_meta_bytes(audio) -> int:
+    """Bytes of the text chunks ffmpeg will copy into the AIFF from the source metadata."""
+    fields = AIFF_META_FIELDS['flac' if isinstance(audio, FLAC) else 'mp3']
+    tags = audio.tags
+    if not tags:
+        return 0
+
+    total = 0
+    for field in fields:
+        names = field if isinstance(field, tuple) else (field,)
+        values = []
+        for name in names:
+            values = [v for k, v in tags.items() if k.split(':')[0].lower() == name.lower()]
+            if values:
+                break
+        if not values:
+            continue
+        value = values[0]
+        text = value[0] if isinstance(value, list) else str(value)
+        size = len(str(text).encode("utf-8"))
+        total += 8 + size + (size & 1)  # Chunk header, text, pad byte
+    return total
+
+
+def projected_output_bytes(total_samples: int, sample_rate: int, meta_bytes: int = 0) -> int:
+    """Size of the AIFF ffmpeg writes: exact for 44.1 kHz sources, within a few samples when resampled."""
+    if not sample_rate:
+        return 0
+    frames = int(round(total_samples * OUTPUT_SAMPLE_RATE / sample_rate))
+    return AIFF_HEADER_BYTES + meta_bytes + frames * OUTPUT_FRAME_BYTES
+
+
+def build_filename_from_tags(file_path: Path, tags: dict) -> str:
+    """Build filename from tags using template: Artist - Title."""
+    artist = tags.get('artist', '').strip()
+    title = tags.get('title', '').strip()
+
+    # Fallback to original filename if tags missing
+    if not artist and not title:
+        return file_path.stem
+
+    # Build filename: "Artist - Title"
+    if artist and title:
+        filename = f"{artist} - {title}"
+    elif artist:
+        filename = artist
+    elif title:
+        filename = title
+    else:
+        filename = file_path.stem
+
+    # Sanitize the filename
+    filename = sanitize_filename(filename)
+
+    return filename
+
+
+def find_ffmpeg() -> str:
+    """Find ffmpeg binary."""
+    # Try common locations first
+    common_paths = [
+        "/opt/homebrew/bin/ffmpeg",  # Apple Silicon Homebrew
+        "/usr/local/bin/ffmpeg",     # Intel Homebrew
+        "/usr/bin/ffmpeg",           # System
+    ]
+
+    for path in common_paths:
+        if Path(path).exists():
+            return path
+
+    # Try system PATH
+    try:
+        result = subprocess.run(["which", "ffmpeg"], capture_output=True, check=True, timeout=2)
+        path = result.stdout.decode().strip()
+        if path:
+            return path
+    except:
+        pass
+
+    # Try bundled location
+    script_dir = Path(__file__).parent.parent
+    bundled = script_dir / "resources" / "ffmpeg" / "ffmpeg"
+    if bundled.exists():
+        return str(bundled)
+
+    return "ffmpeg"  # Fallback
+
+
+def unique_output_path(output_dir: Path, clean_name: str, reserve: bool = False) -> Path:
+    """Return output_dir/clean_name.aiff, numbered "(1)", "(2)"... if it already exists.
+
+    With reserve=True the name is claimed atomically by creating an empty file,
+    so several processes writing into the same folder never pick the same name.
+    """
+    output_path = output_dir / f"{clean_name}.aiff"
+
+    # Handle collisions - sanitize the collision number too
+    counter = 1
+    while True:
+        if reserve:
+            try:
+                os.close(os.open(str(output_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return output_path
+            except FileExistsError:
+                pass
+        elif not output_path.exists():
+            return output_path
+        collision_name = sanitize_filename(f"{clean_name} ({counter})")
+        output_path = output_dir / f"{collision_name}.aiff"
+        counter += 1
+
+
+def conversion_profile(options: dict) -> str:
+    """Name for everything that decides an output's bytes (format plus added tags)."""
+    profile = "aiff-s16be-44100-2"
+    if options.get('analyze_loudness'):
+        profile += "-r128"
+    if options.get('embed_artwork'):
+        profile += "-art"
+    if options.get('analyze_bpm_key'):
+        profile += "-bpmkey"
+    return profile
+
+
+def build_ffmpeg_command(ffmpeg_path: str, audio_path: Path, output_path: Path,
+                         analyze_loudness: bool = False, from_stdin: bool = False) -> list:
+    """Build the ffmpeg command for one file -> AIFF conversion.
+
+    With from_stdin the source bytes are piped in (archive members) and
+    audio_path only names the input format.
+    """
+    # Convert with ffmpeg (16-bit, 44.1kHz, stereo)
+    # Use 16-bit for maximum compatibility (CDJ standard)
+    # Preserve all metadata
+    if from_stdin:
+        input_args = ["-f", audio_path.suffix.lower().lstrip("."), "-i", "pipe:0"]
+    else:
+        input_args = ["-i", str(audio_path)]
+    cmd = [ffmpeg_path] + input_args
+
+    # Loudness analysis rides along on the same decode - no second pass.
+    # ebur128 measures a branch of the decoded audio that ends in anullsink, so
+    # the converted audio never goes through it: ffmpeg builds that only accept
+    # 48 kHz would otherwise resample a 44.1 kHz file to 48 kHz and back.
+    # framelog=verbose keeps the per-frame lines out of stderr, only the summary is logged
+    if analyze_loudness:
+        cmd += ["-filter_complex", "[0:a]asplit[out][loudness];[loudness]ebur128=peak=true:framelog=verbose,anullsink"]
+        audio_map = "[out]"
+    else:
+        audio_map = "0:a"
+
+    cmd += [
+        "-ar", "44100",              # 44.1kHz sample rate
+        "-ac", "2",                  # Stereo
+        "-c:a", "pcm_s16be",         # 16-bit PCM big-endian (AIFF format, CDJ compatible)
+        "-map_metadata", "0",         # Copy all metadata from input
+        "-map", audio_map,           # Map all audio streams (the unmeasured branch when loudness is on)
+        "-f", "aiff",                # AIFF format
+        "-y",                        # Overwrite if exists
+        str(output_path)
+    ]
+    return cmd
+
+
+def build_group_command(ffmpeg_path: str, pairs: list) -> list:
+    """Build one ffmpeg command converting several files: input N is written to output N.
+
+    pairs is a list of (audio_path, output_path). Each output gets the same
+    settings as build_ffmpeg_command, with the metadata of its own input.
+    """
+    cmd = [ffmpeg_path, "-y"]
+    for audio_path, _ in pairs:
+        cmd += ["-i", str(audio_path)]
+    for index, (_, output_path) in enumerate(pairs):
+        cmd += [
+            "-map", f"{index}:a",
+            "-map_metadata", str(index),
+            "-ar", "44100",
+            "-ac", "2",
+            "-c:a", "pcm_s16be",
+            "-f", "aiff",
+            str(output_path)
+        ]
+    return cmd
+
+
+def parse_loudness(stderr: str, meter: str = None) -> dict:
+    """Parse the ebur128 filter summary from ffmpeg stderr.
+
+    Returns dict with 'integrated' (LUFS), 'lra' (LU) and 'true_peak' (dBFS),
+    or an empty dict if no summary was found. meter picks the summary of
+    one named filter instance ("ebur128@name") when a run has several.
+    """
+    if not stderr:
+        return {}
+
+    # Only look at the final summary block, never the per-frame log lines
+    if meter:
+        start = stderr.rfind(f"[{meter} @")
+        start = stderr.find("Summary:", start) if start != -1 else -1
+    else:
+        start = stderr.rfind("Summary:")
+    if start == -1:
+        return {}
+    summary = stderr[start:]
+    if meter:
+        end = summary.find("\n[")  # The next instance's summary, or ffmpeg's closing lines
+        summary = summary if end == -1 else summary[:end]
+
+    patterns = {
+        'integrated': r"I:\s+(-?[\d.]+|-inf)\s+LUFS",
+        'lra': r"LRA:\s+(-?[\d.]+)\s+LU",
+        'true_peak': r"Peak:\s+(-?[\d.]+|-inf)\s+dBFS",
+    }
+
+    loudness = {}
+    for key, pattern in patterns.items():
+        match = re.search(pattern, summary)
+        if match:
+            loudness[key] = float(match.group(1))
+
+    # Integrated loudness is the one value everything else depends on
+    if 'integrated' not in loudness:
+        return {}
+    return loudness
+
+
+def write_loudness_tags(output_path: Path, loudness: dict) -> None:
+    """Write ReplayGain 2.0 tags (reference -18 LUFS) into the AIFF ID3 chunk."""
+    integrated = loudness.get('integrated', float('-inf'))
+    if integrated == float('-inf'):
+        return  # Silent track - no meaningful gain
+
+    gain = -18.0 - integrated
+    true_peak = loudness.get('true_peak', float('-inf'))
+    peak = 10 ** (true_peak / 20.0) if true_peak != float('-inf') else 0.0
+
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags.add(TXXX(encoding=3, desc="REPLAYGAIN_TRACK_GAIN", text=[f"{gain:.2f} dB"]))
+    audio.tags.add(TXXX(encoding=3, desc="REPLAYGAIN_TRACK_PEAK", text=[f"{peak:.6f}"]))
+    audio.save()
+
+
+def _id3_text(tags, frame) -> list:
+    """Text values of one ID3 frame type, as strings."""
+    return [str(text) for f in tags.getall(frame.__name__) for text in f.text]
+
+
+def id3_tags_match(output_path: Path, tags: dict) -> bool:
+    """True if the AIFF's ID3 text frames already hold exactly these tags."""
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        return not any(tags.get(field) for field in ID3_TAG_FRAMES)
+    return all(_id3_text(audio.tags, frame) == ([tags[field]] if tags.get(field) else [])
+               for field, frame in ID3_TAG_FRAMES.items())
+
+
+def _aiff_text_edits(aiff, tags: dict) -> list:
+    """(chunk id, new text) for each NAME/AUTH chunk that differs from tags; b"" removes it."""
+    edits = []
+    for chunk_id, field, add in AIFF_TEXT_CHUNKS:
+        text = tags.get(field, '').encode("utf-8")
+        if chunk_id in aiff:
+            if aiff[chunk_id].read().rstrip(b"\0") != text:
+                edits.append((chunk_id, text))
+        elif text and add:
+            edits.append((chunk_id, text))
+    return edits
+
+
+def aiff_text_chunks_match(output_path: Path, tags: dict) -> bool:
+    """True if the AIFF's NAME/AUTH text chunks already hold these tags."""
+    with open(output_path, "rb") as f:
+        return not _aiff_text_edits(AIFFFile(f), tags)
+
+
+def write_aiff_text_chunks(output_path: Path, tags: dict) -> bool:
+    """Set the AIFF's NAME/AUTH text chunks to tags (chunks whose field is empty are removed).
+
+    ffmpeg writes them from the source metadata, and players that read them
+    rather than the ID3 chunk would keep showing the old values after a
+    retag. Returns True if the file changed.
+    """
+    with open(output_path, "r+b") as f:
+        aiff = AIFFFile(f)
+        edits = _aiff_text_edits(aiff, tags)
+        for chunk_id, text in edits:
+            if chunk_id not in aiff:
+                aiff.insert_chunk(chunk_id, text)
+            elif text:
+                aiff[chunk_id].resize(len(text))
+                aiff[chunk_id].write(text)
+            else:
+                del aiff[chunk_id]
+    return bool(edits)
+
+
+def write_id3_tags(output_path: Path, tags: dict) -> bool:
+    """Set the AIFF's ID3 text frames to tags (fields missing from tags are removed).
+
+    Other frames (ReplayGain, BPM/key, cover) are kept. The file is only
+    saved if something differs; returns True if it was.
+    """
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        audio.add_tags()
+    changed = False
+    for field, frame in ID3_TAG_FRAMES.items():
+        value = tags.get(field, '')
+        current = _id3_text(audio.tags, frame)
+        if value:
+            if current != [value]:
+                audio.tags.setall(frame.__name__, [frame(encoding=3, text=[value])])
+                changed = True
+        elif current:
+            audio.tags.delall(frame.__name__)
+            changed = True
+    if changed:
+        audio.save()
+    return changed
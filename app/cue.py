@@ -0,0 +1,240 @@
+"""CUE sheets: split a long mix or album file into per-track AIFFs from a single decode.
+
+A .cue next to a FLAC/MP3 that names it in a FILE line turns that file into
+one job per TRACK. The whole sheet is converted by one ffmpeg run: the
+source is decoded and resampled once, split, and each branch is trimmed to
+its track with atrim - sample-accurate, so the tracks join back seamlessly.
+"""
+import re
+from pathlib import Path
+
+from app.core import OUTPUT_SAMPLE_RATE
+
+CUE_FPS = 75  # CD frames per second in INDEX times
+SAMPLES_PER_FRAME = OUTPUT_SAMPLE_RATE // CUE_FPS  # 588 - cut points are exact after resampling
+CUE_ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")  # Most sheets are UTF-8 or Windows-1252
+
+_LINE = re.compile(r'^\s*(\S+)\s*(.*?)\s*$')
+_TIME = re.compile(r'^(\d+):(\d{1,2}):(\d{1,2})$')
+
+
+def _unquote(value: str) -> str:
+    """A CUE value without its surrounding quotes."""
+    if value.startswith('"'):
+        end = value.rfind('"')
+        return value[1:end] if end > 0 else value[1:]
+    return value
+
+
+def _parse_time(value: str):
+    """MM:SS:FF as CD frames, or None."""
+    match = _TIME.match(value)
+    if not match:
+        return None
+    minutes, seconds, frames = (int(part) for part in match.groups())
+    return (minutes * 60 + seconds) * CUE_FPS + frames
+
+
+class CueTrack:
+    """One TRACK of a sheet; start and end are CD frames (end None = to the end of the file)."""
+
+    def __init__(self, sheet: "CueSheet", number: int):
+        self.sheet = sheet
+        self.number = number
+        self.title = ""
+        self.performer = ""
+        self.start = None  # INDEX 01
+        self.end = None  # Next track's INDEX 01 - its pregap stays with this track
+
+    @property
+    def start_sample(self) -> int:
+        """First output sample (44.1 kHz) of the track."""
+        return self.start * SAMPLES_PER_FRAME
+
+    @property
+    def end_sample(self):
+        """Output sample the track stops before, or None for the last track."""
+        return self.end * SAMPLES_PER_FRAME if self.end is not None else None
+
+    @property
+    def span(self) -> str:
+        """Identifies the cut - part of the output store key, so each track is stored on its own."""
+        return f"cue{self.start}-{self.end if self.end is not None else 'end'}"
+
+    def tags(self, file_tags: dict) -> dict:
+        """Tags for the track: the file's own (label, genre, ...) overridden by the sheet's."""
+        tags = dict(file_tags)
+        artist = self.performer or self.sheet.performer
+        if artist:
+            tags['artist'] = artist
+        if self.title:
+            tags['title'] = self.title
+        else:
+            tags.pop('title', None)
+        if self.sheet.title:
+            tags['album'] = self.sheet.title
+        if self.sheet.genre:
+            tags['genre'] = self.sheet.genre
+        if self.sheet.date:
+            tags['year'] = self.sheet.date
+        tags['tracknumber'] = str(self.number)
+        return tags
+
+
+class CueSheet:
+    """The tracks a .cue sheet cuts from one audio file."""
+
+    def __init__(self, path: Path, audio_path: Path):
+        self.path = path
+        self.audio_path = audio_path
+        self.performer = ""
+        self.title = ""
+        self.genre = ""
+        self.date = ""
+        self.tracks = []
+
+
+def _read_text(path: Path) -> str:
+    data = path.read_bytes()
+    for encoding in CUE_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1", "replace")
+
+
+def _names_audio(name: str, audio_path: Path) -> bool:
+    """True if a FILE line refers to audio_path - by name, or by stem for sheets written for a WAV/APE rip."""
+    referenced = Path(name.replace("\\", "/")).name.lower()
+    return referenced == audio_path.name.lower() or Path(referenced).stem == audio_path.stem.lower()
+
+
+def parse_cue(path: Path, audio_path: Path):
+    """The sheet's tracks for audio_path, or None if the sheet doesn't cover that file.
+
+    Sheets listing several files (one per track) only contribute the tracks
+    of the FILE block naming audio_path.
+    """
+    sheet = CueSheet(path, audio_path)
+    in_file = False
+    track = None
+    for line in _read_text(path).splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        keyword, value = match.group(1).upper(), match.group(2)
+        if keyword == "FILE":
+            # Drop the trailing file type (WAVE, MP3, ...)
+            name = value.rsplit(None, 1)[0] if not value.endswith('"') else value
+            in_file = _names_audio(_unquote(name), audio_path)
+            track = None
+        elif keyword == "TRACK":
+            track = None
+            if in_file:
+                number = value.split()[0] if value.split() else ""
+                if number.isdigit():
+                    track = CueTrack(sheet, int(number))
+                    sheet.tracks.append(track)
+        elif keyword == "INDEX" and track is not None:
+            parts = value.split()
+            if len(parts) == 2 and parts[0] in ("01", "1"):
+                track.start = _parse_time(parts[1])
+        elif keyword in ("TITLE", "PERFORMER"):
+            field = 'title' if keyword == "TITLE" else 'performer'
+            setattr(track if track is not None else sheet, field, _unquote(value).strip())
+        elif keyword == "REM" and track is None:
+            rem_key, _, rem_value = value.partition(" ")
+            if rem_key.upper() == "GENRE":
+                sheet.genre = _unquote(rem_value.strip())
+            elif rem_key.upper() == "DATE":
+                sheet.date = _unquote(rem_value.strip())
+
+    sheet.tracks = sorted((t for t in sheet.tracks if t.start is not None), key=lambda t: t.start)
+    if not sheet.tracks:
+        return None
+    for track, following in zip(sheet.tracks, sheet.tracks[1:]):
+        track.end = following.start
+    # Two tracks starting at the same frame would cut an empty file
+    sheet.tracks = [t for t in sheet.tracks if t.end is None or t.end > t.start]
+    return sheet
+
+
+def find_cue_sheet(audio_path: Path, listing: dict = None):
+    """The CUE sheet splitting audio_path, or None.
+
+    listing caches {folder: [.cue paths]} across calls, so a folder of
+    thousands of files is listed once. A single-track sheet isn't a split
+    and is ignored.
+    """
+    folder = audio_path.parent
+    if listing is None:
+        listing = {}
+    cues = listing.get(folder)
+    if cues is None:
+        try:
+            cues = sorted(p for p in folder.iterdir() if p.suffix.lower() == ".cue" and p.is_file())
+        except OSError:
+            cues = []
+        listing[folder] = cues
+    if not cues:
+        return None
+
+    # Same name as the audio first, then any sheet in the folder that names it
+    same_stem = [p for p in cues if p.stem.lower() == audio_path.stem.lower()]
+    for cue_path in same_stem + [p for p in cues if p not in same_stem]:
+        try:
+            sheet = parse_cue(cue_path, audio_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not read CUE sheet {cue_path.name}: {e}")
+            continue
+        if sheet and len(sheet.tracks) > 1:
+            return sheet
+    return None
+
+
+def track_meter(index: int) -> str:
+    """Name of the ebur128 instance measuring the index-th cut of a CUE command."""
+    return f"ebur128@track{index}"
+
+
+def build_cue_command(ffmpeg_path: str, audio_path: Path, cuts: list, tag_sets: list,
+                      analyze_loudness: bool = False) -> list:
+    """Build one ffmpeg command cutting tracks from a single decode of audio_path.
+
+    cuts is a list of (CueTrack, output_path); tag_sets holds each output's
+    tags. The source is resampled to 44.1 kHz before the split, so every cut
+    lands on an exact sample and the tracks join without a gap or overlap.
+    Timestamps are left as they are, so ffmpeg's progress is the position in
+    the whole file. With analyze_loudness each cut is split once more and
+    measured by its own ebur128 instance, named by track_meter().
+    """
+    branches = "".join(f"[s{index}]" for index in range(len(cuts)))
+    graph = [f"[0:a]aresample={OUTPUT_SAMPLE_RATE},asplit={len(cuts)}{branches}"]
+    for index, (track, _) in enumerate(cuts):
+        trim = f"atrim=start_sample={track.start_sample}"
+        if track.end_sample is not None:
+            trim += f":end_sample={track.end_sample}"
+        if analyze_loudness:
+            graph.append(f"[s{index}]{trim},asplit[t{index}][m{index}]")
+            graph.append(f"[m{index}]{track_meter(index)}=peak=true:framelog=verbose,anullsink")
+        else:
+            graph.append(f"[s{index}]{trim}[t{index}]")
+
+    cmd = [ffmpeg_path, "-y", "-i", str(audio_path), "-filter_complex", ";".join(graph)]
+    for index, ((_, output_path), tags) in enumerate(zip(cuts, tag_sets)):
+        # The file's own metadata, with the track's on top - an empty value clears
+        # the mix's title rather than repeating it on every track
+        cmd += ["-map", f"[t{index}]", "-map_metadata", "0"]
+        for key, field in (('artist', 'artist'), ('title', 'title'), ('tracknumber', 'track')):
+            cmd += ["-metadata", f"{field}={tags.get(key, '')}"]
+        for key, field in (('album', 'album'), ('genre', 'genre'), ('year', 'date')):
+            if tags.get(key):
+                cmd += ["-metadata", f"{field}={tags[key]}"]
+        cmd += [
+            "-ac", "2",
+            "-c:a", "pcm_s16be",
+            "-f", "aiff",
+            str(output_path)
+        ]
+    return cmd
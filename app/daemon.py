@@ -0,0 +1,558 @@
+"""Conversion daemon: one local service owning the job queue and the worker budget.
+
+Every GUI window and script used to run its own conversion loop, so two of
+them at once ran twice the ffmpeg processes the machine has cores for. A
+running daemon takes all batches instead, over a Unix socket. It queues
+them and converts one batch at a time, with the same pipeline as the GUI
+(app.pipeline, no Tk needed), so the machine runs at the pipeline's
+concurrency however many clients submit work. Clients send the jobs they
+planned, probe results included, so no source is read twice. They subscribe
+to a batch's status events and can cancel (or promote) jobs that haven't
+started.
+
+The protocol is one JSON object per line. A client sends one request per
+connection and gets one reply, or a stream of events for "watch" (and
+"submit" with watch set).
+
+Usage:
+    python -m app.daemon serve [--socket PATH] [--ffmpeg PATH] [--background]
+                               [--event-log PATH] [--metrics-port PORT]
+    python -m app.daemon submit OUTPUT_DIR INPUT... [--wait] [--loudness] [--no-artwork] ...
+    python -m app.daemon status
+    python -m app.daemon watch BATCH
+    python -m app.daemon cancel BATCH [SOURCE...]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+
+from app.core import find_ffmpeg
+from app.archive import find_audio_inputs
+from app.background import Throttle
+from app.layout import OutputLayout, LAYOUTS
+from app.lossy import LOSSY_MODES
+from app.locality import disk_order
+from app.pipeline import ConversionBatch, BatchEvents
+from app.plan import ConversionPlan, Job
+from app.telemetry import Telemetry
+from app.daemon_client import DaemonClient, socket_path, options_from_wire, send_line
+
+FINISHED_KEPT = 50  # Finished batches still answered for by status/watch
+SUBSCRIBER_BACKLOG = 1000  # Events waiting for a slow subscriber before its progress events are dropped
+
+
+class _BatchHost(BatchEvents):
+    """One daemon batch's pipeline events, published to the batch's subscribers."""
+
+    def __init__(self, service: "ConversionService", batch: dict):
+        self.service = service
+        self.batch = batch
+        self.conversion = None  # Its ConversionBatch, once it runs
+
+    def publish(self, event: dict) -> None:
+        self.service.publish(dict(event, batch=self.batch['id']))
+
+    def status(self, job, text: str) -> None:
+        job.status = text
+        self.batch['jobs'][job.key] = text
+        self.publish({'event': "status", 'job': job.key, 'status': text})
+
+    def progress(self, job, index: int, total: int, percent: int, eta: str) -> None:
+        self.publish({'event': "progress", 'job': job.key, 'index': index, 'total': total,
+                      'percent': percent, 'eta': eta})
+
+    def message(self, text: str) -> None:
+        self.publish({'event': "message", 'text': text})
+
+    def log(self, text: str) -> None:
+        print(f"Batch {self.batch['id']}: {text}")
+        self.publish({'event': "log", 'text': text})
+
+    def complete(self, converted: int, failed: int, total: int, note: str = "") -> None:
+        self.batch['result'] = {'converted': converted, 'failed': failed, 'total': total, 'note': note}
+
+    def pending_jobs(self, keys) -> list:
+        """This batch's jobs for keys (all of them for None)."""
+        jobs = self.batch['planned']
+        if keys is None:
+            return list(jobs)
+        keys = set(keys)
+        return [job for job in jobs if job.key in keys]
+
+
+class ConversionService:
+    """Queued batches, the one running batch and the subscribers to their events."""
+
+    def __init__(self, ffmpeg_path: str = None, telemetry: Telemetry = None, throttle: Throttle = None):
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        self.telemetry = telemetry or Telemetry()
+        self.throttle = throttle or Throttle()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.batches = {}  # id -> batch dict
+        self.queue = deque()  # Batch ids waiting to run
+        self.finished = deque()  # Finished batch ids, oldest first
+        self.host = None  # _BatchHost of the running batch
+        self.subscribers = []  # Subscriptions, see subscribe()
+        self.next_id = 1
+        self.stopping = False
+
+    # Subscriptions
+    def subscribe(self, batch_id=None) -> dict:
+        """A subscription to one batch's events (or every event, for None).
+
+        Its 'events' fill up until read; 'ready' is notified for each one.
+        """
+        subscription = {'batch': batch_id, 'events': deque(), 'ready': threading.Condition()}
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def publish(self, event: dict) -> None:
+        """Hand an event to every subscriber of its batch."""
+        with self.lock:
+            subscribers = [s for s in self.subscribers if s['batch'] in (None, event.get('batch'))]
+        for subscription in subscribers:
+            with subscription['ready']:
+                # A stalled reader misses progress updates, never a status change
+                if event['event'] == "progress" and len(subscription['events']) >= SUBSCRIBER_BACKLOG:
+                    continue
+                subscription['events'].append(event)
+                subscription['ready'].notify()
+
+    # Requests
+    def submit(self, jobs: list, output_dir: str, options: dict = None, subscription: dict = None) -> dict:
+        """Queue a batch of jobs a client planned (Job.to_wire() dicts).
+
+        A subscription passed in is pointed at the new batch before anything
+        about it is published.
+        """
+        output_dir = Path(output_dir)
+        if not output_dir.is_absolute():
+            raise ValueError("output_dir must be an absolute path")
+        if not jobs:
+            raise ValueError("no jobs")
+        sheets = {}  # CUE sheets parsed for this batch, shared by their tracks
+        planned = [Job.from_wire(wire, sheets) for wire in jobs]
+        with self.lock:
+            batch = {
+                'id': self.next_id,
+                'planned': planned,
+                'output_dir': str(output_dir),
+                'options': options or {},
+                'state': "queued",
+                'jobs': {job.key: job.status for job in planned},  # key -> status
+                'result': None,
+            }
+            self.next_id += 1
+            self.batches[batch['id']] = batch
+            self.queue.append(batch['id'])
+            if subscription is not None:
+                subscription['batch'] = batch['id']
+            position = len(self.queue) + (1 if self.host else 0)
+            self.wakeup.notify()
+        print(f"Batch {batch['id']} queued ({len(planned)} file(s) -> {output_dir})")
+        self.publish({'event': "queued", 'batch': batch['id'], 'position': position})
+        return {'batch': batch['id'], 'position': position}
+
+    def cancel(self, batch_id: int, keys: list = None) -> dict:
+        """Drop a batch's jobs that haven't started - all of them, or those in keys."""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise ValueError(f"no batch {batch_id}")
+            host = None
+            cancelled = []
+            if batch['state'] == "queued":
+                if keys is None:
+                    self.queue.remove(batch_id)
+                    self._finish(batch, "cancelled")
+                    cancelled = None
+                else:
+                    batch['cancelled'] = set(batch.get('cancelled', ())) | set(keys)
+                    cancelled = list(keys)
+            elif batch['state'] == "running" and self.host is not None:
+                host = self.host
+                taken = []
+                for queue in host.conversion.job_queues if host.conversion else []:
+                    taken += queue.take(host.pending_jobs(keys))
+            else:
+                return {'cancelled': []}
+        if cancelled is None:
+            self.publish({'event': "finished", 'batch': batch_id, 'state': "cancelled"})
+            return {'cancelled': "all"}
+        if host is not None:
+            for job in taken:
+                host.status(job, "Cancelled")
+            return {'cancelled': [job.key for job in taken]}
+        for key in cancelled:
+            if key in batch['jobs']:
+                batch['jobs'][key] = "Cancelled"
+            self.publish({'event': "status", 'batch': batch_id, 'job': key, 'status': "Cancelled"})
+        return {'cancelled': cancelled}
+
+    def promote(self, batch_id: int, keys: list) -> dict:
+        """Convert a running batch's still-pending jobs next ("Convert Next")."""
+        with self.lock:
+            host = self.host
+            if host is None or host.batch['id'] != batch_id:
+                return {'promoted': []}
+            promoted = []
+            for queue in host.conversion.job_queues if host.conversion else []:
+                promoted += queue.promote(host.pending_jobs(keys))
+        for job in promoted:
+            host.status(job, "Next")
+        return {'promoted': [job.key for job in promoted]}
+
+    def status(self) -> dict:
+        """Every known batch with its state and job counts, queue order first."""
+        with self.lock:
+            batches = []
+            for batch in self.batches.values():
+                counts = {}
+                for status in batch['jobs'].values():
+                    counts[status] = counts.get(status, 0) + 1
+                batches.append({key: batch[key] for key in ('id', 'state', 'output_dir', 'result')})
+                batches[-1]['jobs'] = counts
+            return {'running': self.host.batch['id'] if self.host else None,
+                    'queued': list(self.queue), 'batches': batches}
+
+    def snapshot(self, batch_id: int) -> dict:
+        """A batch's state and job statuses, sent first to a new watcher."""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise ValueError(f"no batch {batch_id}")
+            return {'event': "snapshot", 'batch': batch_id, 'state': batch['state'],
+                    'jobs': dict(batch['jobs']), 'result': batch['result']}
+
+    # The conversion loop
+    def _finish(self, batch: dict, state: str) -> None:
+        """Mark a batch done and forget the oldest finished ones (lock held)."""
+        batch['state'] = state
+        self.finished.append(batch['id'])
+        while len(self.finished) > FINISHED_KEPT:
+            self.batches.pop(self.finished.popleft(), None)
+
+    def run(self) -> None:
+        """Convert queued batches one at a time until stop()."""
+        while True:
+            with self.lock:
+                while not self.queue and not self.stopping:
+                    self.wakeup.wait()
+                if self.stopping:
+                    return
+                batch = self.batches[self.queue.popleft()]
+                batch['state'] = "running"
+                host = self.host = _BatchHost(self, batch)
+            try:
+                self._convert(host, batch)
+            except Exception as e:
+                print(f"Batch {batch['id']} failed: {e}")
+                batch['result'] = {'converted': 0, 'failed': 0, 'total': 0, 'note': f"Failed: {e}"}
+            with self.lock:
+                self.host = None
+                self._finish(batch, "finished")
+            self.publish(dict(batch['result'] or {}, event="finished", batch=batch['id'], state="finished"))
+
+    def _convert(self, host: _BatchHost, batch: dict) -> None:
+        """Run a batch's planned jobs through the pipeline.
+
+        Only sources that changed since the client planned them are read again.
+        """
+        skipped = batch.get('cancelled', set())
+        jobs = [job for job in batch['planned'] if job.key not in skipped]
+        ConversionPlan(jobs).refresh()
+        output_dir = Path(batch['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Batch {batch['id']}: converting {len(jobs)} file(s) into {output_dir}")
+        host.publish({'event': "started", 'jobs': {job.key: job.status for job in jobs}})
+        host.conversion = ConversionBatch(jobs, output_dir, self.ffmpeg_path, options_from_wire(batch['options']),
+                                          host, self.telemetry, self.throttle)
+        host.conversion.run()
+
+    def stop(self) -> None:
+        """Let the conversion loop exit once the running batch is done."""
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One request per connection: a JSON line in, a JSON reply (or an event stream) out."""
+
+    def handle(self):
+        service = self.server.service
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            command = request.get('command')
+            if command == "ping":
+                send_line(self.wfile, {'ok': True})
+            elif command == "submit":
+                # Subscribed before the batch exists, so not even its "queued" event is missed
+                watching = service.subscribe(batch_id=0) if request.get('watch') else None
+                try:
+                    reply = service.submit(request['jobs'], request['output_dir'],
+                                           request.get('options'), watching)
+                except Exception:
+                    if watching:
+                        service.unsubscribe(watching)
+                    raise
+                send_line(self.wfile, dict(reply, ok=True))
+                if watching:
+                    self._stream(service, watching, reply['batch'])
+            elif command == "watch":
+                batch_id = request.get('batch')
+                subscription = service.subscribe(batch_id)
+                if batch_id is not None:
+                    snapshot = service.snapshot(batch_id)
+                    send_line(self.wfile, snapshot)
+                    if snapshot['state'] != "queued" and snapshot['state'] != "running":
+                        service.unsubscribe(subscription)
+                        return
+                self._stream(service, subscription, batch_id)
+            elif command == "cancel":
+                send_line(self.wfile, dict(service.cancel(request['batch'], request.get('keys')), ok=True))
+            elif command == "promote":
+                send_line(self.wfile, dict(service.promote(request['batch'], request.get('keys')), ok=True))
+            elif command == "status":
+                send_line(self.wfile, dict(service.status(), ok=True))
+            else:
+                send_line(self.wfile, {'ok': False, 'error': f"unknown command: {command}"})
+        except (KeyError, TypeError, ValueError) as e:
+            try:
+                send_line(self.wfile, {'ok': False, 'error': f"bad request: {e}"})
+            except OSError:
+                pass
+        except OSError:
+            pass  # Client went away
+
+    def _stream(self, service: ConversionService, subscription: dict, batch_id) -> None:
+        """Send a subscription's events until its batch finishes or the client hangs up."""
+        try:
+            while True:
+                with subscription['ready']:
+                    while not subscription['events']:
+                        subscription['ready'].wait(1.0)
+                        if service.stopping:
+                            return
+                    events = list(subscription['events'])
+                    subscription['events'].clear()
+                for event in events:
+                    send_line(self.wfile, event)
+                    if batch_id is not None and event['event'] == "finished":
+                        return
+        finally:
+            service.unsubscribe(subscription)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _claim_socket(path: Path) -> None:
+    """Remove a socket left behind by a daemon that died; refuse if one is still running."""
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        path.unlink()
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A conversion daemon is already running on {path}")
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(service: ConversionService, path: Path = None) -> None:
+    """Answer clients on the socket and convert their batches until interrupted."""
+    path = path or socket_path()
+    _claim_socket(path)
+    old_umask = os.umask(0o077)  # Only this user may submit work
+    try:
+        server = _Server(str(path), _Handler)
+    finally:
+        os.umask(old_umask)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Conversion daemon listening on {path}")
+    signal.signal(signal.SIGTERM, _interrupt)  # Stop as cleanly as on Ctrl-C
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("Stopping - queued batches are dropped")
+    finally:
+        service.stop()
+        server.shutdown()
+        server.server_close()
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def _print_event(event: dict) -> None:
+    """One line per event worth reading on a terminal."""
+    kind = event.get('event')
+    if kind == "status":
+        print(f"{Path(event['job']).name}: {event['status']}")
+    elif kind == "log":
+        print(event['text'])
+    elif kind == "started":
+        print(f"Batch {event['batch']} started: {len(event['jobs'])} file(s)")
+    elif kind == "snapshot":
+        print(f"Batch {event['batch']} is {event['state']} ({len(event['jobs'])} file(s))")
+    elif kind == "finished":
+        if event.get('state') == "cancelled":
+            print(f"Batch {event['batch']} cancelled")
+        else:
+            print(f"Batch {event['batch']} finished: {event.get('converted', 0)} converted, "
+                  f"{event.get('failed', 0)} failed of {event.get('total', 0)}")
+            if event.get('note'):
+                print(event['note'])
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="AIFF conversion daemon")
+    parser.add_argument("--socket", type=Path, default=None, help="Socket path (default: ~/.cache/aiffmeplease)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Run the daemon")
+    serve_parser.add_argument("--ffmpeg", default=None, help="Path to ffmpeg")
+    serve_parser.add_argument("--background", action="store_true",
+                              help="Convert at low priority with a CPU cap (Background Mode)")
+    serve_parser.add_argument("--event-log", type=Path, default=None,
+                              help="Append JSON-lines job events to this file")
+    serve_parser.add_argument("--metrics-port", type=int, default=None,
+                              help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+
+    submit = sub.add_parser("submit", help="Queue files or folders for conversion")
+    submit.add_argument("output_dir", type=Path)
+    submit.add_argument("inputs", type=Path, nargs="+")
+    submit.add_argument("--wait", action="store_true", help="Print the batch's progress until it finishes")
+    submit.add_argument("--loudness", action="store_true", help="Analyze loudness (EBU R128)")
+    submit.add_argument("--no-artwork", action="store_true", help="Don't embed cover art")
+    submit.add_argument("--rekordbox", action="store_true", help="Write a Rekordbox collection.xml")
+    submit.add_argument("--store", action="store_true", help="Reuse outputs from the output store")
+    submit.add_argument("--bpm-key", action="store_true", help="Analyze BPM and key")
+    submit.add_argument("--layout", choices=list(LAYOUTS), default="flat", help="Output folder layout")
+    submit.add_argument("--lossy", choices=list(LOSSY_MODES), default="off",
+                        help="Check FLACs for a lossy source: skip or tag the suspects")
+    submit.add_argument("--hdd", action="store_true", help="Read inputs in on-disk order (spinning disks)")
+
+    sub.add_parser("status", help="List queued, running and finished batches")
+    watch = sub.add_parser("watch", help="Print a batch's progress until it finishes")
+    watch.add_argument("batch", type=int)
+    cancel = sub.add_parser("cancel", help="Cancel a batch's files that haven't started")
+    cancel.add_argument("batch", type=int)
+    cancel.add_argument("sources", type=Path, nargs="*", help="Only these source files")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        telemetry = Telemetry(args.event_log, args.metrics_port)
+        try:
+            serve(ConversionService(args.ffmpeg, telemetry, Throttle(enabled=args.background)), args.socket)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        finally:
+            telemetry.close()
+        return 0
+
+    client = DaemonClient.connect(args.socket)
+    if client is None:
+        print(f"No conversion daemon is running on {args.socket or socket_path()} - start one with: "
+              f"python -m app.daemon serve")
+        return 1
+
+    try:
+        if args.command == "submit":
+            inputs = []
+            for path in args.inputs:
+                path = path.resolve()
+                inputs += find_audio_inputs(path) if path.is_dir() else [path]
+            if not inputs:
+                print("No audio files found")
+                return 1
+            if args.hdd:
+                inputs = disk_order(inputs)
+            # Probed here, once - the daemon converts the planned jobs as they are
+            jobs = ConversionPlan.build(inputs, readahead=args.hdd).jobs
+            if not jobs:
+                print("No audio files found")
+                return 1
+            options = {
+                'analyze_loudness': args.loudness,
+                'embed_artwork': not args.no_artwork,
+                'export_rekordbox': args.rekordbox,
+                'use_store': args.store,
+                'analyze_bpm_key': args.bpm_key,
+                'layout': OutputLayout(args.layout),
+                'lossy_mode': args.lossy,
+                'hdd_order': args.hdd,
+            }
+            if not args.wait:
+                reply = client.submit(jobs, args.output_dir, options)
+                print(f"Batch {reply['batch']} queued at position {reply['position']}")
+                return 0
+            for event in client.submit(jobs, args.output_dir, options, watch=True):
+                if 'event' not in event:
+                    print(f"Batch {event['batch']} queued at position {event['position']}")
+                    continue
+                _print_event(event)
+                if event['event'] == "finished":
+                    return 0 if not event.get('failed') else 1
+            print("The daemon stopped before the batch finished")
+            return 1
+
+        if args.command == "status":
+            status = client.status()
+            if not status['batches']:
+                print("No batches")
+            for batch in status['batches']:
+                counts = ", ".join(f"{count} {name.lower()}" for name, count in sorted(batch['jobs'].items()))
+                print(f"Batch {batch['id']}: {batch['state']} -> {batch['output_dir']}"
+                      + (f" ({counts})" if counts else ""))
+            return 0
+
+        if args.command == "watch":
+            for event in client.watch(args.batch):
+                _print_event(event)
+            return 0
+
+        keys = [str(p.resolve()) for p in args.sources] or None
+        reply = client.cancel(args.batch, keys)
+        cancelled = reply['cancelled']
+        print("Batch cancelled" if cancelled == "all" else f"{len(cancelled)} file(s) cancelled")
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Daemon request failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    # BPM/key analysis uses a process pool; a frozen app must hand its workers over here
+    multiprocessing.freeze_support()
+    sys.exit(main())
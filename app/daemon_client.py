@@ -0,0 +1,138 @@
+"""Client side of the conversion daemon (app.daemon): socket location, wire format and requests.
+
+Kept apart from the daemon itself, so the GUI can talk to a daemon without
+importing the service.
+"""
+import json
+import os
+import socket
+from pathlib import Path
+
+from app.core import CACHE_DIR
+from app.layout import OutputLayout, BUCKET_SIZE
+
+SOCKET_NAME = "daemon.sock"
+
+
+def socket_path() -> Path:
+    """The daemon's socket - AIFFMEPLEASE_SOCKET, or daemon.sock in the cache folder."""
+    return Path(os.environ.get("AIFFMEPLEASE_SOCKET") or CACHE_DIR / SOCKET_NAME)
+
+
+def options_to_wire(options: dict) -> dict:
+    """Batch options as JSON - the output layout travels as its scheme and bucket size."""
+    wire = dict(options)
+    layout = wire.pop('layout', None)
+    if layout is not None:
+        wire['layout'] = {'scheme': layout.scheme, 'bucket_size': layout.bucket_size}
+    return wire
+
+
+def options_from_wire(wire: dict) -> dict:
+    """Batch options from JSON, as ConversionBatch takes them."""
+    options = dict(wire)
+    layout = options.pop('layout', None)
+    if layout:
+        options['layout'] = OutputLayout(layout.get('scheme', "flat"), layout.get('bucket_size', BUCKET_SIZE))
+    return options
+
+
+def send_line(wfile, payload: dict) -> None:
+    """Write one JSON object as a line."""
+    wfile.write((json.dumps(payload) + "\n").encode("utf-8"))
+    wfile.flush()
+
+
+class DaemonClient:
+    """Talks to a running daemon; every call opens its own connection."""
+
+    def __init__(self, path: Path = None, timeout: float = 5.0):
+        self.path = path or socket_path()
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, path: Path = None):
+        """A client for the running daemon, or None if none answers."""
+        client = cls(path)
+        if not client.path.exists():
+            return None
+        try:
+            client.request({'command': "ping"})
+        except (OSError, ValueError):
+            return None
+        return client
+
+    def _open(self, payload: dict, timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(self.path))
+            stream = sock.makefile("rwb")
+        except OSError:
+            sock.close()
+            raise
+        send_line(stream, payload)
+        return sock, stream
+
+    @staticmethod
+    def _reply(stream) -> dict:
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("the daemon closed the connection")
+        reply = json.loads(line)
+        if reply.get('ok') is False:
+            raise ValueError(reply.get('error', "request failed"))
+        return reply
+
+    def request(self, payload: dict) -> dict:
+        """Send one request and return the daemon's reply."""
+        sock, stream = self._open(payload, self.timeout)
+        try:
+            return self._reply(stream)
+        finally:
+            stream.close()
+            sock.close()
+
+    def stream(self, payload: dict):
+        """Send a request and yield the reply and every event after it, until the daemon ends the stream."""
+        sock, stream = self._open(payload, None)  # Events can be minutes apart
+        try:
+            while True:
+                line = stream.readline()
+                if not line:
+                    return
+                event = json.loads(line)
+                if event.get('ok') is False:
+                    raise ValueError(event.get('error', "request failed"))
+                yield event
+        finally:
+            stream.close()
+            sock.close()
+
+    def submit(self, jobs: list, output_dir: Path, options: dict = None, watch: bool = False):
+        """Queue a batch of planned jobs. Returns the reply, or with watch a stream: the reply, then the batch's events.
+
+        The jobs travel with everything their probe found, so the daemon
+        doesn't read the sources again.
+        """
+        payload = {
+            'command': "submit",
+            'jobs': [job.to_wire() for job in jobs],
+            'output_dir': str(Path(output_dir).resolve()),
+            'options': options_to_wire(options or {}),
+            'watch': watch,
+        }
+        return self.stream(payload) if watch else self.request(payload)
+
+    def watch(self, batch_id: int = None):
+        """A batch's snapshot and then its events (or every event, for None)."""
+        return self.stream({'command': "watch", 'batch': batch_id})
+
+    def cancel(self, batch_id: int, keys: list = None) -> dict:
+        return self.request({'command': "cancel", 'batch': batch_id, 'keys': keys})
+
+    def promote(self, batch_id: int, keys: list) -> dict:
+        return self.request({'command': "promote", 'batch': batch_id, 'keys': keys})
+
+    def status(self) -> dict:
+        return self.request({'command': "status"})
@@ -0,0 +1,538 @@
+"""Distributed conversion: a coordinator hands jobs to workers over HTTP.
+
+Sources and outputs live on shared storage, mounted at the same path on
+every host. Workers lease one job at a time, run the same ffmpeg command
+and naming logic as the GUI, write the AIFF to the shared output folder
+under a temporary name and report back. The coordinator gives the output
+its real name only when it accepts the report, so a job that was handed to
+another worker never ends up in the folder twice. A lease that is not
+renewed (the worker died or ffmpeg hung) expires and the job is handed to
+another worker.
+
+Usage:
+    python -m app.distributed coordinator INPUT_DIR OUTPUT_DIR [--port 8765] [--dry-run]
+                                          [--event-log PATH] [--metrics-port PORT]
+    python -m app.distributed worker http://HOST:8765 [--name NAME]
+                                     [--event-log PATH] [--metrics-port PORT]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from app.core import (
+    get_tags_from_file, get_duration, build_filename_from_tags, find_ffmpeg,
+    build_ffmpeg_command, unique_output_path, parse_loudness, write_loudness_tags
+)
+from app.artwork import ArtworkCache, extract_artwork, embed_artwork
+from app.ffmpeg_runner import FFmpegRunner
+from app.plan import ConversionPlan, Job
+from app.preflight import check_job, BROKEN
+from app.dryrun import dry_run, report_lines, record_throughput
+from app.telemetry import Telemetry
+from app.retry import stall_seconds
+
+DEFAULT_PORT = 8765
+LEASE_SECONDS = 120
+PART_SUFFIX = ".part"  # Outputs being written, until the coordinator accepts them
+MAX_ATTEMPTS = 3  # A job failing (or losing its lease) this often is given up
+
+
+class Coordinator:
+    """Job table with leases, re-dispatch and per-worker throughput stats."""
+
+    def __init__(self, sources: list, output_dir: Path, options: dict = None,
+                 lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+                 telemetry: Telemetry = None, log=print):
+        self.output_dir = output_dir
+        self.options = options or {}
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.telemetry = telemetry or Telemetry()
+        self.log = log  # Console lines: expired leases, failures and the progress reports
+        self.lock = threading.Lock()
+
+        self.jobs = {i: {'id': i, 'source': str(p), 'attempts': 0} for i, p in enumerate(sources)}
+        self.pending = deque(self.jobs)
+        self.leases = {}  # job id -> (worker name, deadline)
+        self.done = {}  # job id -> output path
+        self.failed = {}  # job id -> last error
+        self.workers = {}  # worker name -> stats dict
+        self.started = time.monotonic()
+        for job in self.jobs.values():
+            self.telemetry.emit("job_queued", source=job['source'])
+
+    @property
+    def finished(self) -> bool:
+        """True once every job is done or given up."""
+        with self.lock:
+            return not self.pending and not self.leases
+
+    def _worker(self, name: str) -> dict:
+        """Stats entry for a worker, created on first contact."""
+        if name not in self.workers:
+            self.workers[name] = {
+                'files': 0, 'failed': 0, 'expired': 0,
+                'audio_seconds': 0.0, 'busy_seconds': 0.0,
+                'first_seen': time.monotonic(), 'last_seen': 0.0,
+            }
+        stats = self.workers[name]
+        stats['last_seen'] = time.monotonic()
+        return stats
+
+    def _retry_or_fail(self, job_id: int, error: str, retry: bool = True) -> None:
+        """Requeue a job at the front, or give it up after max_attempts (or at once without retry)."""
+        job = self.jobs[job_id]
+        job['attempts'] += 1
+        if not retry or job['attempts'] >= self.max_attempts:
+            self.failed[job_id] = error
+        else:
+            self.pending.appendleft(job_id)
+            self.telemetry.emit("job_queued", source=job['source'], attempt=job['attempts'] + 1)
+
+    def _reap_expired(self) -> None:
+        """Take back jobs whose worker stopped renewing its lease."""
+        now = time.monotonic()
+        for job_id, (worker, deadline) in list(self.leases.items()):
+            if deadline < now:
+                del self.leases[job_id]
+                self._worker(worker)['expired'] += 1
+                self.log(f"Lease expired: {Path(self.jobs[job_id]['source']).name} ({worker})")
+                self.telemetry.emit("lease_expired", source=self.jobs[job_id]['source'], worker=worker)
+                self._retry_or_fail(job_id, f"lease expired on {worker}")
+
+    def lease(self, worker: str) -> dict:
+        """Hand the next pending job to a worker."""
+        with self.lock:
+            self._worker(worker)
+            self._reap_expired()
+            if not self.pending:
+                return {'job': None, 'finished': not self.leases}
+
+            job_id = self.pending.popleft()
+            self.leases[job_id] = (worker, time.monotonic() + self.lease_seconds)
+            job = dict(self.jobs[job_id], output_dir=str(self.output_dir), options=self.options)
+            self.telemetry.emit("job_started", source=job['source'], worker=worker, attempt=job['attempts'] + 1)
+            return {'job': job, 'lease_seconds': self.lease_seconds}
+
+    def heartbeat(self, worker: str, job_id: int) -> dict:
+        """Extend a lease; False means the job was taken back and went elsewhere."""
+        with self.lock:
+            self._worker(worker)
+            lease = self.leases.get(job_id)
+            if not lease or lease[0] != worker:
+                return {'ok': False}
+            self.leases[job_id] = (worker, time.monotonic() + self.lease_seconds)
+            return {'ok': True}
+
+    def complete(self, worker: str, job_id: int, ok: bool, output: str = "", name: str = "",
+                 error: str = "", audio_seconds: float = 0.0, wall_seconds: float = 0.0,
+                 bytes: int = 0, exit_code: int = None, retry: bool = True) -> dict:
+        """Record a job outcome reported by a worker.
+
+        A converted job's output is moved from its temporary path to name.aiff
+        (numbered if taken) and the reply carries the final path. A worker that
+        lost its lease gets ok False and must delete its output.
+        """
+        with self.lock:
+            stats = self._worker(worker)
+            stats['busy_seconds'] += wall_seconds
+
+            lease = self.leases.get(job_id)
+            if not lease or lease[0] != worker:
+                return {'ok': False}  # Lease lost - the re-dispatched run counts instead
+            del self.leases[job_id]
+            source = self.jobs[job_id]['source']
+
+            if ok and name:
+                final_path = None
+                try:
+                    final_path = unique_output_path(self.output_dir, name, reserve=True)
+                    os.replace(output, final_path)
+                    output = str(final_path)
+                except OSError as e:
+                    ok, error = False, f"Could not name the output: {e}"
+                    for path in (output, final_path):
+                        if path is not None:
+                            try:
+                                os.unlink(path)
+                            except OSError:
+                                pass
+
+            if ok:
+                stats['files'] += 1
+                stats['audio_seconds'] += audio_seconds
+                self.done[job_id] = output
+                self.telemetry.emit("job_finished", source=source, worker=worker, result="converted",
+                                    output=output, exit_code=exit_code, seconds=round(wall_seconds, 3),
+                                    bytes=bytes, audio_seconds=round(audio_seconds, 3))
+            else:
+                stats['failed'] += 1
+                self.log(f"Failed on {worker}: {Path(source).name}: {error[-200:]}")
+                self.telemetry.emit("job_failed", source=source, worker=worker, exit_code=exit_code,
+                                    error=error, seconds=round(wall_seconds, 3))
+                self._retry_or_fail(job_id, error, retry)
+            return {'ok': True, 'output': output}
+
+    def stats(self) -> dict:
+        """Progress counters and per-worker throughput."""
+        with self.lock:
+            now = time.monotonic()
+            workers = {}
+            for name, s in self.workers.items():
+                alive = max(now - s['first_seen'], 1e-6)
+                workers[name] = {
+                    'files': s['files'],
+                    'failed': s['failed'],
+                    'expired': s['expired'],
+                    'audio_seconds': round(s['audio_seconds'], 1),
+                    'files_per_minute': round(s['files'] * 60 / alive, 2),
+                    'realtime_factor': round(s['audio_seconds'] / s['busy_seconds'], 1)
+                                       if s['busy_seconds'] else 0.0,
+                    'idle_seconds': round(now - s['last_seen'], 1),
+                }
+            return {
+                'total': len(self.jobs),
+                'pending': len(self.pending),
+                'leased': len(self.leases),
+                'done': len(self.done),
+                'failed': len(self.failed),
+                'elapsed_seconds': round(now - self.started, 1),
+                'workers': workers,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """JSON endpoints: POST /lease, /heartbeat, /complete and GET /stats."""
+
+    def _reply(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(self.server.coordinator.stats())
+        else:
+            self._reply({'error': "not found"}, 404)
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/lease":
+                self._reply(coordinator.lease(request['worker']))
+            elif self.path == "/heartbeat":
+                self._reply(coordinator.heartbeat(request['worker'], request['job_id']))
+            elif self.path == "/complete":
+                self._reply(coordinator.complete(**request))
+            else:
+                self._reply({'error': "not found"}, 404)
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply({'error': f"bad request: {e}"}, 400)
+
+    def log_message(self, format, *args):
+        pass  # Progress is printed by serve(), not per request
+
+
+def serve(coordinator: Coordinator, host: str = "0.0.0.0", port: int = DEFAULT_PORT,
+          report_interval: float = 10.0) -> dict:
+    """Run the coordinator until every job is done or given up; return final stats."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    log = coordinator.log
+    log(f"Coordinator listening on {host}:{server.server_address[1]} "
+        f"with {len(coordinator.jobs)} job(s)")
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(0.5)
+            # Leases also expire here so a batch whose workers all died still requeues
+            with coordinator.lock:
+                coordinator._reap_expired()
+            if coordinator.finished:
+                break
+            if time.monotonic() - last_report >= report_interval:
+                s = coordinator.stats()
+                log(f"{s['done']} done, {s['failed']} failed, {s['leased']} running, "
+                    f"{s['pending']} pending")
+                last_report = time.monotonic()
+    finally:
+        # Give polling workers a moment to hear that the batch is finished
+        time.sleep(1.0)
+        server.shutdown()
+        server.server_close()
+
+    stats = coordinator.stats()
+    coordinator.telemetry.emit("batch_finished", converted=stats['done'], failed=stats['failed'],
+                               seconds=stats['elapsed_seconds'])
+    for name, w in stats['workers'].items():
+        log(f"  {name}: {w['files']} file(s), {w['failed']} failed, {w['expired']} expired, "
+            f"{w['files_per_minute']} files/min, {w['realtime_factor']}x realtime")
+    log(f"Finished: {stats['done']} converted, {stats['failed']} failed "
+        f"in {stats['elapsed_seconds']}s")
+    return stats
+
+
+def _post(url: str, payload: dict, timeout: float = 30) -> dict:
+    """POST JSON and decode the JSON reply."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def convert_job(job: dict, ffmpeg_path: str, runner: FFmpegRunner,
+                on_progress=None, artwork_cache: ArtworkCache = None) -> dict:
+    """Convert one leased job exactly like the GUI does; return the completion report.
+
+    The AIFF is written to a hidden temporary name in the output folder; the
+    report's name is the one the coordinator gives it on acceptance.
+    """
+    audio_path = Path(job['source'])
+    output_dir = Path(job['output_dir'])
+    options = job.get('options', {})
+    analyze_loudness = options.get('analyze_loudness', False)
+    started = time.monotonic()
+    output_path = None
+    exit_code = None
+
+    # Broken sources fail here, from their headers, and are not retried elsewhere
+    verdict, reason = check_job(Job(audio_path))
+    if verdict == BROKEN:
+        return {
+            'ok': False,
+            'error': f"Broken: {reason}",
+            'wall_seconds': time.monotonic() - started,
+            'retry': False,
+        }
+
+    try:
+        tags = get_tags_from_file(audio_path)
+        clean_name = build_filename_from_tags(audio_path, tags)
+        # Unique per lease - a worker whose lease ran out may still be writing its own copy
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / f".{clean_name}.{job['id']}-{job['attempts']}{PART_SUFFIX}"
+
+        cmd = build_ffmpeg_command(ffmpeg_path, audio_path, output_path, analyze_loudness)
+        stall_timeout = stall_seconds()
+        result = runner.run(cmd, on_progress=on_progress, stall_timeout=stall_timeout)
+        exit_code = result.returncode
+
+        if result.stalled:
+            raise RuntimeError(f"Stalled: no progress for {stall_timeout:.0f} seconds")
+        if result.returncode != 0 or output_path.stat().st_size == 0:
+            raise RuntimeError(result.stderr[-200:] if result.stderr else "Unknown error")
+
+        if analyze_loudness:
+            loudness = parse_loudness(result.stderr)
+            if loudness:
+                write_loudness_tags(output_path, loudness)
+
+        if artwork_cache:
+            artwork = extract_artwork(audio_path)
+            jpeg = artwork_cache.get(artwork) if artwork else None
+            if jpeg:
+                embed_artwork(output_path, jpeg)
+
+        return {
+            'ok': True,
+            'output': str(output_path),
+            'name': clean_name,
+            'audio_seconds': get_duration(audio_path),
+            'wall_seconds': time.monotonic() - started,
+            'bytes': output_path.stat().st_size,
+            'exit_code': exit_code,
+        }
+    except Exception as e:
+        # Don't leave a partial file behind for the retry
+        if output_path is not None:
+            try:
+                output_path.unlink()
+            except OSError:
+                pass
+        return {
+            'ok': False,
+            'error': str(e)[:200] or "Unknown error",
+            'wall_seconds': time.monotonic() - started,
+            'exit_code': exit_code,
+        }
+
+
+def run_worker(url: str, name: str, ffmpeg_path: str = None, poll_interval: float = 2.0,
+               telemetry: Telemetry = None, log=print) -> int:
+    """Lease and convert jobs until the coordinator is finished; return files converted.
+
+    Job events go to telemetry, console lines to log.
+    """
+    url = url.rstrip("/")
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    telemetry = telemetry or Telemetry()
+    started = time.monotonic()
+    runner = FFmpegRunner()
+    artwork_cache = None
+    converted = 0
+    encoded_audio = 0.0
+    encode_seconds = 0.0
+
+    try:
+        while True:
+            try:
+                reply = _post(url + "/lease", {'worker': name})
+            except OSError:
+                log("Coordinator is gone - stopping")
+                break
+
+            job = reply.get('job')
+            if not job:
+                if reply.get('finished'):
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            if job['options'].get('embed_artwork') and artwork_cache is None:
+                artwork_cache = ArtworkCache(ffmpeg_path)
+
+            # Renew the lease from ffmpeg's progress reports; a hung ffmpeg stops
+            # reporting, the lease runs out and the job is re-dispatched
+            renew_every = reply.get('lease_seconds', LEASE_SECONDS) / 3
+            last_renewal = [time.monotonic()]
+
+            def on_progress(position, done, job_id=job['id']):
+                if time.monotonic() - last_renewal[0] >= renew_every:
+                    last_renewal[0] = time.monotonic()
+                    try:
+                        _post(url + "/heartbeat", {'worker': name, 'job_id': job_id}, timeout=5)
+                    except OSError:
+                        pass
+
+            log(f"Converting {Path(job['source']).name}")
+            telemetry.emit("job_started", source=job['source'], worker=name, attempt=job['attempts'] + 1)
+            report = convert_job(job, ffmpeg_path, runner, on_progress, artwork_cache)
+            try:
+                accepted = _post(url + "/complete", dict(report, worker=name, job_id=job['id']))
+            except OSError:
+                accepted = None
+            if report['ok'] and not (accepted or {}).get('ok'):
+                # The lease ran out and the job went to another worker - its copy counts
+                try:
+                    os.unlink(report['output'])
+                except OSError:
+                    pass
+                if accepted is not None:
+                    log(f"Lease lost: {Path(job['source']).name} - discarded")
+                telemetry.emit("job_finished", source=job['source'], worker=name, result="discarded",
+                               exit_code=report['exit_code'], seconds=round(report['wall_seconds'], 3))
+            elif report['ok']:
+                converted += 1
+                encoded_audio += report['audio_seconds']
+                encode_seconds += report['wall_seconds']
+                telemetry.emit("job_finished", source=job['source'], worker=name, result="converted",
+                               output=accepted['output'], exit_code=report['exit_code'],
+                               seconds=round(report['wall_seconds'], 3), bytes=report['bytes'],
+                               audio_seconds=round(report['audio_seconds'], 3))
+            else:
+                telemetry.emit("job_failed", source=job['source'], worker=name,
+                               exit_code=report.get('exit_code'), error=report['error'],
+                               seconds=round(report['wall_seconds'], 3))
+            if accepted is None:
+                log("Coordinator is gone - stopping")
+                break
+    finally:
+        runner.close()
+        try:
+            record_throughput(encoded_audio, encode_seconds)
+        except OSError as e:
+            log(f"Could not save throughput calibration: {e}")
+        telemetry.emit("batch_finished", worker=name, converted=converted,
+                       seconds=round(time.monotonic() - started, 3))
+
+    log(f"Worker {name} converted {converted} file(s)")
+    return converted
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Distributed AIFF conversion")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coord = sub.add_parser("coordinator", help="Split a folder into jobs and serve them")
+    coord.add_argument("input_dir", type=Path)
+    coord.add_argument("output_dir", type=Path)
+    coord.add_argument("--host", default="0.0.0.0")
+    coord.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coord.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Lease length in seconds")
+    coord.add_argument("--loudness", action="store_true", help="Analyze loudness (EBU R128)")
+    coord.add_argument("--no-artwork", action="store_true", help="Don't embed cover art")
+    coord.add_argument("--dry-run", action="store_true",
+                       help="Print the rename map, projected size and time, then exit")
+    coord.add_argument("--event-log", type=Path, default=None,
+                       help="Append JSON-lines job events for the whole batch to this file")
+    coord.add_argument("--metrics-port", type=int, default=None,
+                       help="Serve Prometheus metrics for the whole batch on http://127.0.0.1:PORT/metrics")
+
+    work = sub.add_parser("worker", help="Convert jobs leased from a coordinator")
+    work.add_argument("url", help="Coordinator URL, e.g. http://host:8765")
+    work.add_argument("--name", default=None, help="Worker name (default: hostname-pid)")
+    work.add_argument("--ffmpeg", default=None, help="Path to ffmpeg")
+    work.add_argument("--event-log", type=Path, default=None,
+                      help="Append JSON-lines job events to this file")
+    work.add_argument("--metrics-port", type=int, default=None,
+                      help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+
+    args = parser.parse_args(argv)
+
+    if args.role == "coordinator":
+        input_dir = args.input_dir
+        if not input_dir.is_dir():
+            print(f"Input folder does not exist: {input_dir}")
+            return 1
+        sources = list(input_dir.rglob("*.flac")) + list(input_dir.rglob("*.mp3"))
+        if not sources:
+            print("No audio files found in the input folder")
+            return 1
+        if args.dry_run:
+            report = dry_run(ConversionPlan.build(sources).jobs, args.output_dir)
+            for line in report_lines(report):
+                print(line)
+            return 0 if report.fits else 1
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        options = {'analyze_loudness': args.loudness, 'embed_artwork': not args.no_artwork}
+        telemetry = Telemetry(args.event_log, args.metrics_port)
+        try:
+            coordinator = Coordinator(sources, args.output_dir, options, lease_seconds=args.lease,
+                                      telemetry=telemetry)
+            stats = serve(coordinator, args.host, args.port)
+        finally:
+            telemetry.close()
+        return 0 if not stats['failed'] else 1
+
+    name = args.name or f"{socket.gethostname()}-{os.getpid()}"
+    telemetry = Telemetry(args.event_log, args.metrics_port)
+    try:
+        run_worker(args.url, name, args.ffmpeg, telemetry=telemetry)
+    finally:
+        telemetry.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Dry-run planning: rename map, projected disk usage and time, without converting."""
+import json
+import shutil
+from pathlib import Path
+
+from app.core import CACHE_DIR, projected_output_bytes
+from app.layout import OutputLayout, OutputNames
+
+THROUGHPUT_FILE = CACHE_DIR / "throughput.json"
+THROUGHPUT_RUNS = 20  # Calibrate from this many recent batches
+
+
+def record_throughput(audio_seconds: float, wall_seconds: float) -> None:
+    """Remember how fast this machine converted a batch (audio seconds per wall second).
+
+    Raises OSError if the calibration file can't be written.
+    """
+    if audio_seconds <= 0 or wall_seconds <= 0:
+        return
+    try:
+        runs = json.loads(THROUGHPUT_FILE.read_text())
+    except (OSError, ValueError):
+        runs = []
+    runs.append([audio_seconds, wall_seconds])
+    THROUGHPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    THROUGHPUT_FILE.write_text(json.dumps(runs[-THROUGHPUT_RUNS:]))
+
+
+def measured_throughput():
+    """Audio seconds converted per wall second in recent runs, or None if never measured."""
+    try:
+        runs = json.loads(THROUGHPUT_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+    audio = sum(r[0] for r in runs)
+    wall = sum(r[1] for r in runs)
+    return audio / wall if audio > 0 and wall > 0 else None
+
+
+class DryRunReport:
+    """What a conversion would do: rename map, collisions, bytes and time."""
+
+    def __init__(self):
+        self.renames = []  # (source path, planned output path)
+        self.collisions = []  # (source path, wanted name, final name, reason)
+        self.output_bytes = 0
+        self.audio_seconds = 0.0
+        self.free_bytes = None
+        self.throughput = None  # Audio seconds per wall second
+        self.estimated_seconds = None
+
+    @property
+    def fits(self) -> bool:
+        """False if the output volume is known to be too small."""
+        return self.free_bytes is None or self.output_bytes <= self.free_bytes
+
+
+def dry_run(jobs: list, output_dir: Path, layout: OutputLayout = None) -> DryRunReport:
+    """Resolve every output path the way the conversion would and total the cost."""
+    report = DryRunReport()
+
+    # Names the conversion would collide with: files already in each folder,
+    # plus every name planned before this one
+    names = OutputNames()
+    folders = (layout or OutputLayout()).assign(jobs, output_dir, names)
+    planned = set()
+
+    for job in jobs:
+        wanted = folders[job] / job.output_name
+        path = names.claim(folders[job], job.clean_name)
+
+        if path.name != job.output_name:
+            reason = "duplicate" if str(wanted).lower() in planned else "exists"
+            report.collisions.append((job.source, job.output_name, path.name, reason))
+        planned.add(str(path).lower())
+
+        report.renames.append((job.source, path))
+        report.output_bytes += projected_output_bytes(job.total_samples, job.sample_rate, job.meta_bytes)
+        report.audio_seconds += job.duration
+
+    # Free space on the volume that will hold the outputs
+    probe = output_dir
+    while not probe.exists() and probe != probe.parent:
+        probe = probe.parent
+    try:
+        report.free_bytes = shutil.disk_usage(str(probe)).free
+    except OSError:
+        pass
+
+    report.throughput = measured_throughput()
+    if report.throughput:
+        report.estimated_seconds = report.audio_seconds / report.throughput
+    return report
+
+
+def format_bytes(size: int) -> str:
+    """Human readable size."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_seconds(seconds: float) -> str:
+    """Format seconds as H:MM:SS."""
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def summary_lines(report: DryRunReport) -> list:
+    """Short summary of a dry run."""
+    lines = [
+        f"Files: {len(report.renames)}",
+        f"Audio: {format_seconds(report.audio_seconds)}",
+        f"Output size: {format_bytes(report.output_bytes)} ({report.output_bytes} bytes, "
+        f"plus tags/cover art)",
+    ]
+    if report.free_bytes is not None:
+        lines.append(f"Free space: {format_bytes(report.free_bytes)}"
+                     + ("" if report.fits else " - NOT ENOUGH"))
+    lines.append(f"Name collisions: {len(report.collisions)}")
+    if report.estimated_seconds is not None:
+        lines.append(f"Estimated time: {format_seconds(report.estimated_seconds)} "
+                     f"(at {report.throughput:.0f}x realtime, measured on this machine)")
+    else:
+        lines.append("Estimated time: unknown until a first conversion has run on this machine")
+    return lines
+
+
+def report_lines(report: DryRunReport) -> list:
+    """The full rename map, collisions and summary, one line each."""
+    lines = ["Planned outputs:"]
+    for source, output in report.renames:
+        lines.append(f"  {source} -> {output.name}")
+    if report.collisions:
+        lines.append("Collisions:")
+        for source, wanted, final, reason in report.collisions:
+            lines.append(f"  {source.name}: {wanted} {reason}, will be written as {final}")
+    return lines + summary_lines(report)
@@ -0,0 +1,205 @@
+"""asyncio-based ffmpeg process runner with streaming progress and a stall watchdog."""
+import asyncio
+import time
+from collections import deque
+
+STDERR_LINES = 64  # Enough for the error message and the ebur128 summary
+STDIN_CHUNK = 256 * 1024  # Bytes per write when piping a source into ffmpeg
+
+
+class FFmpegResult:
+    """Outcome of one ffmpeg run."""
+
+    def __init__(self, returncode: int, stderr: str, stalled: bool = False):
+        self.returncode = returncode
+        self.stderr = stderr  # Only the last STDERR_LINES lines
+        self.stalled = stalled  # Killed by the watchdog
+
+
+class _Progress:
+    """Last time ffmpeg's output moved, shared by the progress reader and the watchdog."""
+
+    def __init__(self):
+        self.moved = time.monotonic()
+        self.mark = None  # (out_time_us, total_size) at the last move
+
+
+async def _read_progress(stream, on_progress, progress: _Progress) -> None:
+    """Parse `-progress pipe:1` key=value blocks and report the output position in seconds."""
+    position = 0.0
+    out_time = total_size = None
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+        if key == "out_time_us":
+            out_time = value
+            try:
+                position = max(0, int(value)) / 1_000_000
+            except ValueError:
+                pass  # "N/A" before the first frame
+        elif key == "total_size":
+            total_size = value
+        elif key == "progress":
+            # Blocks keep coming while ffmpeg waits on its input - only a moving position
+            # or a growing output counts as progress
+            if (out_time, total_size) != progress.mark:
+                progress.mark = (out_time, total_size)
+                progress.moved = time.monotonic()
+            if on_progress:
+                # One block per stats period; "end" closes the last one
+                on_progress(position, value == "end")
+
+
+async def _watchdog(proc, progress: _Progress, stall_timeout: float) -> bool:
+    """Kill proc once its output has not moved for stall_timeout seconds; True if it did.
+
+    Returns as soon as proc exits, not at the next check - a short file's
+    run would otherwise last until the next second.
+    """
+    exited = asyncio.ensure_future(proc.wait())
+    try:
+        while not exited.done():
+            idle = time.monotonic() - progress.moved
+            if idle >= stall_timeout:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    return False
+                return True
+            await asyncio.wait({exited}, timeout=min(1.0, stall_timeout - idle))
+        return False
+    finally:
+        if not exited.done():
+            exited.cancel()
+
+
+async def _read_stderr(stream, ring: deque) -> None:
+    """Keep only the tail of stderr - a long file never buffers its whole log."""
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        ring.append(line.decode("utf-8", "replace"))
+
+
+async def _feed_stdin(stream, source, throttle=None, io_weight: float = 1.0) -> None:
+    """Copy a binary file object into ffmpeg's stdin.
+
+    Reads run in the default executor - inflating a ZIP member is blocking
+    work - and drain() keeps at most one chunk in flight. With a throttle,
+    each chunk is charged io_weight times its size against the I/O cap, so
+    the output ffmpeg writes for it is paid for up front.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, source.read, STDIN_CHUNK)
+            if not chunk:
+                break
+            if throttle:
+                await throttle.throttle_io(len(chunk) * io_weight)
+            stream.write(chunk)
+            await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # ffmpeg exited early; its return code and stderr tell why
+    finally:
+        try:
+            stream.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+async def run_ffmpeg(cmd: list, on_progress=None, stall_timeout: float = 60,
+                     stderr_lines: int = STDERR_LINES, stdin=None, throttle=None,
+                     io_weight: float = 1.0, pass_fds=()) -> FFmpegResult:
+    """Run an ffmpeg command, streaming progress to on_progress(seconds, done).
+
+    `-progress pipe:1 -nostats` is added right after the binary, so cmd must
+    not write its output to stdout. There is no overall time limit: ffmpeg is
+    killed only if its output stops moving for stall_timeout seconds, so a
+    two-hour mix on a slow machine runs to the end. stdin, if given, is a
+    binary file object piped to ffmpeg for a `pipe:0` input. throttle, if
+    given, is a background.Throttle that sets the child's priority and CPU share.
+    pass_fds are file descriptors the child inherits, for `pipe:N` outputs.
+    """
+    cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + list(cmd[1:])
+    ring = deque(maxlen=stderr_lines)
+    preexec = None
+    if throttle:
+        cmd = throttle.command_prefix() + cmd
+        preexec = throttle.preexec()
+        stall_timeout = stall_timeout / throttle.share  # A paused child needs proportionally longer
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        preexec_fn=preexec,
+        pass_fds=pass_fds
+    )
+    progress = _Progress()
+    tasks = [
+        _read_progress(proc.stdout, on_progress, progress),
+        _read_stderr(proc.stderr, ring)
+    ]
+    if stdin is not None:
+        tasks.append(_feed_stdin(proc.stdin, stdin, throttle, io_weight))
+    if throttle:
+        tasks.append(throttle.govern(proc))
+    readers = asyncio.gather(*tasks)
+    watchdog = asyncio.ensure_future(_watchdog(proc, progress, stall_timeout))
+
+    # The watchdog returns as soon as the process exits (or it kills it); proc.wait()
+    # would also wait for the pipes to close
+    stalled = await watchdog
+    if stalled:
+        # Anything the killed process left holding its pipes must not hang the batch
+        try:
+            await asyncio.wait_for(asyncio.gather(proc.wait(), readers), 5)
+        except asyncio.TimeoutError:
+            pass
+    else:
+        await proc.wait()
+        await readers
+
+    return FFmpegResult(proc.returncode, "".join(ring), stalled)
+
+
+class FFmpegRunner:
+    """Synchronous front end for the conversion thread - one event loop per batch."""
+
+    def __init__(self, throttle=None):
+        self.loop = asyncio.new_event_loop()
+        self.throttle = throttle  # Shared background.Throttle, read at every run
+
+    def run(self, cmd: list, on_progress=None, stall_timeout: float = 60, stdin=None,
+            io_weight: float = 1.0, stderr_lines: int = STDERR_LINES) -> FFmpegResult:
+        """Run one ffmpeg command to completion on the batch loop."""
+        return self.loop.run_until_complete(run_ffmpeg(
+            cmd, on_progress, stall_timeout, stderr_lines, stdin=stdin, throttle=self.throttle,
+            io_weight=io_weight
+        ))
+
+    def run_all(self, cmds: list, on_progress=None, stall_timeout: float = 60, pass_fds=None) -> list:
+        """Run several ffmpeg commands side by side on the batch loop; a result per command.
+
+        on_progress(index, seconds, done) reports each command's progress.
+        pass_fds, if given, holds the inherited file descriptors of each command.
+        """
+        async def run_each():
+            return await asyncio.gather(*(
+                run_ffmpeg(cmd,
+                           (lambda position, done, index=index: on_progress(index, position, done))
+                           if on_progress else None,
+                           stall_timeout, throttle=self.throttle,
+                           pass_fds=pass_fds[index] if pass_fds else ())
+                for index, cmd in enumerate(cmds)
+            ))
+        return self.loop.run_until_complete(run_each())
+
+    def close(self) -> None:
+        """Close the event loop."""
+        self.loop.close()
@@ -5,22 +5,50 @@ from pathlib import Path
 import threading
 import subprocess
 import os
-import re
-import sys
+import multiprocessing
 
-# Try to import mutagen
-try:
-    import mutagen
-    from mutagen.flac import FLAC
-    from mutagen.mp3 import MP3
-except ImportError:
-    print("Error: mutagen is not installed. Please run: pip3 install --user mutagen")
-    sys.exit(1)
+from app.core import (
+    sanitize_filename, get_tags_from_file, build_filename_from_tags,
+    find_ffmpeg, GROUP_SIZE
+)
+from app.background import Throttle
+from app.analysis import HAS_NUMPY
+from app.lossy import LOSSY_MODES, LossyScanner, describe
+from app.locality import disk_order
+from app.layout import OutputLayout, LAYOUTS, BUCKET_SIZE
+from app.plan import ConversionPlan, Job
+from app.archive import find_audio_inputs
+from app.dryrun import dry_run, report_lines, summary_lines, format_bytes
+from app.pipeline import ConversionBatch, BatchEvents
+from app.search import SearchIndex
+from app.telemetry import Telemetry
+from app.daemon_client import DaemonClient
 
 # Pillow/PIL is NOT used - it causes macOS version compatibility issues
 # The app works perfectly without it (just no icon display)
 HAS_PIL = False
 
+ROW_CHUNK = 500  # File-list rows inserted or re-attached per event-loop turn, so 100k rows never freeze the window
+
+
+class _WindowEvents(BatchEvents):
+    """Shows a batch's events in the window - each one is handed to the Tk thread."""
+
+    def __init__(self, app: "FLAC2AIFFApp"):
+        self.app = app
+
+    def status(self, job, text: str) -> None:
+        self.app.root.after(0, lambda: self.app._update_file_status(job, text))
+
+    def progress(self, job, index: int, total: int, percent: int, eta: str) -> None:
+        self.app.root.after(0, lambda: self.app._report_progress(job, index, total, percent, eta))
+
+    def message(self, text: str) -> None:
+        self.app.root.after(0, lambda: self.app.status_label.config(text=text, fg=self.app.fg_color))
+
+    def complete(self, converted: int, failed: int, total: int, note: str = "") -> None:
+        self.app.root.after(0, lambda: self.app._conversion_complete(converted, failed, total, note))
+
 
 class FLAC2AIFFApp:
     """Main application GUI."""
@@ -52,144 +80,50 @@ class FLAC2AIFFApp:
         self.input_dir = tk.StringVar()
         self.output_dir = tk.StringVar()
         self.selected_files = []  # Track selected files
-        self.file_list_data = []  # List of (input_file, output_name, status)
+        self.plan = None  # ConversionPlan behind the file list
+        self.search_index = SearchIndex()  # Tag/file-name index for the filter box
+        self.filter_text = tk.StringVar()
+        self._filter_after = None  # Pending debounced filter
+        self.loading = None  # Files the list is being read from, while a background read runs
+        self.lossy_scanning = False  # The listed FLACs are being checked for a lossy source
+        self._list_generation = 0  # Bumped whenever the list is cleared, so a stale read is dropped
+        self._rows_after = None  # Pending chunk of rows being inserted or re-attached
+        self._after_load = None  # Action waiting for the list (Convert or Dry Run clicked mid-read)
         self.is_converting = False
+        self.conversion = None  # ConversionBatch running in this window, for "Convert Next"
+        self.daemon = None  # DaemonClient running this window's batch, if a daemon took it
+        self.daemon_batch = None  # Its batch id
+        self.telemetry = Telemetry.from_env()  # Event log / metrics for unattended runs
+        self.analyze_loudness = tk.BooleanVar(value=False)  # EBU R128 pass during conversion
+        self.export_rekordbox = tk.BooleanVar(value=False)  # Write collection.xml after conversion
+        self.embed_artwork = tk.BooleanVar(value=False)  # Carry cover art into the AIFF
+        self.use_store = tk.BooleanVar(value=False)  # Reuse outputs converted for other folders
+        self.group_short = tk.BooleanVar(value=False)  # Many short files per ffmpeg process
+        self.usb_export = tk.BooleanVar(value=False)  # Encode locally, copy to the stick at the end
+        self.analyze_bpm_key = tk.BooleanVar(value=False)  # TBPM/TKEY from the conversion's own decode
+        self.hdd_order = tk.BooleanVar(value=False)  # Read sources in on-disk order, with read-ahead
+        self.layout_name = tk.StringVar(value=LAYOUTS["flat"])  # Output subfolders (display name)
+        self.lossy_mode = tk.StringVar(value=LOSSY_MODES["off"])  # Fake-lossless check (display name)
+        self.throttle = Throttle()  # Background mode - shared with the conversion thread, read live
+        self.background = tk.BooleanVar(value=False)
+        self.cpu_percent = tk.IntVar(value=int(self.throttle.cpu_share * 100))
+        self.io_mbps = tk.IntVar(value=0)  # 0 = no I/O cap
+        for var in (self.background, self.cpu_percent, self.io_mbps):
+            var.trace_add("write", self._update_throttle)
         
         self._build_ui()
     
     def _sanitize_filename(self, filename: str) -> str:
-        """Sanitize filename - remove ALL non-ASCII and special characters.
-        
-        CDJ-safe whitelist (ONLY these allowed):
-        - Basic ASCII letters: A-Z, a-z
-        - Numbers: 0-9
-        - Space
-        - Minimal safe punctuation: - _ ( )
-        
-        Everything else is REMOVED:
-        - Emojis (🕊️, etc.)
-        - Accented characters (é, ä, ø, etc.)
-        - Fancy Unicode (𝓶, etc.)
-        - All special symbols: [ ] { } , . ' + & / \ : * ? " < > | % #
-        - Control characters
-        """
-        if not filename:
-            return "Unknown"
-        
-        # Strict whitelist: ONLY ASCII letters, numbers, space, and: - _ ( )
-        sanitized = ""
-        for char in filename:
-            # Check if character is basic ASCII letter (A-Z, a-z)
-            if ('A' <= char <= 'Z') or ('a' <= char <= 'z'):
-                sanitized += char
-            # Check if character is number (0-9)
-            elif '0' <= char <= '9':
-                sanitized += char
-            # Allow space
-            elif char == ' ':
-                sanitized += ' '
-            # Allow only these safe punctuation marks
-            elif char in "-_()":
-                sanitized += char
-            # EVERYTHING ELSE IS REMOVED (emojis, Unicode, special chars, etc.)
-        
-        # Collapse multiple spaces into single space
-        sanitized = re.sub(r'\s+', ' ', sanitized)
-        
-        # Trim spaces at start and end
-        sanitized = sanitized.strip()
-        
-        # Remove trailing dots, spaces, dashes, underscores
-        sanitized = sanitized.rstrip('. -_')
-        
-        # Ensure it doesn't start with a dot, dash, or underscore
-        sanitized = sanitized.lstrip('.-_')
-        
-        # Remove any remaining problematic patterns
-        # Remove multiple dashes/underscores
-        sanitized = re.sub(r'[-_]{2,}', '-', sanitized)
-        
-        # If empty after sanitization, use fallback
-        if not sanitized:
-            sanitized = "Unknown"
-        
-        # Final check: ensure no forbidden characters remain
-        # This is a safety check - should already be clean
-        final = ""
-        for char in sanitized:
-            if (('A' <= char <= 'Z') or ('a' <= char <= 'z') or 
-                ('0' <= char <= '9') or char == ' ' or char in "-_()"):
-                final += char
-        sanitized = final.strip() or "Unknown"
-        
-        return sanitized
+        """Sanitize filename - CDJ-safe ASCII whitelist (see core.sanitize_filename)."""
+        return sanitize_filename(filename)
     
     def _get_tags_from_file(self, file_path: Path) -> dict:
         """Extract tags from audio file."""
-        tags = {}
-        try:
-            if file_path.suffix.lower() == '.flac':
-                audio = FLAC(str(file_path))
-            elif file_path.suffix.lower() == '.mp3':
-                audio = MP3(str(file_path))
-            else:
-                return tags
-            
-            # Common tag fields
-            tag_fields = {
-                'artist': ['artist', 'ARTIST', 'TPE1'],
-                'title': ['title', 'TITLE', 'TIT2'],
-                'album': ['album', 'ALBUM', 'TALB'],
-                'label': ['label', 'LABEL', 'TPUB', 'organization', 'ORGANIZATION'],
-                'year': ['year', 'YEAR', 'date', 'DATE', 'TDRC'],
-                'tracknumber': ['tracknumber', 'TRACKNUMBER', 'TRACK', 'TRCK'],
-            }
-            
-            for key, possible_fields in tag_fields.items():
-                for field in possible_fields:
-                    if field in audio:
-                        value = audio[field]
-                        if isinstance(value, list) and value:
-                            tags[key] = str(value[0]).strip()
-                            break
-                    # Try lowercase
-                    field_lower = field.lower()
-                    for tag_key in audio.keys():
-                        if tag_key.lower() == field_lower:
-                            value = audio[tag_key]
-                            if isinstance(value, list) and value:
-                                tags[key] = str(value[0]).strip()
-                                break
-                    if key in tags:
-                        break
-        except Exception:
-            pass
-        
-        return tags
+        return get_tags_from_file(file_path)
     
     def _build_filename_from_tags(self, file_path: Path, tags: dict) -> str:
         """Build filename from tags using template: Artist - Title."""
-        artist = tags.get('artist', '').strip()
-        title = tags.get('title', '').strip()
-        
-        # Fallback to original filename if tags missing
-        if not artist and not title:
-            return file_path.stem
-        
-        # Build filename: "Artist - Title"
-        if artist and title:
-            filename = f"{artist} - {title}"
-        elif artist:
-            filename = artist
-        elif title:
-            filename = title
-        else:
-            filename = file_path.stem
-        
-        # Sanitize the filename
-        filename = self._sanitize_filename(filename)
-        
-        return filename
+        return build_filename_from_tags(file_path, tags)
     
     def _set_app_icon(self) -> None:
         """Set the application icon."""
@@ -341,6 +275,33 @@ class FLAC2AIFFApp:
         output_button.grid(row=row, column=2, padx=5, pady=12)
         row += 1
         
+        # Filter - instant search over tags and file names
+        filter_label = tk.Label(
+            main_frame,
+            text="Filter:",
+            font=("SF Pro Text", 11, "normal"),
+            bg=self.bg_color,
+            fg=self.fg_color
+        )
+        filter_label.grid(row=row, column=0, sticky=tk.W, pady=(12, 0))
+        
+        filter_entry = tk.Entry(
+            main_frame,
+            textvariable=self.filter_text,
+            font=("SF Pro Text", 11, "normal"),
+            bg=self.secondary_bg,
+            fg=self.fg_color,
+            insertbackground=self.fg_color,
+            relief=tk.FLAT,
+            borderwidth=1,
+            highlightthickness=1,
+            highlightbackground=self.border_color,
+            highlightcolor="#007acc"
+        )
+        filter_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=15, pady=(12, 0), ipady=8)
+        self.filter_text.trace_add("write", self._schedule_filter)
+        row += 1
+        
         # File list with scrollbar
         list_frame = tk.Frame(main_frame, bg=self.bg_color)
         list_frame.grid(row=row, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=20)
@@ -416,6 +377,72 @@ class FLAC2AIFFApp:
         # scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         row += 1
         
+        # Options - Cursor style checkboxes
+        options_frame = tk.Frame(main_frame, bg=self.bg_color)
+        options_frame.grid(row=row, column=0, columnspan=3, sticky=tk.W)
+        
+        self._add_option(options_frame, "Analyze loudness (EBU R128, writes ReplayGain tags)", self.analyze_loudness)
+        self._add_option(options_frame, "Export Rekordbox collection.xml", self.export_rekordbox)
+        self._add_option(options_frame, "Embed cover art", self.embed_artwork)
+        self._add_option(options_frame, "Reuse earlier conversions (output store)", self.use_store)
+        self._add_option(options_frame, "Batch short files (one-shots) into shared ffmpeg runs", self.group_short)
+        self._add_option(options_frame, "USB stick export (encode locally, copy at the end)", self.usb_export)
+        bpm_key_option = self._add_option(options_frame, "Analyze BPM and key (needs NumPy)", self.analyze_bpm_key)
+        if not HAS_NUMPY:
+            bpm_key_option.config(state=tk.DISABLED)
+        self._add_option(options_frame, "Spinning disk (read files in on-disk order)", self.hdd_order)
+        row += 1
+        
+        # Output layout - subfolders by tags or alphabetical buckets instead of one flat folder
+        layout_frame = tk.Frame(main_frame, bg=self.bg_color)
+        layout_frame.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+        
+        tk.Label(
+            layout_frame,
+            text="Output layout:",
+            font=("SF Pro Text", 10, "normal"),
+            bg=self.bg_color,
+            fg=self.fg_color
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        layout_box = ttk.Combobox(
+            layout_frame,
+            textvariable=self.layout_name,
+            values=list(LAYOUTS.values()),
+            state="readonly",
+            width=20
+        )
+        layout_box.pack(side=tk.LEFT)
+        
+        # Fake lossless - FLACs decoded from MP3s, found by their spectrum before converting
+        tk.Label(
+            layout_frame,
+            text="Fake lossless:",
+            font=("SF Pro Text", 10, "normal"),
+            bg=self.bg_color,
+            fg=self.fg_color
+        ).pack(side=tk.LEFT, padx=(20, 10))
+        
+        lossy_box = ttk.Combobox(
+            layout_frame,
+            textvariable=self.lossy_mode,
+            values=list(LOSSY_MODES.values()),
+            state="readonly" if HAS_NUMPY else tk.DISABLED,
+            width=14
+        )
+        lossy_box.pack(side=tk.LEFT)
+        lossy_box.bind("<<ComboboxSelected>>", lambda e: self._scan_lossy())
+        row += 1
+        
+        # Background mode - can be switched and tuned while a batch runs
+        background_frame = tk.Frame(main_frame, bg=self.bg_color)
+        background_frame.grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+        
+        self._add_option(background_frame, "Background mode (low priority)", self.background)
+        self._add_scale(background_frame, "CPU %", self.cpu_percent, 5, 100)
+        self._add_scale(background_frame, "I/O MB/s (0 = no cap)", self.io_mbps, 0, 200)
+        row += 1
+        
         # Status area - Cursor style
         self.status_label = tk.Label(
             main_frame,
@@ -428,30 +455,164 @@ class FLAC2AIFFApp:
         row += 1
         
         # Start button - Use ttk.Button with dark style for macOS compatibility
+        buttons_frame = tk.Frame(main_frame, bg=self.bg_color)
+        buttons_frame.grid(row=row, column=0, columnspan=3, pady=25)
+        
         self.start_button = ttk.Button(
-            main_frame,
+            buttons_frame,
             text="Start Conversion",
             command=self._start_conversion,
             style="Dark.TButton"
         )
-        self.start_button.grid(row=row, column=0, columnspan=3, pady=25)
+        self.start_button.pack(side=tk.LEFT, padx=5)
+        
+        self.selected_button = ttk.Button(
+            buttons_frame,
+            text="Convert Selected",
+            command=lambda: self._start_conversion(selected_only=True),
+            style="Dark.TButton"
+        )
+        self.selected_button.pack(side=tk.LEFT, padx=5)
+        
+        dry_run_button = ttk.Button(
+            buttons_frame,
+            text="Dry Run",
+            command=self._dry_run,
+            style="Dark.TButton"
+        )
+        dry_run_button.pack(side=tk.LEFT, padx=5)
+        
+        # Reorder work - also while a batch is running
+        convert_next_button = ttk.Button(
+            buttons_frame,
+            text="Convert Next",
+            command=self._prioritize,
+            style="Dark.TButton"
+        )
+        convert_next_button.pack(side=tk.LEFT, padx=5)
+        
+        move_top_button = ttk.Button(
+            buttons_frame,
+            text="Move to Top",
+            command=lambda: self._prioritize(move_rows=True),
+            style="Dark.TButton"
+        )
+        move_top_button.pack(side=tk.LEFT, padx=5)
+        
+        cancel_button = ttk.Button(
+            buttons_frame,
+            text="Cancel Selected",
+            command=self._cancel_selected,
+            style="Dark.TButton"
+        )
+        cancel_button.pack(side=tk.LEFT, padx=5)
+    
+    def _add_option(self, parent: tk.Frame, text: str, variable: tk.Variable) -> tk.Checkbutton:
+        """Add an option checkbox - laid out two per row."""
+        index = len(parent.grid_slaves())
+        check = tk.Checkbutton(
+            parent,
+            text=text,
+            variable=variable,
+            font=("SF Pro Text", 10, "normal"),
+            bg=self.bg_color,
+            fg=self.fg_color,
+            activebackground=self.bg_color,
+            activeforeground="#ffffff",
+            selectcolor=self.secondary_bg,
+            highlightthickness=0,
+            borderwidth=0
+        )
+        check.grid(row=index // 2, column=index % 2, sticky=tk.W, padx=(0, 20))
+        return check
+    
+    def _add_scale(self, parent: tk.Frame, text: str, variable: tk.Variable,
+                   low: int, high: int) -> tk.Scale:
+        """Add a labelled slider to the right of the widgets already in the row."""
+        scale = tk.Scale(
+            parent,
+            label=text,
+            variable=variable,
+            from_=low,
+            to=high,
+            orient=tk.HORIZONTAL,
+            length=160,
+            font=("SF Pro Text", 9, "normal"),
+            bg=self.bg_color,
+            fg=self.fg_color,
+            troughcolor=self.secondary_bg,
+            activebackground=self.accent_color,
+            highlightthickness=0,
+            borderwidth=0
+        )
+        scale.grid(row=0, column=len(parent.grid_slaves()), sticky=tk.W, padx=(0, 20))
+        return scale
+    
+    def _update_throttle(self, *args) -> None:
+        """Copy the background controls into the shared Throttle - running children follow within a cycle."""
+        try:
+            self.throttle.cpu_share = self.cpu_percent.get() / 100
+            self.throttle.io_mbps = self.io_mbps.get()
+        except tk.TclError:
+            return  # Half-typed value
+        self.throttle.enabled = self.background.get()
+    
+    def _get_options(self) -> dict:
+        """Snapshot the option checkboxes for the conversion thread (Tk vars are main-thread only)."""
+        return {
+            'analyze_loudness': self.analyze_loudness.get(),
+            'export_rekordbox': self.export_rekordbox.get(),
+            'embed_artwork': self.embed_artwork.get(),
+            'use_store': self.use_store.get(),
+            'group_size': self._group_size() if self.group_short.get() else 1,
+            'usb_export': self.usb_export.get(),
+            'analyze_bpm_key': self.analyze_bpm_key.get() and HAS_NUMPY,
+            'layout': self._output_layout(),
+            'lossy_mode': self._lossy_mode_key(),
+            'hdd_order': self.hdd_order.get(),
+        }
+    
+    def _lossy_mode_key(self) -> str:
+        """LOSSY_MODES key of the mode picked in the combobox."""
+        return next((key for key, name in LOSSY_MODES.items() if name == self.lossy_mode.get()), "off")
+    
+    def _input_order(self, files: list) -> list:
+        """Input files in on-disk order on spinning disks (fewer seeks), otherwise as given."""
+        return disk_order(files) if self.hdd_order.get() else list(files)
+    
+    def _output_layout(self) -> OutputLayout:
+        """The chosen layout; bucket size from AIFFMEPLEASE_BUCKET_SIZE, else BUCKET_SIZE."""
+        scheme = next((key for key, name in LAYOUTS.items() if name == self.layout_name.get()), "flat")
+        try:
+            bucket_size = max(1, int(os.environ.get("AIFFMEPLEASE_BUCKET_SIZE", BUCKET_SIZE)))
+        except ValueError:
+            bucket_size = BUCKET_SIZE
+        return OutputLayout(scheme, bucket_size)
+    
+    def _group_size(self) -> int:
+        """Files per grouped ffmpeg run - GROUP_SIZE unless AIFFMEPLEASE_GROUP_SIZE says otherwise."""
+        try:
+            return max(2, int(os.environ.get("AIFFMEPLEASE_GROUP_SIZE", GROUP_SIZE)))
+        except ValueError:
+            return GROUP_SIZE
     
     def _select_input_folder(self) -> None:
         """Select input files or folder."""
         # Allow selecting files (FLAC or MP3)
         files = filedialog.askopenfilenames(
-            title="Select FLAC or MP3 files (or cancel to select folder)",
+            title="Select FLAC or MP3 files or ZIP/TAR archives (or cancel to select folder)",
             filetypes=[
-                ("Audio files", "*.flac *.mp3"),
+                ("Audio files and archives", "*.flac *.mp3 *.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz"),
                 ("FLAC files", "*.flac"),
                 ("MP3 files", "*.mp3"),
+                ("Archives", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz"),
                 ("All files", "*.*")
             ]
         )
         
         if files:
             # Files selected - store them and use their parent directory
-            file_paths = [Path(f) for f in files]
+            file_paths = self._input_order([Path(f) for f in files])
             self.selected_files = file_paths  # Store selected files
             
             if file_paths:
@@ -491,7 +652,7 @@ class FLAC2AIFFApp:
                 self.input_dir.set(str(folder_path))
                 # When folder is selected, find all audio files in it
                 try:
-                    audio_files = list(folder_path.rglob("*.flac")) + list(folder_path.rglob("*.mp3"))
+                    audio_files = self._input_order(find_audio_inputs(folder_path))
                     self.selected_files = audio_files  # Store all found files
                     count = len(audio_files)
                     if count > 0:
@@ -522,71 +683,307 @@ class FLAC2AIFFApp:
                     self.output_dir.set(str(output_path))
     
     def _clear_file_list(self) -> None:
-        """Clear the file list display."""
-        for item in self.file_tree.get_children():
-            self.file_tree.delete(item)
-        self.file_list_data = []
+        """Clear the file list display, dropping a read or row chunks still in progress."""
+        self._list_generation += 1
+        self.loading = None
+        self.lossy_scanning = False
+        self._after_load = None
+        if self._rows_after is not None:
+            self.root.after_cancel(self._rows_after)
+            self._rows_after = None
+        
+        # Rows hidden by the filter are detached, not children - delete them too
+        if self.plan is not None:
+            items = [job.item for job in self.plan.jobs if job.item and self.file_tree.exists(job.item)]
+        else:
+            items = self.file_tree.get_children()
+        if items:
+            self.file_tree.delete(*items)
+        self.plan = None
+        self.search_index.clear()
+    
+    def _safe_display(self, text: str, max_len: int = 45) -> str:
+        """Convert to safe ASCII for Treeview display."""
+        # Sanitize display text to avoid TclError with Unicode characters
+        # Only allow ASCII for display in Treeview
+        safe = ""
+        for char in text:
+            # Only allow ASCII printable characters
+            if 32 <= ord(char) <= 126:  # Printable ASCII
+                safe += char
+            elif char == '\n' or char == '\t':
+                safe += ' '
+            # Skip all other characters (Unicode, emojis, etc.)
+        safe = safe.strip()
+        if len(safe) > max_len:
+            safe = safe[:max_len-3] + "..."
+        return safe or "Unknown"
     
     def _update_file_list(self, files: list) -> None:
-        """Update the file list display with selected files and their output names."""
+        """Plan the selected files in a background thread and show them with their output names.
+        
+        Rows stream into the list as files are probed, ROW_CHUNK per event-loop turn;
+        self.plan is set once every file is in.
+        """
         # Clear existing items
         self._clear_file_list()
-        
-        # Build list data
-        self.file_list_data = []
-        for file_path in files:
-            # Get tags and build output name (already sanitized)
-            tags = self._get_tags_from_file(file_path)
-            output_name = self._build_filename_from_tags(file_path, tags) + ".aiff"
-            
-            # Store data
-            self.file_list_data.append({
-                'input': file_path,
-                'output': output_name,
-                'status': 'Pending'
-            })
-            
-            # Sanitize display text to avoid TclError with Unicode characters
-            # Only allow ASCII for display in Treeview
-            def safe_display(text: str, max_len: int = 45) -> str:
-                """Convert to safe ASCII for Treeview display."""
-                safe = ""
-                for char in text:
-                    # Only allow ASCII printable characters
-                    if 32 <= ord(char) <= 126:  # Printable ASCII
-                        safe += char
-                    elif char == '\n' or char == '\t':
-                        safe += ' '
-                    # Skip all other characters (Unicode, emojis, etc.)
-                safe = safe.strip()
-                if len(safe) > max_len:
-                    safe = safe[:max_len-3] + "..."
-                return safe or "Unknown"
-            
-            # Add to treeview - sanitize for display
-            input_display = safe_display(file_path.name)
-            output_display = safe_display(output_name)
+        generation = self._list_generation
+        self.loading = list(files)
+        probed = []  # Jobs probed by the thread and not shown yet
+        finished = []  # The plan, once the thread is done
+        shown = 0
+        readahead = self.hdd_order.get()
+        
+        def read():
+            # Probe every file once - the conversion reuses this plan as-is
+            try:
+                plan = ConversionPlan.build(files, readahead=readahead, on_jobs=probed.extend)
+            except Exception as e:
+                print(f"Could not read the files: {e}")
+                plan = ConversionPlan([], files)
+            finished.append(plan)
+        
+        def show():
+            nonlocal shown
+            self._rows_after = None
+            if generation != self._list_generation:
+                return
+            done = bool(finished)  # Checked first - the thread may add rows until it is set
+            chunk = probed[:ROW_CHUNK]
+            del probed[:ROW_CHUNK]
+            for job in chunk:
+                # Add to treeview - sanitize for display
+                job.item = self.file_tree.insert("", tk.END, values=(
+                    self._safe_display(job.display_name),
+                    self._safe_display(job.output_name),
+                    job.status
+                ))
+                self.search_index.add(job)
+            shown += len(chunk)
             
-            self.file_tree.insert("", tk.END, values=(input_display, output_display, "Pending"))
+            if not done or probed:
+                self.status_label.config(text=f"Reading tags... {shown} file(s) listed", fg=self.fg_color)
+                self._rows_after = self.root.after(1 if probed else 50, show)
+                return
+            self._list_loaded(finished[0])
+        
+        threading.Thread(target=read, daemon=True).start()
+        self._rows_after = self.root.after(50, show)
+    
+    def _list_loaded(self, plan: ConversionPlan) -> None:
+        """Every row is in: keep the plan, apply the filter and run an action that waited for it."""
+        self.plan = plan
+        self.loading = None
+        if self.filter_text.get().strip():
+            self._apply_filter()
+        else:
+            self.status_label.config(text=f"{len(plan.jobs)} file(s) to convert", fg=self.fg_color)
+        
+        # An action that waited for the list waits for the lossy check as well
+        if self._scan_lossy():
+            return
+        then, self._after_load = self._after_load, None
+        if then is not None:
+            then()
+    
+    def _scan_lossy(self) -> bool:
+        """Check the listed FLACs for a lossy source in a background thread and flag their rows.
+        
+        The batch keeps these verdicts, so Convert only checks files changed since.
+        Returns True if a check was started.
+        """
+        if self.plan is None or self.lossy_scanning or self._lossy_mode_key() == "off" or not HAS_NUMPY:
+            return False
+        jobs = [job for job in self.plan.jobs if not job.lossy_checked]
+        if not jobs:
+            return False
+        generation = self._list_generation
+        ffmpeg_path = self._find_ffmpeg()
+        self.lossy_scanning = True
+        self.status_label.config(text=f"Checking {len(jobs)} file(s) for lossy sources...", fg=self.fg_color)
+        
+        def scan():
+            try:
+                scanner = LossyScanner(ffmpeg_path)
+                scanner.flag(jobs)
+                for source, error in scanner.errors:
+                    print(f"Lossy source check: {source.name}: {error}")
+            except Exception as e:
+                print(f"Lossy source check unavailable: {e}")
+            self.root.after(0, scanned)
+        
+        def scanned():
+            if generation != self._list_generation:
+                return
+            self.lossy_scanning = False
+            for job in jobs:
+                if job.lossy_cutoff and job.status == "Pending":
+                    self._update_file_status(job, describe(job.lossy_cutoff))
+            suspects = sum(1 for job in self.plan.jobs if job.lossy_cutoff)
+            self.status_label.config(text=f"{len(self.plan.jobs)} file(s) to convert, "
+                                          f"{suspects} lossy suspect(s)", fg=self.fg_color)
+            then, self._after_load = self._after_load, None
+            if then is not None:
+                then()
+        
+        threading.Thread(target=scan, daemon=True).start()
+        return True
+    
+    def _refresh_file_row(self, job: Job) -> None:
+        """Show a re-probed job's output name in its row."""
+        self.search_index.add(job)  # Tags may have changed
+        if job.item and self.file_tree.exists(job.item):
+            self.file_tree.set(job.item, "output", self._safe_display(job.output_name))
+    
+    def _schedule_filter(self, *args) -> None:
+        """Filter shortly after typing stops rather than on every keystroke."""
+        if self._filter_after is not None:
+            self.root.after_cancel(self._filter_after)
+        self._filter_after = self.root.after(150, self._apply_filter)
     
-    def _update_file_status(self, index: int, status: str) -> None:
+    def _filtered_jobs(self) -> list:
+        """Planned jobs matching the filter box, in plan order."""
+        if self.plan is None:
+            return []
+        matches = self.search_index.search(self.filter_text.get())
+        if matches is None:
+            return list(self.plan.jobs)
+        return [job for job in self.plan.jobs if job in matches]
+    
+    def _apply_filter(self) -> None:
+        """Show only the rows matching the filter box (hidden rows are detached, not deleted)."""
+        self._filter_after = None
+        if self.plan is None:
+            return
+        
+        jobs = self._filtered_jobs()
+        rows = [job.item for job in jobs if job.item]
+        # One set_children over every row blocks the window on a big list - the first
+        # chunk replaces the rows at once, the rest are appended a chunk per turn
+        if self._rows_after is not None:
+            self.root.after_cancel(self._rows_after)
+        self.file_tree.set_children("", *rows[:ROW_CHUNK])
+        self._rows_after = self.root.after(1, self._attach_rows, rows, ROW_CHUNK)
+        if self.filter_text.get().strip():
+            self.status_label.config(
+                text=f"Showing {len(jobs)} of {len(self.plan.jobs)} file(s)",
+                fg=self.fg_color
+            )
+        elif not self.is_converting:
+            self.status_label.config(
+                text=f"{len(self.plan.jobs)} file(s) to convert",
+                fg=self.fg_color
+            )
+    
+    def _attach_rows(self, rows: list, start: int) -> None:
+        """Append rows[start:] to the list, ROW_CHUNK now and the rest on later turns."""
+        self._rows_after = None
+        for item in rows[start:start + ROW_CHUNK]:
+            self.file_tree.move(item, "", tk.END)
+        if start + ROW_CHUNK < len(rows):
+            self._rows_after = self.root.after(1, self._attach_rows, rows, start + ROW_CHUNK)
+    
+    def _update_file_status(self, job: Job, status: str) -> None:
         """Update status of a file in the list."""
-        if 0 <= index < len(self.file_list_data):
-            self.file_list_data[index]['status'] = status
-            # Update treeview
-            items = list(self.file_tree.get_children())
-            if 0 <= index < len(items):
-                item = items[index]
-                current_values = list(self.file_tree.item(item, 'values'))
-                if len(current_values) >= 3:
-                    # Sanitize status text for display
-                    safe_status = ""
-                    for char in status:
-                        if 32 <= ord(char) <= 126:  # Printable ASCII
-                            safe_status += char
-                    safe_status = safe_status or status[:10]  # Fallback
-                    current_values[2] = safe_status
-                    self.file_tree.item(item, values=tuple(current_values))
+        # Finished suspects keep their lossy flag visible
+        if job.lossy_cutoff and status.startswith(("Done", "Staged", "Up to date", "Retagged")):
+            status = f"{status}, {describe(job.lossy_cutoff)}"
+        job.status = status
+        if job.item and self.file_tree.exists(job.item):
+            # Sanitize status text for display
+            safe_status = ""
+            for char in status:
+                if 32 <= ord(char) <= 126:  # Printable ASCII
+                    safe_status += char
+            safe_status = safe_status or status[:10]  # Fallback
+            self.file_tree.set(job.item, "status", safe_status)
+    
+    def _prioritize(self, move_rows: bool = False) -> None:
+        """Convert the selected rows as soon as the current job finishes.
+        
+        With move_rows (or between batches) the rows also move to the top of the
+        list, so the next batch starts with them too.
+        """
+        chosen = self._selected_jobs("Select the rows to convert first")
+        if not chosen:
+            return
+        
+        if move_rows or not self.is_converting:
+            chosen_set = set(chosen)
+            self.plan.jobs = chosen + [job for job in self.plan.jobs if job not in chosen_set]
+            for index, job in enumerate(chosen):
+                self.file_tree.move(job.item, "", index)
+        
+        if self.daemon_batch is not None:
+            self._ask_daemon(self.daemon.promote, chosen, 'promoted', "Next",
+                             lambda count: f"{count} file(s) will convert next")
+            return
+        
+        promoted = []
+        for queue in self.conversion.job_queues if self.conversion else []:
+            promoted += queue.promote(chosen)
+        for job in promoted:
+            self._update_file_status(job, "Next")
+        
+        if self.is_converting:
+            text = f"{len(promoted)} file(s) will convert next"
+        else:
+            text = f"Moved {len(chosen)} file(s) to the top"
+        self.status_label.config(text=text, fg="#89d185")
+    
+    def _ask_daemon(self, request, chosen: list, field: str, status: str, describe_count) -> None:
+        """Send a promote/cancel request for the chosen jobs to the daemon, off the Tk thread.
+        
+        The daemon answers over its socket, which can take a moment while it is busy;
+        the rows it accepted get status and the status line describe_count(accepted).
+        """
+        batch_id = self.daemon_batch
+        keys = [job.key for job in chosen]
+        
+        def ask():
+            try:
+                accepted = set(request(batch_id, keys)[field])
+            except (OSError, ValueError) as e:
+                print(f"Could not reach the conversion daemon: {e}")
+                accepted = set()
+            self.root.after(0, lambda: show([job for job in chosen if job.key in accepted]))
+        
+        def show(jobs):
+            for job in jobs:
+                self._update_file_status(job, status)
+            self.status_label.config(text=describe_count(len(jobs)), fg="#89d185")
+        
+        threading.Thread(target=ask, daemon=True).start()
+    
+    def _selected_jobs(self, empty_message: str) -> list:
+        """Jobs of the highlighted rows; warns with empty_message if there are none."""
+        if self.plan is None:
+            return []
+        by_item = {job.item: job for job in self.plan.jobs}
+        chosen = [by_item[item] for item in self.file_tree.selection() if item in by_item]
+        if not chosen:
+            messagebox.showwarning("No Files", empty_message)
+        return chosen
+    
+    def _cancel_selected(self) -> None:
+        """Drop the selected rows from the running batch - files already converting finish."""
+        if not self.is_converting:
+            return
+        chosen = self._selected_jobs("Select the rows to cancel first")
+        if not chosen:
+            return
+        
+        if self.daemon_batch is not None:
+            self._ask_daemon(self.daemon.cancel, chosen, 'cancelled', "Cancelled",
+                             lambda count: f"{count} file(s) cancelled")
+            return
+        
+        cancelled = []
+        for queue in self.conversion.job_queues if self.conversion else []:
+            cancelled += queue.take(chosen)
+        for job in cancelled:
+            self._update_file_status(job, "Cancelled")
+        self.status_label.config(text=f"{len(cancelled)} file(s) cancelled", fg="#89d185")
     
     def _select_output_folder(self) -> None:
         """Select output folder."""
@@ -601,71 +998,138 @@ class FLAC2AIFFApp:
     
     def _find_ffmpeg(self) -> str:
         """Find ffmpeg binary."""
-        # Try common locations first
-        common_paths = [
-            "/opt/homebrew/bin/ffmpeg",  # Apple Silicon Homebrew
-            "/usr/local/bin/ffmpeg",     # Intel Homebrew
-            "/usr/bin/ffmpeg",           # System
-        ]
-        
-        for path in common_paths:
-            if Path(path).exists():
-                return path
-        
-        # Try system PATH
-        try:
-            result = subprocess.run(["which", "ffmpeg"], capture_output=True, check=True, timeout=2)
-            path = result.stdout.decode().strip()
-            if path:
-                return path
-        except:
-            pass
-        
-        # Try bundled location
-        script_dir = Path(__file__).parent.parent
-        bundled = script_dir / "resources" / "ffmpeg" / "ffmpeg"
-        if bundled.exists():
-            return str(bundled)
-        
-        return "ffmpeg"  # Fallback
-    
-    def _start_conversion(self) -> None:
-        """Start conversion process."""
+        return find_ffmpeg()
+    
+    def _collect_jobs(self, create_output: bool = True, selected_only: bool = False, then=None):
+        """Validate the folders and return (jobs, output_path), or None after showing an error.
+        
+        Reuses the previewed plan when it covers the files - only changed sources are re-read.
+        Only jobs matching the filter box are returned; with selected_only, only the
+        highlighted rows among them. While the list is still being read this returns
+        None, and then() runs once it is in.
+        """
         # Validate inputs
         input_path_str = self.input_dir.get().strip()
         if not input_path_str:
             messagebox.showerror("Error", "Please select an input folder")
-            return
+            return None
         
         input_path = Path(input_path_str)
         if not input_path.exists() or not input_path.is_dir():
             messagebox.showerror("Error", f"Input folder does not exist:\n{input_path}")
-            return
+            return None
         
         output_path_str = self.output_dir.get().strip()
         if not output_path_str:
             messagebox.showerror("Error", "Please select an output folder")
-            return
+            return None
         
         output_path = Path(output_path_str)
-        try:
-            output_path.mkdir(parents=True, exist_ok=True)
-        except Exception as e:
-            messagebox.showerror("Error", f"Cannot create output directory:\n{str(e)}")
-            return
+        if create_output:
+            try:
+                output_path.mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                messagebox.showerror("Error", f"Cannot create output directory:\n{str(e)}")
+                return None
         
         # Use selected files if available, otherwise find all in folder
         if self.selected_files:
-            audio_files = self.selected_files
+            audio_files = self._input_order(self.selected_files)
         else:
-            audio_files = list(input_path.rglob("*.flac")) + list(input_path.rglob("*.mp3"))
+            audio_files = self._input_order(find_audio_inputs(input_path))
         
         if not audio_files:
             messagebox.showwarning("No Files", "No files selected or found in the input folder")
+            return None
+        
+        if self.plan is None or self.plan.sources() != list(audio_files):
+            if self.loading != list(audio_files):
+                self._update_file_list(audio_files)
+            self._after_load = then
+            return None
+        elif self.lossy_scanning:
+            # Convert runs once the lossy check is done and reuses its verdicts
+            self._after_load = then
+            return None
+        else:
+            for job in self.plan.refresh():
+                self._refresh_file_row(job)
+        
+        jobs = self._filtered_jobs()
+        if selected_only:
+            selection = set(self.file_tree.selection())
+            jobs = [job for job in jobs if job.item in selection]
+        if not jobs:
+            messagebox.showwarning(
+                "No Files",
+                "No rows selected" if selected_only else "No files match the filter"
+            )
+            return None
+        return jobs, output_path
+    
+    def _dry_run(self) -> None:
+        """Show what a conversion would do - names, collisions, size and time - without converting."""
+        collected = self._collect_jobs(create_output=False, then=self._dry_run)
+        if not collected:
             return
+        jobs, output_path = collected
+        
+        report = dry_run(jobs, output_path, self._output_layout())
+        for line in report_lines(report):
+            print(line)
         
-        # Check ffmpeg
+        # Show the final names (collisions numbered) in the file list
+        for job, (_, planned) in zip(jobs, report.renames):
+            if job.item and self.file_tree.exists(job.item):
+                self.file_tree.set(job.item, "output", self._safe_display(planned.name))
+        
+        self.status_label.config(
+            text=f"Dry run: {len(jobs)} file(s), {format_bytes(report.output_bytes)}",
+            fg="#89d185" if report.fits else "#f48771"
+        )
+        self._show_custom_message("Dry Run", "\n".join(summary_lines(report)), "info")
+    
+    def _start_conversion(self, selected_only: bool = False) -> None:
+        """Start conversion of the filtered files (or only the selected rows)."""
+        collected = self._collect_jobs(selected_only=selected_only,
+                                       then=lambda: self._start_conversion(selected_only))
+        if not collected:
+            return
+        jobs, output_path = collected
+        
+        # A running conversion daemon takes the batch, so every window and script
+        # shares one queue and the machine's cores; otherwise it runs here
+        daemon = DaemonClient.connect()
         ffmpeg_path = self._find_ffmpeg()
+        if daemon is None and not self._check_ffmpeg(ffmpeg_path):
+            return
+        
+        # Disable start button - Cursor style disabled state
+        self.start_button.config(state=tk.DISABLED)
+        self.selected_button.config(state=tk.DISABLED)
+        # Get style object
+        style = ttk.Style()
+        style.configure("Dark.TButton",
+            background="#0d0d0d",
+            foreground="#666666"  # Darker gray when disabled
+        )
+        self.is_converting = True
+        self.status_label.config(text=f"Converting {len(jobs)} file(s)...", fg=self.fg_color)
+        
+        # Rows picked by hand are converted even if they are quarantined
+        options = self._get_options()
+        options['retry_quarantined'] = selected_only
+        
+        # Run conversion in thread
+        if daemon is not None:
+            target, args = self._convert_with_daemon, (daemon, jobs, output_path, options)
+        else:
+            target, args = self._convert_files, (jobs, output_path, ffmpeg_path, options)
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+    
+    def _check_ffmpeg(self, ffmpeg_path: str) -> bool:
+        """Check that ffmpeg runs; shows how to install it and returns False if it doesn't."""
         try:
             result = subprocess.run(
                 [ffmpeg_path, "-version"],
@@ -684,7 +1148,7 @@ class FLAC2AIFFApp:
                 f"Or download from: https://evermeet.cx/ffmpeg/\n\n"
                 f"Then restart the app."
             )
-            return
+            return False
         except Exception as e:
             messagebox.showerror(
                 "FFmpeg Error",
@@ -693,103 +1157,77 @@ class FLAC2AIFFApp:
                 f"Error: {str(e)}\n\n"
                 f"Please check your ffmpeg installation."
             )
-            return
-        
-        # Disable start button - Cursor style disabled state
-        self.start_button.config(state=tk.DISABLED)
-        # Get style object
-        style = ttk.Style()
-        style.configure("Dark.TButton",
-            background="#0d0d0d",
-            foreground="#666666"  # Darker gray when disabled
-        )
-        self.is_converting = True
-        self.status_label.config(text=f"Converting {len(audio_files)} file(s)...", fg=self.fg_color)
-        
-        # Run conversion in thread
-        thread = threading.Thread(
-            target=self._convert_files,
-            args=(audio_files, output_path, ffmpeg_path),
-            daemon=True
-        )
-        thread.start()
+            return False
+        return True
+    
+    def _report_progress(self, job: Job, position: int, total: int, percent: int, eta: str) -> None:
+        """Show per-file percent and batch ETA (runs on the Tk thread)."""
+        self._update_file_status(job, f"Converting {percent}%")
+        text = f"Converting {position} of {total} files - {percent}%"
+        if eta:
+            text += f" - ETA {eta}"
+        self.status_label.config(text=text, fg=self.fg_color)
     
-    def _convert_files(self, audio_files: list, output_dir: Path, ffmpeg_path: str) -> None:
-        """Convert audio files (FLAC/MP3) to AIFF."""
-        converted = 0
-        failed = 0
+    def _convert_files(self, jobs: list, output_dir: Path, ffmpeg_path: str,
+                       options: dict = None) -> None:
+        """Convert planned jobs (FLAC/MP3) to AIFF on this thread, showing progress in the window."""
+        batch = ConversionBatch(jobs, output_dir, ffmpeg_path, options, _WindowEvents(self),
+                                self.telemetry, self.throttle)
+        self.conversion = batch
+        try:
+            batch.run()
+        finally:
+            self.conversion = None
+    
+    def _convert_with_daemon(self, daemon: DaemonClient, jobs: list, output_dir: Path, options: dict) -> None:
+        """Hand the batch to the conversion daemon and mirror its events in the file list.
         
-        for i, audio_path in enumerate(audio_files, 1):
-            try:
-                # Get tags from file
-                tags = self._get_tags_from_file(audio_path)
-                
-                # Build filename from tags
-                clean_name = self._build_filename_from_tags(audio_path, tags)
-                output_filename = clean_name + ".aiff"
-                output_path = output_dir / output_filename
-                
-                # Handle collisions - sanitize the collision number too
-                counter = 1
-                original_output = output_path
-                while output_path.exists():
-                    collision_name = self._sanitize_filename(f"{clean_name} ({counter})")
-                    output_path = output_dir / f"{collision_name}.aiff"
-                    counter += 1
-                
-                # Update file status in list
-                self.root.after(0, lambda idx=i-1: self._update_file_status(idx, "Converting"))
-                
-                # Update main status
-                self.root.after(0, lambda c=i, t=len(audio_files): 
-                    self.status_label.config(
-                        text=f"Converting {c} of {t} files...",
-                        fg=self.fg_color
+        Runs on the conversion thread, like _convert_files. The planned jobs are
+        sent as they are, so the daemon converts them without probing again.
+        """
+        by_key = {job.key: job for job in jobs}
+        result = None
+        try:
+            events = daemon.submit(jobs, output_dir, options, watch=True)
+            for event in events:
+                kind = event.get('event')
+                job = by_key.get(event.get('job'))
+                if kind is None:
+                    # The reply to the submit itself
+                    self.daemon, self.daemon_batch = daemon, event['batch']
+                    if event['position'] > 1:
+                        self.root.after(0, lambda n=event['position'] - 1: self.status_label.config(
+                            text=f"Waiting for {n} batch(es) ahead in the conversion daemon...",
+                            fg=self.fg_color
+                        ))
+                elif kind == "status" and job is not None:
+                    self.root.after(0, lambda j=job, s=event['status']: self._update_file_status(j, s))
+                elif kind == "progress" and job is not None:
+                    self.root.after(0, lambda j=job, e=event: self._report_progress(
+                        j, e['index'], e['total'], e['percent'], e['eta']
                     ))
-                
-                # Convert with ffmpeg (16-bit, 44.1kHz, stereo)
-                # Use 16-bit for maximum compatibility (CDJ standard)
-                # Preserve all metadata
-                cmd = [
-                    ffmpeg_path,
-                    "-i", str(audio_path),
-                    "-ar", "44100",              # 44.1kHz sample rate
-                    "-ac", "2",                  # Stereo
-                    "-c:a", "pcm_s16be",         # 16-bit PCM big-endian (AIFF format, CDJ compatible)
-                    "-map_metadata", "0",         # Copy all metadata from input
-                    "-map", "0:a",               # Map all audio streams
-                    "-f", "aiff",                # AIFF format
-                    "-y",                        # Overwrite if exists
-                    str(output_path)
-                ]
-                
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=300
-                )
-                
-                if result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 0:
-                    converted += 1
-                    # Update status to success
-                    self.root.after(0, lambda idx=i-1: self._update_file_status(idx, "Done"))
-                else:
-                    failed += 1
-                    error_msg = result.stderr[-200:] if result.stderr else "Unknown error"
-                    print(f"Failed to convert {audio_path.name}: {error_msg}")
-                    # Update status to failed
-                    self.root.after(0, lambda idx=i-1: self._update_file_status(idx, "Failed"))
-                    
-            except Exception as e:
-                failed += 1
-                error_msg = str(e)[:200] if str(e) else "Unknown error"
-                print(f"Exception converting {audio_path.name}: {error_msg}")
-                # Update status to failed
-                self.root.after(0, lambda idx=i-1: self._update_file_status(idx, "Failed"))
-        
-        # Update UI
-        self.root.after(0, lambda: self._conversion_complete(converted, failed, len(audio_files)))
+                elif kind == "log":
+                    print(event['text'])
+                elif kind == "message":
+                    self.root.after(0, lambda text=event['text']: self.status_label.config(
+                        text=text, fg=self.fg_color
+                    ))
+                elif kind == "finished":
+                    result = event
+                    break
+        except (OSError, ValueError) as e:
+            print(f"Lost the conversion daemon: {e}")
+        
+        self.daemon = self.daemon_batch = None
+        if result is None:
+            self.root.after(0, lambda: self._conversion_complete(
+                0, 0, len(jobs), "The conversion daemon stopped before the batch finished"
+            ))
+        else:
+            self.root.after(0, lambda: self._conversion_complete(
+                result.get('converted', 0), result.get('failed', 0), result.get('total', len(jobs)),
+                result.get('note', "")
+            ))
     
     def _show_custom_message(self, title: str, message: str, msg_type: str = "info") -> None:
         """Show custom messagebox with cat icon."""
@@ -859,10 +1297,11 @@ class FLAC2AIFFApp:
         # Make dialog modal
         dialog.wait_window()
     
-    def _conversion_complete(self, converted: int, failed: int, total: int) -> None:
+    def _conversion_complete(self, converted: int, failed: int, total: int, note: str = "") -> None:
         """Handle conversion completion."""
         self.is_converting = False
         self.start_button.config(state=tk.NORMAL)
+        self.selected_button.config(state=tk.NORMAL)
         # Get style object
         style = ttk.Style()
         style.configure("Dark.TButton",
@@ -880,7 +1319,8 @@ class FLAC2AIFFApp:
                 "Conversion Complete",
                 f"Converted: {converted}\n"
                 f"Failed: {failed}\n"
-                f"Total: {total}",
+                f"Total: {total}"
+                + (f"\n\n{note}" if note else ""),
                 "info"
             )
         else:
@@ -898,6 +1338,8 @@ class FLAC2AIFFApp:
 
 def main():
     """Main entry point for GUI."""
+    # BPM/key analysis uses a process pool; a frozen app must hand its workers over here
+    multiprocessing.freeze_support()
     try:
         # Set environment variable to prevent Tkinter deprecation warnings
         import os
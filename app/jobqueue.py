@@ -0,0 +1,109 @@
+"""Priority queue of pending jobs that the GUI can reorder while a batch runs."""
+import heapq
+import itertools
+import threading
+import time
+
+RETRY_PRIORITY = 1  # Retries go behind everything queued when they come due
+
+
+class JobQueue:
+    """Pending jobs, popped in plan order unless some were promoted.
+
+    Promoting a job pushes a new heap entry ahead of everything queued so
+    far; its old entry is left in place and skipped when popped (lazy
+    deletion), so a promotion is O(log n) even with thousands of files
+    waiting. Jobs sent back with retry() wait out their backoff outside the
+    heap. Safe to use from the Tk thread and the conversion thread(s).
+    """
+
+    def __init__(self, jobs: list):
+        self._lock = threading.Lock()
+        self._heap = [(0, index, job) for index, job in enumerate(jobs)]  # Already a heap
+        self._entries = {job: (0, index) for index, job in enumerate(jobs)}  # Current entry per job
+        self._front = 0  # Priorities below 0 are promotions; lower pops first
+        self._seq = itertools.count(len(jobs))
+        self._delayed = []  # (due time, seq, job) heap of retries waiting out their backoff
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries) + len(self._delayed)
+
+    def pop(self):
+        """Next job to convert, or None when the queue is empty."""
+        group = self.pop_group(1, lambda job: False)
+        return group[0] if group else None
+
+    def pop_group(self, limit: int, predicate) -> list:
+        """Next job plus, if it matches predicate, the matching jobs right behind it - up to limit.
+
+        Grouping stops at the first job that doesn't match, so promotions and
+        plan order are still honoured. If only retries are left, waits for the
+        first one to come due. Empty when the queue is empty.
+        """
+        while True:
+            with self._lock:
+                self._release_due()
+                group = []
+                while self._heap and len(group) < limit:
+                    priority, seq, job = self._heap[0]
+                    if self._entries.get(job) != (priority, seq):
+                        heapq.heappop(self._heap)  # Superseded by a promotion
+                        continue
+                    if group and not predicate(job):
+                        break
+                    heapq.heappop(self._heap)
+                    del self._entries[job]
+                    group.append(job)
+                    if not predicate(job):
+                        break
+                if group or not self._delayed:
+                    return group
+                wait = self._delayed[0][0] - time.monotonic()
+            time.sleep(min(max(wait, 0.01), 0.5))
+
+    def peek(self, count: int) -> list:
+        """The next count jobs pop() would return, left in the queue (retries not included)."""
+        with self._lock:
+            live = (entry for entry in self._heap if self._entries.get(entry[2]) == entry[:2])
+            return [job for _, _, job in heapq.nsmallest(count, live)]
+
+    def retry(self, job, delay: float) -> None:
+        """Queue a job again once delay seconds have passed."""
+        with self._lock:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), job))
+
+    def _release_due(self) -> None:
+        """Move retries whose backoff is over into the queue (lock held)."""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job = heapq.heappop(self._delayed)
+            entry = (RETRY_PRIORITY, next(self._seq))
+            self._entries[job] = entry
+            heapq.heappush(self._heap, entry + (job,))
+
+    def promote(self, jobs: list) -> list:
+        """Move still-pending jobs to the front, keeping their given order; returns those moved."""
+        with self._lock:
+            pending = [job for job in jobs if job in self._entries]
+            # Later promotions go ahead of earlier ones - the newest request is the most urgent
+            self._front -= 1
+            for job in pending:
+                entry = (self._front, next(self._seq))
+                self._entries[job] = entry
+                heapq.heappush(self._heap, entry + (job,))
+            return pending
+
+    def take(self, jobs: list) -> list:
+        """Remove still-pending jobs (retries too) so the caller can run them now; returns those taken."""
+        with self._lock:
+            wanted = set(jobs)
+            taken = [job for job in jobs if job in self._entries]
+            for job in taken:
+                del self._entries[job]  # Its heap entry is skipped when popped
+            delayed = [entry for entry in self._delayed if entry[2] in wanted]
+            if delayed:
+                self._delayed = [entry for entry in self._delayed if entry[2] not in wanted]
+                heapq.heapify(self._delayed)
+                taken += [entry[2] for entry in delayed]
+            return taken
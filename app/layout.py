@@ -0,0 +1,138 @@
+"""Output folder layouts: shard a large library into subfolders instead of one flat folder.
+
+CDJs (and the collision checks) slow to a crawl on FAT32 folders with tens of
+thousands of entries. A layout puts each output in a subfolder picked from
+its tags - label/artist or genre - or in alphabetical buckets that hold at
+most bucket_size files each ("A", "A 2", "A 3", ...).
+
+Every folder a batch touches is listed once; after that, name claims are
+checked in memory, per folder, by OutputNames.
+"""
+import os
+import threading
+from pathlib import Path
+
+from app.core import sanitize_filename
+
+LAYOUTS = {
+    "flat": "Flat (one folder)",
+    "label/artist": "Label / Artist",
+    "genre": "Genre",
+    "alphabetical": "A-Z buckets",
+}
+BUCKET_SIZE = 500  # Files per alphabetical bucket folder
+
+
+class OutputNames:
+    """Names taken in each output folder - listed once per batch, then checked in memory.
+
+    Comparisons ignore case: FAT32/exFAT (and macOS by default) treat
+    "A.aiff" and "a.aiff" as the same file. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._taken = {}  # folder -> set of lowercased names
+        self._lock = threading.Lock()
+
+    def _names(self, folder: Path) -> set:
+        names = self._taken.get(folder)
+        if names is None:
+            try:
+                names = {name.lower() for name in os.listdir(folder)}
+            except OSError:
+                names = set()  # Not created yet
+            self._taken[folder] = names
+        return names
+
+    def count(self, folder: Path) -> int:
+        """Entries in a folder, existing plus claimed this batch."""
+        with self._lock:
+            return len(self._names(folder))
+
+    def add(self, path: Path) -> None:
+        """Mark a path as taken."""
+        with self._lock:
+            self._names(path.parent).add(path.name.lower())
+
+    def release(self, path: Path) -> None:
+        """Free a path's name - its file is about to be renamed."""
+        with self._lock:
+            self._names(path.parent).discard(path.name.lower())
+
+    def claim(self, folder: Path, clean_name: str) -> Path:
+        """folder/clean_name.aiff, numbered "(1)", "(2)"... if that name is taken; the name is then taken."""
+        with self._lock:
+            names = self._names(folder)
+            name = f"{clean_name}.aiff"
+            counter = 1
+            while name.lower() in names:
+                name = sanitize_filename(f"{clean_name} ({counter})") + ".aiff"
+                counter += 1
+            names.add(name.lower())
+            return folder / name
+
+
+def _folder_name(value: str, fallback: str) -> str:
+    """A tag value as a CDJ-safe folder name."""
+    value = sanitize_filename(value.strip()) if value and value.strip() else ""
+    return value.strip() or fallback
+
+
+def _letter(clean_name: str) -> str:
+    """Alphabetical bucket for a name: "A".."Z", "0-9" or "Other"."""
+    first = clean_name[:1].upper()
+    if "A" <= first <= "Z":
+        return first
+    if "0" <= first <= "9":
+        return "0-9"
+    return "Other"
+
+
+class OutputLayout:
+    """Where each output of a batch goes, relative to the output folder."""
+
+    def __init__(self, scheme: str = "flat", bucket_size: int = BUCKET_SIZE):
+        if scheme not in LAYOUTS:
+            raise ValueError(f"Unknown output layout: {scheme}")
+        self.scheme = scheme
+        self.bucket_size = max(1, bucket_size)
+
+    def assign(self, jobs: list, output_dir: Path, names: OutputNames, current: dict = None) -> dict:
+        """Folder for every job ({job: folder}), in job order.
+
+        Alphabetical buckets count the files already in them, so a bucket
+        filled by an earlier run spills into the next one. current maps jobs
+        whose output already exists to its path; one already sitting in a
+        bucket of its letter stays there.
+        """
+        folders = {}
+        buckets = {}  # letter -> [bucket number, files in it]
+        current = current or {}
+        for job in jobs:
+            if self.scheme == "alphabetical" and job in current:
+                letter = _letter(job.clean_name)
+                folder = current[job].parent
+                if folder.parent == output_dir and (folder.name == letter
+                                                    or folder.name.startswith(f"{letter} ")):
+                    folders[job] = folder  # Already counted in its bucket's listing
+                    continue
+            tags = job.tags
+            if self.scheme == "label/artist":
+                folder = output_dir / _folder_name(tags.get('label', ''), "Unknown Label") \
+                    / _folder_name(tags.get('artist', ''), "Unknown Artist")
+            elif self.scheme == "genre":
+                folder = output_dir / _folder_name(tags.get('genre', ''), "Unknown Genre")
+            elif self.scheme == "alphabetical":
+                letter = _letter(job.clean_name)
+                bucket = buckets.get(letter)
+                if bucket is None:
+                    bucket = buckets[letter] = [1, names.count(output_dir / letter)]
+                while bucket[1] >= self.bucket_size:
+                    bucket[0] += 1
+                    bucket[1] = names.count(output_dir / f"{letter} {bucket[0]}")
+                bucket[1] += 1
+                folder = output_dir / (letter if bucket[0] == 1 else f"{letter} {bucket[0]}")
+            else:
+                folder = output_dir
+            folders[job] = folder
+        return folders
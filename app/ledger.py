@@ -0,0 +1,205 @@
+"""Output ledger: what each output in a folder was converted from, so tag edits don't cost an encode.
+
+Every conversion is recorded in a small JSON file in the output folder: the
+source's stamp, a fingerprint of its audio (not its tags), its tags and the
+output it produced. On the next batch a source whose audio is unchanged keeps its
+output - if only the tags (or the name or folder they give) changed, the
+AIFF's ID3 chunk is rewritten in place and the file renamed, which takes
+milliseconds instead of a decode and encode.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+
+from mutagen.flac import FLAC
+
+LEDGER_NAME = ".aiffmeplease_outputs.json"
+HASH_CHUNK = 1024 * 1024
+SAMPLE_BYTES = 1024 * 1024  # Audio read from each end of a file without an audio MD5
+
+
+def _hash_range(path: Path, start: int, end: int) -> str:
+    """SHA-256 of bytes start..end of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _id3v2_size(head: bytes) -> int:
+    """Bytes taken by an ID3v2 tag at the start of a file (0 if there is none)."""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return 10 + size + (10 if head[5] & 0x10 else 0)  # Footer flag
+
+
+def _mp3_audio_range(path: Path, size: int):
+    """(start, end) of the MPEG frames - the file minus ID3v2, APEv2 and ID3v1 tags."""
+    with open(path, "rb") as f:
+        start = _id3v2_size(f.read(10))
+        end = size
+        f.seek(max(0, end - 128))
+        if f.read(3) == b"TAG":
+            end -= 128
+        if end - start >= 32:
+            f.seek(end - 32)
+            footer = f.read(32)
+            if footer[:8] == b"APETAGEX":
+                tag_size, _, flags = struct.unpack("<III", footer[12:24])
+                end -= tag_size + (32 if flags & 0x80000000 else 0)  # Header present
+    return start, max(start, end)
+
+
+def _flac_audio_start(path: Path) -> int:
+    """Offset of the first FLAC audio frame - past every metadata block."""
+    with open(path, "rb") as f:
+        pos = _id3v2_size(f.read(10))
+        f.seek(pos)
+        if f.read(4) != b"fLaC":
+            raise ValueError("not a FLAC file")
+        pos += 4
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                raise ValueError("truncated metadata")
+            pos += 4 + int.from_bytes(header[1:4], "big")
+            if header[0] & 0x80:
+                return pos
+            f.seek(pos)
+
+
+def _hash_ends(path: Path, start: int, end: int) -> str:
+    """SHA-256 of the audio's length and of its first and last SAMPLE_BYTES."""
+    if end - start <= 2 * SAMPLE_BYTES:
+        return _hash_range(path, start, end)
+    digest = hashlib.sha256(str(end - start).encode())
+    digest.update(_hash_range(path, start, start + SAMPLE_BYTES).encode())
+    digest.update(_hash_range(path, end - SAMPLE_BYTES, end).encode())
+    return digest.hexdigest()
+
+
+def audio_hash(path: Path) -> str:
+    """Fingerprint of a source's audio that ignores its tags and cover.
+
+    FLACs carry an MD5 of their decoded audio in STREAMINFO, so a header read
+    is enough. For MP3s (and FLACs written without the MD5) the audio bytes
+    between the tags are sampled rather than read in full: their length and
+    both ends, at most 2 MB of reading. Retagging leaves all three alone and
+    a new encode changes them. An edit of frames in the middle only (a gain
+    change made without re-encoding) goes unnoticed - delete the output to
+    convert such a file again.
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".flac":
+        md5 = FLAC(str(path)).info.md5_signature
+        if md5:
+            return f"flacmd5-{md5:032x}"
+        start, end = _flac_audio_start(path), path.stat().st_size
+    elif suffix == ".mp3":
+        start, end = _mp3_audio_range(path, path.stat().st_size)
+    else:
+        start, end = 0, path.stat().st_size
+    return f"audioends-{_hash_ends(path, start, end)}"
+
+
+class OutputLedger:
+    """The outputs in one folder and the sources, tags and settings they were made from."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.path = output_dir / LEDGER_NAME
+        self._lock = threading.Lock()
+        self._hashes = {}  # Source path -> audio hash, computed once per batch
+        self.dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _audio(self, job):
+        """Audio hash of a job's source, or None for archive members (which have no file to hash)."""
+        if job.archive is not None:
+            return None
+        with self._lock:
+            if job.source in self._hashes:
+                return self._hashes[job.source]
+        value = audio_hash(job.source)
+        with self._lock:
+            self._hashes[job.source] = value
+        return value
+
+    def previous(self, job, profile: str):
+        """The existing output holding this job's audio, converted with the same profile, or None.
+
+        Sources whose stamp is unchanged are trusted without hashing; otherwise
+        the audio is hashed and compared, so a tag edit still finds its output.
+        """
+        entry = self.entries.get(job.key)
+        if not entry or entry.get('profile') != profile:
+            return None
+        path = self.output_dir / entry['output']
+        if not path.is_file():
+            return None
+        if job.stamp is None or entry.get('stamp') != list(job.stamp):
+            try:
+                audio = self._audio(job)
+            except (OSError, ValueError):
+                return None
+            if audio is None or audio != entry.get('audio'):
+                return None
+        return path
+
+    def recorded(self, job) -> dict:
+        """The job's ledger entry from earlier batches ({} if there is none)."""
+        return self.entries.get(job.key, {})
+
+    def tags_unchanged(self, job) -> bool:
+        """True if the job's tags and cover are the ones its recorded output was made with."""
+        entry = self.recorded(job)
+        return entry.get('tags') == job.tags and entry.get('artwork') == job.artwork_digest
+
+    def record(self, job, profile: str, output_path: Path) -> None:
+        """Remember the output a job produced (or was renamed to)."""
+        try:
+            audio = self._audio(job)
+        except (OSError, ValueError):
+            audio = None
+        entry = {
+            'stamp': list(job.stamp) if job.stamp else None,
+            'audio': audio,
+            'tags': job.tags,
+            'artwork': job.artwork_digest,
+            'profile': profile,
+            'output': output_path.relative_to(self.output_dir).as_posix(),
+        }
+        with self._lock:
+            self.entries[job.key] = entry
+            self.dirty = True
+
+    def save(self) -> None:
+        """Write the ledger, dropping outputs that no longer exist."""
+        with self._lock:
+            if not self.dirty:
+                return
+            self.entries = {key: entry for key, entry in self.entries.items()
+                            if (self.output_dir / entry['output']).exists()}
+            self.dirty = False
+            try:
+                tmp = self.path.with_name(LEDGER_NAME + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.entries, f)
+                os.replace(str(tmp), str(self.path))
+            except OSError as e:
+                print(f"Could not save output ledger: {e}")
@@ -0,0 +1,215 @@
+"""Fake-lossless detection: FLACs that were made from an MP3 (or another lossy file).
+
+Lossy encoders low-pass the audio first, at about 16 kHz for 128 kbps and
+19-20 kHz for 320. Decoding such a file back to FLAC keeps that cliff in
+the spectrum, with near-silence above it, and a real lossless master
+doesn't have one. When the file list is read (or, for files it didn't
+check, before a batch converts anything), a few short excerpts of every
+FLAC are decoded, in one ffmpeg run per file. Their averaged spectrum is
+computed with NumPy in a process pool, and a file with a steep cliff below
+LOSSY_MAX_HZ is flagged as suspect. Verdicts are cached by source hash, so
+a library is scanned once.
+
+VBR MP3s encoded without a low-pass can't be told apart this way. A
+genuine recording that was low-passed in mastering is flagged as well, so
+a flag is a hint to check the file, not a proof.
+"""
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from mutagen.aiff import AIFF
+from mutagen.flac import FLAC
+from mutagen.id3 import TXXX
+
+from app.core import CACHE_DIR
+from app.analysis import AnalysisCache, HAS_NUMPY
+from app.store import source_hash
+
+if HAS_NUMPY:
+    import numpy as np
+
+LOSSY_VERSION = 1  # Bump when the detector changes - old cache entries are then ignored
+LOSSY_MODES = {
+    "off": "Don't check",
+    "skip": "Flag and skip",
+    "tag": "Flag and tag",
+}
+EXCERPTS = (0.2, 0.5, 0.8)  # Excerpt centres, as fractions of the file
+EXCERPT_SECONDS = 5.0
+FFT_FRAME = 8192  # 5.4 Hz bins at 44.1 kHz
+BAND_HZ = 100.0  # Spectrum averaged into bands this wide before looking for the cliff
+BELOW_BANDS = 8  # Bands under the cliff compared with everything above it
+MIN_CUTOFF_HZ = 10000.0  # Lower cliffs are left alone - that is the music, not an encoder
+LOSSY_MAX_HZ = 20600.0  # LAME's low-pass at 320 kbps is 20.5 kHz; resamplers cut above ~21 kHz
+CLIFF_DB = 25.0  # Drop across the cliff; transcodes show 50+ dB, real masters under 10
+SILENCE_DB = -100.0  # Excerpts quieter than this on average can't be judged
+TAG_NAME = "LOSSY_SOURCE"
+
+
+def build_excerpt_command(ffmpeg_path: str, audio_path: Path, duration: float) -> list:
+    """Build an ffmpeg command decoding the EXCERPTS of audio_path to mono float32 on stdout."""
+    cmd = [ffmpeg_path, "-v", "error"]
+    for centre in EXCERPTS:
+        start = max(0.0, duration * centre - EXCERPT_SECONDS / 2)
+        cmd += ["-ss", f"{start:.3f}", "-t", f"{EXCERPT_SECONDS:.3f}", "-i", str(audio_path)]
+    inputs = "".join(f"[{index}:a]" for index in range(len(EXCERPTS)))
+    return cmd + [
+        "-filter_complex", f"{inputs}concat=n={len(EXCERPTS)}:v=0:a=1",
+        "-ac", "1",
+        "-c:a", "pcm_f32le",
+        "-f", "f32le",
+        "pipe:1"
+    ]
+
+
+def find_cutoff(samples, rate: int):
+    """(cutoff Hz or None, cliff dB) for mono float samples at rate.
+
+    The averaged power spectrum is cut into BAND_HZ bands. At every band
+    edge from MIN_CUTOFF_HZ up, the mean level of the bands just below is
+    compared with the mean of everything above, all edges at once. The
+    steepest drop is the cliff, and it counts as a lossy low-pass if it is
+    deep enough and below LOSSY_MAX_HZ.
+    """
+    frames = len(samples) // FFT_FRAME
+    if frames == 0:
+        return None, 0.0
+    window = np.hanning(FFT_FRAME).astype(np.float32)
+    spectra = np.fft.rfft(samples[:frames * FFT_FRAME].reshape(frames, FFT_FRAME) * window, axis=1)
+    power = (spectra.real ** 2 + spectra.imag ** 2).mean(axis=0)
+
+    freqs = np.fft.rfftfreq(FFT_FRAME, 1.0 / rate)
+    starts = np.searchsorted(freqs, np.arange(0.0, rate / 2, BAND_HZ))
+    counts = np.diff(np.append(starts, len(power)))
+    levels = 10 * np.log10(np.add.reduceat(power, starts) / np.maximum(counts, 1) + 1e-20)
+    if levels.mean() < SILENCE_DB:
+        return None, 0.0
+
+    # Mean level below and above every candidate edge, from running sums
+    total = np.concatenate([[0.0], np.cumsum(levels)])
+    edges = np.arange(max(BELOW_BANDS, int(MIN_CUTOFF_HZ / BAND_HZ)), len(levels) - 2)
+    if len(edges) == 0:
+        return None, 0.0
+    below = (total[edges] - total[edges - BELOW_BANDS]) / BELOW_BANDS
+    above = (total[-1] - total[edges + 1]) / (len(levels) - edges - 1)
+    drops = below - above
+    best = int(np.argmax(drops))
+    cutoff = float(edges[best] * BAND_HZ)
+    cliff = float(drops[best])
+    if cliff >= CLIFF_DB and cutoff <= LOSSY_MAX_HZ:
+        return cutoff, cliff
+    return None, cliff
+
+
+def scan_source(ffmpeg_path: str, audio_path: str) -> dict:
+    """Decode a FLAC's excerpts and look for a lossy low-pass (runs in a pool worker)."""
+    info = FLAC(audio_path).info
+    cmd = build_excerpt_command(ffmpeg_path, Path(audio_path), info.length)
+    result = subprocess.run(cmd, capture_output=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip()[-200:] or "ffmpeg failed")
+    samples = np.frombuffer(result.stdout, dtype="<f4")
+    cutoff, cliff = find_cutoff(samples, info.sample_rate)
+    return {'cutoff': cutoff, 'cliff': round(cliff, 1)}
+
+
+def scannable(job) -> bool:
+    """True for the jobs the scan can check: FLAC files on disk, not archive members or MP3s."""
+    return job.archive is None and job.source.suffix.lower() == ".flac"
+
+
+def describe(cutoff: float) -> str:
+    """Status text for a suspect, e.g. "Lossy? 16.6 kHz"."""
+    return f"Lossy? {cutoff / 1000:.1f} kHz"
+
+
+def write_lossy_tag(output_path: Path, cutoff: float) -> None:
+    """Record the suspected low-pass in a TXXX:LOSSY_SOURCE frame of the AIFF's ID3 chunk."""
+    text = f"Cut off at {cutoff / 1000:.1f} kHz - probably made from a lossy file"
+    audio = AIFF(str(output_path))
+    if audio.tags is None:
+        audio.add_tags()
+    frame = audio.tags.get(f"TXXX:{TAG_NAME}")
+    if frame is not None and list(frame.text) == [text]:
+        return
+    audio.tags.add(TXXX(encoding=3, desc=TAG_NAME, text=[text]))
+    audio.save()
+
+
+class LossyScanner:
+    """Checks a batch's FLAC sources for lossy low-passes, in parallel and through the cache."""
+
+    def __init__(self, ffmpeg_path: str, workers: int = None):
+        if not HAS_NUMPY:
+            raise RuntimeError("NumPy is not installed (pip3 install --user numpy)")
+        self.ffmpeg_path = ffmpeg_path
+        self.workers = workers or os.cpu_count() or 2
+        self.cache = AnalysisCache(CACHE_DIR / "lossy.json")
+        self.scanned = 0
+        self.errors = []  # (source, error) for files that could not be checked
+
+    def scan(self, jobs: list) -> dict:
+        """Suspects among the jobs: {job: cutoff Hz}.
+
+        Each FLAC file is scanned once, so the tracks of a CUE sheet share
+        their file's verdict. Archive members and MP3s are not scanned.
+        Files that could not be checked are listed in errors.
+        """
+        by_source = {}
+        for job in jobs:
+            if scannable(job):
+                by_source.setdefault(job.source, []).append(job)
+
+        verdicts = {}
+        to_scan = {}  # source -> cache key
+        for source in by_source:
+            try:
+                key = f"v{LOSSY_VERSION}-{source_hash(source)}"
+            except OSError as e:
+                self.errors.append((source, f"could not hash it: {e}"))
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                verdicts[source] = cached
+            else:
+                to_scan[source] = key
+
+        if to_scan:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(to_scan))) as pool:
+                futures = {source: pool.submit(scan_source, self.ffmpeg_path, str(source)) for source in to_scan}
+                for source, future in futures.items():
+                    try:
+                        verdict = future.result()
+                    except Exception as e:
+                        self.errors.append((source, str(e) or type(e).__name__))
+                        continue
+                    self.scanned += 1
+                    verdicts[source] = verdict
+                    self.cache.put(to_scan[source], verdict)
+            try:
+                self.cache.save()
+            except OSError as e:
+                self.errors.append((self.cache.path, f"could not save the cache: {e}"))
+
+        suspects = {}
+        for source, verdict in verdicts.items():
+            if verdict.get('cutoff'):
+                for job in by_source[source]:
+                    suspects[job] = verdict['cutoff']
+        return suspects
+
+    def flag(self, jobs: list) -> dict:
+        """Scan the jobs and keep the verdict on each: lossy_cutoff, and lossy_checked once settled.
+
+        Jobs the scan can't check count as settled; a file that could not be
+        scanned (listed in errors) stays unchecked, for a later try. Returns
+        the suspects, as scan() does.
+        """
+        suspects = self.scan(jobs)
+        failed = {source for source, _ in self.errors}
+        for job in jobs:
+            job.lossy_cutoff = suspects.get(job)
+            job.lossy_checked = job.source not in failed
+        return suspects
@@ -0,0 +1,1019 @@
+"""The conversion pipeline: planned jobs in, tagged AIFFs out, with no UI attached.
+
+The GUI and the conversion daemon both run batches through ConversionBatch.
+Whatever a batch has to show (row statuses, progress, the status line, log
+lines and the final counts) goes to a BatchEvents. The GUI hands those calls
+to the Tk thread, and the daemon publishes them to the batch's subscribers.
+"""
+import csv
+import itertools
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.core import (
+    conversion_profile, build_ffmpeg_command, parse_loudness, write_loudness_tags, open_audio,
+    build_group_command, projected_output_bytes, GROUP_MAX_SECONDS, write_id3_tags, id3_tags_match,
+    write_aiff_text_chunks, aiff_text_chunks_match
+)
+from app.rekordbox import RekordboxExporter
+from app.artwork import ArtworkCache, artwork_from_audio, embed_artwork
+from app.ffmpeg_runner import FFmpegRunner, STDERR_LINES
+from app.background import Throttle, ModeStats
+from app.usb import UsbExport
+from app.analysis import Analyzer, write_analysis_tags
+from app.lossy import LossyScanner, describe, write_lossy_tag
+from app.locality import ReadAhead, READAHEAD_FILES, PREFETCH_BYTES
+from app.layout import OutputLayout, OutputNames
+from app.retry import Quarantine, stall_seconds, is_transient, backoff, MAX_ATTEMPTS
+from app.cue import build_cue_command, track_meter, CUE_FPS
+from app.segments import plan_segments, convert_segmented
+from app.store import OutputStore, detach
+from app.ledger import OutputLedger
+from app.archive import ARCHIVE_WORKERS, MemberReader
+from app.preflight import preflight, BROKEN
+from app.jobqueue import JobQueue
+from app.dryrun import format_bytes, record_throughput, measured_throughput
+from app.telemetry import Telemetry
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as H:MM:SS or M:SS."""
+    seconds = int(max(0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def write_tags(path: Path, tags: dict) -> None:
+    """Bring an existing output's ID3 frames and NAME/AUTH chunks in line with tags."""
+    if id3_tags_match(path, tags) and aiff_text_chunks_match(path, tags):
+        return
+    # Store copies are hard links - break the link so other folders keep their tags
+    detach(path)
+    write_id3_tags(path, tags)
+    write_aiff_text_chunks(path, tags)
+
+
+class BatchEvents:
+    """What a running batch reports; called from the conversion threads.
+
+    The base class prints log lines and ignores everything else, which is
+    all a script needs.
+    """
+
+    def status(self, job, text: str) -> None:
+        """A job's row status changed ("Converting", "Done", "Failed", ...)."""
+
+    def progress(self, job, index: int, total: int, percent: int, eta: str) -> None:
+        """A job's encode moved; index is its start position in the batch."""
+
+    def message(self, text: str) -> None:
+        """New text for the status line."""
+
+    def log(self, text: str) -> None:
+        """A line for the console: warnings, failures and the end-of-batch summaries."""
+        print(text)
+
+    def complete(self, converted: int, failed: int, total: int, note: str = "") -> None:
+        """The batch is done; note holds the summary lines worth showing the user."""
+
+
+class ConversionBatch:
+    """One batch of planned jobs (FLAC/MP3) converted to AIFF - tags and names come from the plan.
+
+    run() does the whole batch on the calling thread. While it runs,
+    job_queues holds the queues of jobs still waiting, which "Convert Next"
+    and "Cancel Selected" reorder or empty.
+    """
+
+    def __init__(self, jobs: list, output_dir: Path, ffmpeg_path: str, options: dict = None,
+                 events: BatchEvents = None, telemetry: Telemetry = None, throttle: Throttle = None):
+        self.jobs = list(jobs)
+        self.output_dir = output_dir
+        self.ffmpeg_path = ffmpeg_path
+        self.options = options or {}
+        self.events = events or BatchEvents()
+        self.telemetry = telemetry or Telemetry()
+        self.throttle = throttle or Throttle()
+        self.analyze_loudness = self.options.get('analyze_loudness', False)
+        self.profile = conversion_profile(self.options)
+        self.job_queues = []
+        self.converted = 0
+        self.failed = 0
+        self.total_files = len(self.jobs)
+        self.loudness_report = []  # (output name, loudness dict) per analyzed file
+        self.staged_jobs = []  # (staging path, job) waiting for the copy to the stick
+        self.attempts = {}  # job -> transient failures so far
+        self.retry_targets = {}  # job -> (output_path, store_profile) kept for its next attempt
+        self.up_to_date = []  # (job, output) kept from earlier batches as they are
+        self.retag_jobs = []  # (job, output) - same audio, new tags or cover
+        self.retagged = 0
+        self.suspects = {}  # job -> lossy cutoff Hz
+        self.lossy_skipped = 0
+        self.stall_timeout = stall_seconds()
+        self.mode_stats = ModeStats()
+        self.lock = threading.Lock()  # Guards the counters when archive members convert in parallel
+        self.started = itertools.count(1)  # "Converting i of N" in start order
+        self.cue_sheets = {}  # CueSheet -> its jobs in this batch
+        self.members = None  # MemberReader while archive members convert
+        self.active = {}  # job -> seconds converted so far, for files in flight
+        self.done_audio = 0.0
+        self.total_audio = 0.0
+        self.batch_start = time.monotonic()
+
+    def log(self, text: str) -> None:
+        self.events.log(text)
+
+    def run(self) -> None:
+        """Convert the batch, then write its reports and report the counts."""
+        self._open_services()
+        self._screen()
+        self._sort_previous()
+        self._assign_folders()
+
+        # Batch ETA is throughput based: audio seconds converted per wall second so far,
+        # applied to the audio seconds still to go. In-flight files count with their
+        # current position, so the estimate also holds while archive members run in parallel
+        self.total_audio = sum(job.duration for job in self.jobs)
+        self.batch_start = time.monotonic()
+        for job in self.jobs:
+            self.telemetry.emit("job_queued", source=str(job.source), audio_seconds=round(job.duration, 3))
+
+        self._keep_previous()
+        self._convert_pending()
+        self._finish()
+
+    # Setting up
+    def _open_services(self) -> None:
+        """Open the caches and exporters the options ask for; one that can't open is left off."""
+        options = self.options
+        self.rekordbox = None
+        if options.get('export_rekordbox'):
+            self.rekordbox = RekordboxExporter(self.output_dir)
+
+        self.store = None
+        if options.get('use_store'):
+            try:
+                self.store = OutputStore()
+            except Exception as e:
+                self.log(f"Output store unavailable: {e}")
+
+        self.artwork_cache = None
+        if options.get('embed_artwork'):
+            try:
+                self.artwork_cache = ArtworkCache(self.ffmpeg_path)
+            except Exception as e:
+                self.log(f"Artwork cache unavailable: {e}")
+
+        # USB sticks get finished files only: everything is encoded into local staging
+        # and copied over in one sequential pass at the end
+        self.export = None
+        if options.get('usb_export'):
+            try:
+                self.export = UsbExport(self.output_dir)
+                if self.export.resumed:
+                    self.log(f"Resuming USB export: {self.export.resumed} file(s) staged by an earlier run")
+            except Exception as e:
+                self.log(f"USB export unavailable, writing to {self.output_dir} directly: {e}")
+
+        self.analyzer = None
+        if options.get('analyze_bpm_key'):
+            try:
+                self.analyzer = Analyzer()
+            except Exception as e:
+                self.log(f"BPM/key analysis unavailable: {e}")
+
+        self.quarantine = Quarantine()
+        self.ledger = OutputLedger(self.output_dir)
+
+    def _screen(self) -> None:
+        """Drop broken and quarantined jobs, and check FLACs for a lossy source."""
+        telemetry = self.telemetry
+
+        # Pre-flight: read just the headers, in a thread pool, so broken files are skipped
+        # with a reason instead of costing an ffmpeg launch (or a stall and its retries)
+        checked = preflight(self.jobs)
+        for job, reason in checked.suspect:
+            self.log(f"Suspect: {job.source.name}: {reason}")
+        for job, reason in checked.broken:
+            self.failed += 1
+            self.log(f"Skipping {job.source.name}: {reason}")
+            telemetry.emit("job_skipped", source=str(job.source), reason=reason)
+            self.events.status(job, f"Broken: {reason}")
+        jobs = [job for job in self.jobs if job.preflight[0] != BROKEN]
+
+        # Files that kept failing in earlier batches are skipped until they change -
+        # unless they were picked explicitly with "Convert Selected"
+        if not self.options.get('retry_quarantined'):
+            kept = []
+            for job in jobs:
+                reason = self.quarantine.reason(job)
+                if reason is None:
+                    kept.append(job)
+                    continue
+                self.failed += 1
+                self.log(f"Skipping {job.source.name}: quarantined ({reason})")
+                telemetry.emit("job_skipped", source=str(job.source), reason=f"quarantined: {reason}")
+                self.events.status(job, "Quarantined")
+            jobs = kept
+
+        # Fake lossless: a few excerpts of every FLAC are checked for an MP3's low-pass
+        # before any time goes into converting them. Suspects are skipped, or converted
+        # and tagged; rows picked with "Convert Selected" are converted either way.
+        # Files the file list already checked keep its verdict
+        lossy_mode = self.options.get('lossy_mode', "off")
+        if lossy_mode != "off":
+            unchecked = [job for job in jobs if not job.lossy_checked]
+            if unchecked:
+                self.events.message("Checking for lossy sources...")
+                try:
+                    scanner = LossyScanner(self.ffmpeg_path)
+                    scanner.flag(unchecked)
+                    for source, error in scanner.errors:
+                        self.log(f"Lossy source check: {source.name}: {error}")
+                except Exception as e:
+                    self.log(f"Lossy source check unavailable: {e}")
+            self.suspects = {job: job.lossy_cutoff for job in jobs if job.lossy_checked and job.lossy_cutoff}
+        kept = []
+        for job in jobs:
+            if job not in self.suspects:
+                kept.append(job)
+                continue
+            self.log(f"Suspect: {job.source.name}: cut off at {job.lossy_cutoff / 1000:.1f} kHz, "
+                     f"probably decoded from a lossy file")
+            if lossy_mode == "skip" and not self.options.get('retry_quarantined'):
+                self.lossy_skipped += 1
+                telemetry.emit("job_skipped", source=str(job.source), reason="lossy source")
+                self.events.status(job, f"Skipped: {describe(job.lossy_cutoff)}")
+            else:
+                kept.append(job)
+                self.events.status(job, describe(job.lossy_cutoff))
+        self.jobs = kept
+
+    def _sort_previous(self) -> None:
+        """Sources converted into this folder before keep their output while the audio is
+        unchanged: up to date as they are, or retagged and renamed in place - no encode."""
+        pending = []
+        for job in self.jobs:
+            previous = self.ledger.previous(job, self.profile)
+            if previous is None:
+                pending.append(job)
+            elif self.ledger.tags_unchanged(job):
+                self.up_to_date.append((job, previous))
+            else:
+                self.retag_jobs.append((job, previous))
+        self.jobs = pending
+
+    def _assign_folders(self) -> None:
+        """Output folders are picked and created once per batch; after that every
+        name is claimed in memory against its own folder's listing."""
+        self.names = OutputNames()
+        if self.export:
+            for path in self.export.pending_paths():
+                self.names.add(path)
+        layout = self.options.get('layout', OutputLayout())
+        # Kept outputs get folders too, so a new layout or naming moves them
+        kept = dict(self.up_to_date + self.retag_jobs)
+        self.folders = layout.assign(self.jobs + list(kept), self.output_dir, self.names, kept)
+        try:
+            if self.export:
+                self.export.prepare(set(self.folders.values()))
+            else:
+                for folder in set(self.folders.values()):
+                    folder.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            self.log(f"Could not create output folders: {e}")
+
+    # Per-job steps
+    def on_progress(self, position, done, job, index) -> None:
+        duration = job.duration
+        if duration > 0:
+            position = min(position, duration)
+            percent = 100 if done else int(position * 100 / duration)
+        else:
+            percent = 100 if done else 0
+
+        eta = ""
+        with self.lock:
+            self.active[job] = position
+            processed = self.done_audio + sum(self.active.values())
+        elapsed = time.monotonic() - self.batch_start
+        if processed > 0 and elapsed > 0 and self.total_audio > 0:
+            rate = processed / elapsed
+            eta = format_duration((self.total_audio - processed) / rate)
+
+        self.events.progress(job, index, len(self.jobs), percent, eta)
+
+    def add_to_rekordbox(self, output_path: Path, tags: dict) -> None:
+        """Record an output for the Rekordbox export, if enabled."""
+        if not self.rekordbox:
+            return
+        try:
+            self.rekordbox.update(output_path, tags)
+        except Exception as e:
+            self.log(f"Could not add {output_path.name} to Rekordbox collection: {e}")
+
+    def add_output(self, output_path: Path, job) -> None:
+        """Index a finished output for Rekordbox - staged ones once they are on the stick (call under lock)."""
+        if self.export:
+            self.staged_jobs.append((output_path, job))
+        else:
+            self.add_to_rekordbox(output_path, job.tags)
+
+    def landing_path(self, output_path: Path) -> Path:
+        """Where an output ends up - staged USB outputs land in the same place on the stick."""
+        export = self.export
+        return export.target_dir / output_path.relative_to(export.staging_dir) if export else output_path
+
+    def flag_lossy(self, job, output_path: Path) -> None:
+        """Tag a suspect's output with its cutoff (its own copy, if it is a store link)."""
+        if job not in self.suspects:
+            return
+        try:
+            detach(output_path)
+            write_lossy_tag(output_path, job.lossy_cutoff)
+        except Exception as e:
+            self.log(f"Could not write the lossy source tag for {output_path.name}: {e}")
+
+    def cover_for(self, job):
+        """Resized cover for a job's output - usually a cache hit by the planned digest."""
+        jpeg = self.artwork_cache.lookup(job.artwork_digest)
+        if not jpeg:
+            # Covers never resized before are read from the source again
+            with job.open_source() as f:
+                artwork = artwork_from_audio(open_audio(job.source, f))
+            jpeg = self.artwork_cache.get(artwork) if artwork else None
+        return jpeg
+
+    def misplaced(self, job, path: Path) -> bool:
+        """True if the layout or naming now gives a kept output another folder or name."""
+        if path.parent != self.folders[job]:
+            return True
+        # "Name (2)" was numbered for a clash and is still the job's name
+        return path.stem != job.clean_name and not re.fullmatch(rf"{re.escape(job.clean_name)} \(\d+\)", path.stem)
+
+    def retag_output(self, job, previous: Path) -> Path:
+        """Give an existing output the job's tags, cover and name; returns its new path."""
+        path = previous
+        if self.misplaced(job, previous):
+            self.names.release(previous)
+            path = self.names.claim(self.folders[job], job.clean_name)
+
+        write_tags(previous, job.tags)
+        if (self.artwork_cache and job.artwork_digest
+                and job.artwork_digest != self.ledger.recorded(job).get('artwork')):
+            jpeg = self.cover_for(job)
+            if jpeg:
+                detach(previous)
+                embed_artwork(previous, jpeg)
+
+        if path != previous:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(str(previous), str(path))
+        return path
+
+    def start_job(self, i, job):
+        """Name the output, show the job as started and try the output store.
+
+        Returns (output_path, store_profile), or None when the store already had the file.
+        """
+        audio_path = job.source
+        job.profile = self.profile
+        store = self.store
+        export = self.export
+
+        # Handle collisions - sanitize the collision number too. Claims are made under
+        # a lock, so parallel members never pick the same name
+        final_path = self.names.claim(self.folders[job], job.clean_name)
+        output_path = export.staging_path(final_path) if export else final_path
+        job.output_path = output_path
+
+        self.events.status(job, "Converting")
+        self.events.message(f"Converting {i} of {len(self.jobs)} files...")
+
+        job_start = time.monotonic()
+        self.telemetry.emit("job_started", source=str(audio_path), output=str(output_path))
+
+        # Already converted for another output folder? Link it instead of encoding again.
+        # Archive members have no file of their own to hash, so they always encode;
+        # CUE tracks are stored per cut
+        store_profile = None
+        if store and job.archive is None:
+            try:
+                store_profile = f"{self.profile}-{job.cue.span}" if job.cue else self.profile
+                store_key = store.find(audio_path, store_profile)
+                method = store.fetch(store_key, output_path) if store_key else None
+            except Exception as e:
+                self.log(f"Output store lookup failed for {audio_path.name}: {e}")
+                method = None
+            if method:
+                # Same audio, but the tags may differ from the stored copy's
+                write_tags(output_path, job.tags)
+                self.flag_lossy(job, output_path)
+                self.ledger.record(job, self.profile, self.landing_path(output_path))
+                if export:
+                    export.add(output_path)
+                with self.lock:
+                    self.converted += 1
+                    self.add_output(output_path, job)
+                self.telemetry.emit("job_finished", source=str(audio_path), output=str(output_path),
+                                    result="reused", method=method,
+                                    seconds=round(time.monotonic() - job_start, 3),
+                                    bytes=output_path.stat().st_size,
+                                    audio_seconds=round(job.duration, 3))
+                self.events.status(job, f"Done ({method})")
+                return None
+        return output_path, store_profile
+
+    def finish_job(self, job, output_path, store_profile, seconds, result, from_stdin=False, analysis=None,
+                   meter=None):
+        """Post-process a successful encode (loudness, BPM/key, artwork, store, Rekordbox) or record the failure.
+
+        seconds is the wall time charged to this file - its share when it was encoded in a group.
+        analysis is the BPM/key result for the file, if it was analysed. meter names the
+        ebur128 instance that measured it when one run measured several (CUE tracks).
+        """
+        audio_path = job.source
+
+        if result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 0:
+            try:
+                write_id3_tags(output_path, job.tags)
+            except Exception as e:
+                self.log(f"Could not write tags for {output_path.name}: {e}")
+
+            if self.analyze_loudness:
+                loudness = parse_loudness(result.stderr, meter)
+                if loudness:
+                    try:
+                        write_loudness_tags(output_path, loudness)
+                    except Exception as e:
+                        self.log(f"Could not write loudness tags for {output_path.name}: {e}")
+                    with self.lock:
+                        self.loudness_report.append((output_path.name, loudness))
+
+            if analysis:
+                try:
+                    write_analysis_tags(output_path, analysis)
+                except Exception as e:
+                    self.log(f"Could not write BPM/key tags for {output_path.name}: {e}")
+
+            if self.artwork_cache and job.artwork_digest:
+                try:
+                    jpeg = self.cover_for(job)
+                    if jpeg:
+                        embed_artwork(output_path, jpeg)
+                except Exception as e:
+                    self.log(f"Could not embed artwork for {output_path.name}: {e}")
+
+            self.flag_lossy(job, output_path)
+
+            if store_profile:
+                self.store.add(job.source, store_profile, output_path)
+
+            self.quarantine.remove(job)  # Converted after all (picked with "Convert Selected")
+            self.ledger.record(job, self.profile, self.landing_path(output_path))
+
+            if self.export:
+                self.export.add(output_path)  # Hashed now, checked against the copy later
+
+            with self.lock:
+                self.add_output(output_path, job)
+                self.converted += 1
+                self.mode_stats.add(self.throttle.enabled, job.duration, seconds)
+            self.telemetry.emit("job_finished", source=str(audio_path), output=str(output_path),
+                                result="converted", exit_code=result.returncode,
+                                seconds=round(seconds, 3),
+                                bytes=output_path.stat().st_size,
+                                audio_seconds=round(job.duration, 3))
+            self.events.status(job, "Staged" if self.export else "Done")
+        else:
+            with self.lock:
+                self.failed += 1
+            error_msg = result.stderr[-200:] if result.stderr else "Unknown error"
+            if result.stalled:
+                error_msg = f"Stalled: no progress for {self.stall_timeout:.0f} seconds"
+            if is_transient(result):
+                # Only reached once the retries are used up
+                tries = self.attempts.get(job, 1)  # retry_later counted this run
+                lines = error_msg.strip().splitlines()
+                self.quarantine.add(job, lines[-1] if lines else error_msg, tries)
+                error_msg = f"{error_msg} (quarantined after {tries} attempts)"
+            if from_stdin or self.export:
+                # Don't leave the reserved name (or a partial staged file) behind
+                try:
+                    output_path.unlink()
+                except OSError:
+                    pass
+            self.log(f"Failed to convert {audio_path.name}: {error_msg}")
+            self.telemetry.emit("job_failed", source=str(audio_path), exit_code=result.returncode,
+                                stalled=result.stalled, error=error_msg,
+                                seconds=round(seconds, 3))
+            self.events.status(job, "Quarantined" if is_transient(result) else "Failed")
+
+    def fail_job(self, job, e) -> None:
+        """Record a job that raised instead of finishing."""
+        with self.lock:
+            self.failed += 1
+        error_msg = str(e)[:200] if str(e) else "Unknown error"
+        self.log(f"Exception converting {job.source.name}: {error_msg}")
+        self.telemetry.emit("job_failed", source=str(job.source), error=error_msg)
+        self.events.status(job, "Failed")
+
+    def end_job(self, job) -> None:
+        """Count a job's audio as processed, for the ETA."""
+        with self.lock:
+            self.active.pop(job, None)
+            self.done_audio += job.duration
+        if self.members and job.archive is not None:
+            self.members.forget(job.archive, job.member)
+
+    def retry_later(self, job, result, queue, output_path, store_profile) -> bool:
+        """Send a transient failure back to the queue with backoff; False once its attempts are used up."""
+        if result is None or result.returncode == 0 or not is_transient(result):
+            return False
+        with self.lock:
+            tries = self.attempts[job] = self.attempts.get(job, 0) + 1
+            self.active.pop(job, None)
+        if tries >= MAX_ATTEMPTS:
+            return False
+        delay = backoff(tries)
+        try:
+            output_path.unlink()  # Partial output; the retry writes the same name
+        except OSError:
+            pass
+        self.retry_targets[job] = (output_path, store_profile)
+        queue.retry(job, delay)
+        reason = "stalled" if result.stalled else f"exit code {result.returncode}"
+        self.log(f"Retrying {job.source.name} in {delay:.0f}s ({reason}, attempt {tries} of {MAX_ATTEMPTS})")
+        self.telemetry.emit("job_retried", source=str(job.source), attempt=tries, delay=delay,
+                            stalled=result.stalled, exit_code=result.returncode)
+        self.events.status(job, f"Retrying in {delay:.0f}s")
+        return True
+
+    # Conversions
+    def convert_job(self, i, job, runner, queue) -> None:
+        """Convert one file with its own ffmpeg run (or a few side by side, for very long files)."""
+        ffmpeg_path = self.ffmpeg_path
+        throttle = self.throttle
+        analyzer = self.analyzer
+        retrying = False
+        try:
+            if job in self.retry_targets:
+                output_path, store_profile = self.retry_targets.pop(job)
+                self.events.status(job, "Converting")
+            else:
+                started_job = self.start_job(i, job)
+                if started_job is None:
+                    return
+                output_path, store_profile = started_job
+            job_start = time.monotonic()
+
+            def on_progress(position, done):
+                self.on_progress(position, done, job, i)
+
+            # Archive members are piped to ffmpeg's stdin - nothing is extracted to disk.
+            # Under an I/O cap plain files are piped too, so the feed can be paced
+            from_stdin = job.archive is not None or throttle.io_limited
+            # Very long files are cut into time segments converted side by side - at full
+            # speed only, and not when loudness or BPM/key analysis needs the whole decode
+            segments = []
+            if not from_stdin and not throttle.enabled and not self.analyze_loudness and not analyzer:
+                segments = plan_segments(job)
+            if segments:
+                self.log(f"Converting {job.display_name} in {len(segments)} segments")
+                result = convert_segmented(
+                    runner, ffmpeg_path, job.source, output_path, segments,
+                    on_progress=on_progress, stall_timeout=self.stall_timeout
+                )
+                if result.returncode == 0 or result.stalled:
+                    retrying = self.retry_later(job, result, queue, output_path, store_profile)
+                    if not retrying:
+                        self.finish_job(job, output_path, store_profile, time.monotonic() - job_start, result)
+                    return
+                # A cut ffmpeg could not make (a duration the file doesn't have) - one run copes
+                error = result.stderr.strip().splitlines()[-1:] or ["unknown error"]
+                self.log(f"Segmented conversion of {job.display_name} failed ({error[0]}), converting in one run")
+
+            cmd = build_ffmpeg_command(ffmpeg_path, job.source, output_path, self.analyze_loudness, from_stdin)
+            # BPM/key analysis reads a second, mono output of the same decode
+            pending = analyzer.start(job) if analyzer else None
+            if pending:
+                cmd += pending.ffmpeg_args
+            stream = job.open_source(self.members) if from_stdin else None
+            result = None
+            io_weight = 1.0
+            if job.archive is None and job.stamp and job.stamp[0] > 0:
+                # Charge the AIFF ffmpeg will write against the cap along with the source
+                output_bytes = projected_output_bytes(job.total_samples, job.sample_rate, job.meta_bytes)
+                io_weight += output_bytes / job.stamp[0]
+            try:
+                result = runner.run(
+                    cmd,
+                    on_progress=on_progress,
+                    stall_timeout=self.stall_timeout,
+                    stdin=stream,
+                    io_weight=io_weight
+                )
+            finally:
+                if stream is not None:
+                    stream.close()
+                analysis = analyzer.finish(pending, result is not None and result.returncode == 0) if pending else None
+
+            retrying = self.retry_later(job, result, queue, output_path, store_profile)
+            if not retrying:
+                self.finish_job(job, output_path, store_profile, time.monotonic() - job_start, result, from_stdin,
+                                analysis)
+        except Exception as e:
+            self.fail_job(job, e)
+        finally:
+            if not retrying:
+                self.end_job(job)
+
+    def convert_group(self, items, runner, queue) -> None:
+        """Encode several short files with one ffmpeg process.
+
+        If the run fails, every file is redone through convert_job, so the
+        failure lands on the file that caused it and goes through the usual
+        retries and quarantine.
+        """
+        started_jobs = []  # (i, job, output_path, store_profile)
+        for i, job in items:
+            try:
+                started_job = self.start_job(i, job)
+            except Exception as e:
+                self.fail_job(job, e)
+                self.end_job(job)
+                continue
+            if started_job is None:
+                self.end_job(job)
+                continue
+            started_jobs.append((i, job) + started_job)
+        if not started_jobs:
+            return
+
+        group_start = time.monotonic()
+        cmd = build_group_command(self.ffmpeg_path, [(job.source, output_path)
+                                                     for _, job, output_path, _ in started_jobs])
+        try:
+            result = runner.run(cmd, stall_timeout=self.stall_timeout)
+        except Exception as e:
+            self.log(f"Grouped conversion failed: {e}")
+            result = None
+
+        if result is not None and result.returncode == 0:
+            share = (time.monotonic() - group_start) / len(started_jobs)
+            for _, job, output_path, store_profile in started_jobs:
+                try:
+                    self.finish_job(job, output_path, store_profile, share, result)
+                except Exception as e:
+                    self.fail_job(job, e)
+                finally:
+                    self.end_job(job)
+            return
+
+        for i, job, output_path, store_profile in started_jobs:
+            # Converted on its own into the output it was given
+            self.retry_targets[job] = (output_path, store_profile)
+            self.convert_job(i, job, runner, queue)
+
+    def convert_cue(self, items, runner, queue) -> None:
+        """Cut every pending track of a CUE sheet from one decode of its source file.
+
+        Tracks still waiting are taken along wherever they are in the queue - the
+        decode passes over them anyway. After a transient failure each track is
+        queued for a retry, and the first one to come up takes the others along again.
+        """
+        sheet = items[0][1].cue.sheet
+        siblings = queue.take([job for job in self.cue_sheets[sheet] if job is not items[0][1]])
+        with self.lock:
+            items = items + [(next(self.started), job) for job in siblings]
+        items.sort(key=lambda item: item[1].cue.start)
+
+        started_jobs = []  # (i, job, output_path, store_profile)
+        for i, job in items:
+            try:
+                if job in self.retry_targets:
+                    output_path, store_profile = self.retry_targets.pop(job)
+                    self.events.status(job, "Converting")
+                else:
+                    started_job = self.start_job(i, job)
+                    if started_job is None:
+                        self.end_job(job)
+                        continue
+                    output_path, store_profile = started_job
+            except Exception as e:
+                self.fail_job(job, e)
+                self.end_job(job)
+                continue
+            started_jobs.append((i, job, output_path, store_profile))
+        if not started_jobs:
+            return
+
+        def on_sheet_progress(position, done):
+            # ffmpeg reports the position in the whole file; each started track gets its part
+            for i, job, _, _ in started_jobs:
+                start = job.cue.start / CUE_FPS
+                if done or position > start:
+                    self.on_progress(position - start, done, job, i)
+
+        run_start = time.monotonic()
+        cmd = build_cue_command(self.ffmpeg_path, sheet.audio_path,
+                                [(job.cue, output_path) for _, job, output_path, _ in started_jobs],
+                                [job.tags for _, job, _, _ in started_jobs],
+                                self.analyze_loudness)
+        # BPM/key analysis reads the whole file from the same decode and splits it by track
+        pending = self.analyzer.start_sheet([job for _, job, _, _ in started_jobs]) if self.analyzer else None
+        if pending:
+            cmd += pending.ffmpeg_args
+        result = None
+        try:
+            # Room for every track's ebur128 summary in the kept stderr
+            result = runner.run(cmd, on_progress=on_sheet_progress, stall_timeout=self.stall_timeout,
+                                stderr_lines=STDERR_LINES + 16 * len(started_jobs))
+        except Exception as e:
+            for _, job, _, _ in started_jobs:
+                self.fail_job(job, e)
+                self.end_job(job)
+            return
+        finally:
+            analyses = self.analyzer.finish(pending, result is not None and result.returncode == 0) if pending else None
+
+        share = (time.monotonic() - run_start) / len(started_jobs)
+        for index, (_, job, output_path, store_profile) in enumerate(started_jobs):
+            retrying = False
+            try:
+                retrying = self.retry_later(job, result, queue, output_path, store_profile)
+                if not retrying:
+                    self.finish_job(job, output_path, store_profile, share, result,
+                                    analysis=analyses[index] if analyses else None, meter=track_meter(index))
+            except Exception as e:
+                self.fail_job(job, e)
+            finally:
+                if not retrying:
+                    self.end_job(job)
+
+    def _keep_previous(self) -> None:
+        """Outputs kept from earlier batches: nothing to do, or a tag rewrite and rename.
+
+        A retag that fails falls back to a full conversion.
+        """
+        for job, output in self.up_to_date:
+            if self.misplaced(job, output):
+                # Same audio and tags, but the layout or naming puts it elsewhere now
+                previous = output
+                try:
+                    output = self.retag_output(job, previous)
+                except Exception as e:
+                    self.log(f"Could not move {previous.name}: {e}")
+                    output = previous
+                if output != previous:
+                    self.log(f"Moved {previous.name} -> {output.relative_to(self.output_dir)}")
+            self.converted += 1
+            self.flag_lossy(job, output)
+            self.ledger.record(job, self.profile, output)  # Refreshes the stamp, so the next batch skips the hash
+            self.add_to_rekordbox(output, job.tags)
+            self.telemetry.emit("job_finished", source=str(job.source), output=str(output), result="unchanged",
+                                seconds=0.0, audio_seconds=round(job.duration, 3))
+            self.events.status(job, "Up to date")
+        for job, previous in self.retag_jobs:
+            job_start = time.monotonic()
+            try:
+                output = self.retag_output(job, previous)
+            except Exception as e:
+                self.log(f"Could not retag {previous.name}, converting {job.source.name} again: {e}")
+                self.jobs.append(job)
+                continue
+            self.converted += 1
+            self.retagged += 1
+            self.flag_lossy(job, output)
+            self.ledger.record(job, self.profile, output)
+            self.add_to_rekordbox(output, job.tags)
+            if output != previous:
+                self.log(f"Retagged {previous.name} -> {output.relative_to(self.output_dir)}")
+            self.telemetry.emit("job_finished", source=str(job.source), output=str(output), result="retagged",
+                                seconds=round(time.monotonic() - job_start, 3),
+                                audio_seconds=round(job.duration, 3))
+            self.events.status(job, "Retagged")
+
+    def is_short(self, job) -> bool:
+        """True for a plain file short enough to share an ffmpeg run with others."""
+        return job.archive is None and job.cue is None and 0 < job.duration <= GROUP_MAX_SECONDS
+
+    def batch_limit(self) -> int:
+        """Files the next ffmpeg run may take on.
+
+        A grouped run has no per-file BPM/key output and can't be paced by
+        the I/O cap, so those turn grouping off - the cap from the next run on.
+        """
+        if self.analyzer or self.throttle.io_limited:
+            return 1
+        return self.group_size
+
+    def drain(self, queue, runner) -> None:
+        """Convert jobs from a queue until it is empty - one, a group or a CUE sheet at a time."""
+        while True:
+            group = queue.pop_group(self.batch_limit(), self.is_short)
+            if not group:
+                break
+            if self.readahead:
+                self.readahead.hint([job.archive or job.source for job in group + queue.peek(READAHEAD_FILES)])
+            if self.members:
+                # The TAR walk waits for members already popped instead of passing them
+                for job in group:
+                    self.members.expect(job.archive, job.member)
+            with self.lock:
+                items = [(next(self.started), job) for job in group]
+            if len(items) > 1:
+                self.convert_group(items, runner, queue)
+            elif items[0][1].cue is not None:
+                self.convert_cue(items, runner, queue)
+            else:
+                self.convert_job(items[0][0], items[0][1], runner, queue)
+
+    def _convert_members(self, queue) -> None:
+        """Drain the archive member queue on a pool thread, with its own event loop for ffmpeg."""
+        member_runner = FFmpegRunner(self.throttle)
+        try:
+            self.drain(queue, member_runner)
+        finally:
+            member_runner.close()
+
+    def _convert_pending(self) -> None:
+        """Convert every job the ledger couldn't keep."""
+        # Pending jobs wait in priority queues the GUI can reorder mid-batch ("Convert Next").
+        # Plain files run one at a time; archive members a few at a time, each pool
+        # thread with its own event loop for ffmpeg
+        plain_queue = JobQueue([job for job in self.jobs if job.archive is None])
+        member_queue = JobQueue([job for job in self.jobs if job.archive is not None])
+        self.job_queues = [plain_queue, member_queue]
+
+        # Short plain files are grouped into shared ffmpeg runs; loudness analysis needs
+        # one ebur128 summary per process, so it turns grouping off
+        self.group_size = 1 if self.analyze_loudness else max(1, self.options.get('group_size', 1))
+
+        # Tracks of one CUE sheet share a single decode (convert_cue)
+        for job in self.jobs:
+            if job.cue is not None:
+                self.cue_sheets.setdefault(job.cue.sheet, []).append(job)
+
+        # Spinning disks: the files queued next are read in while the current one converts
+        self.readahead = ReadAhead(PREFETCH_BYTES) if self.options.get('hdd_order') else None
+
+        runner = FFmpegRunner(self.throttle)
+        try:
+            self.drain(plain_queue, runner)
+        finally:
+            runner.close()
+
+        if len(member_queue):
+            # Members are streamed out of one pass through each compressed TAR, in archive order
+            self.members = MemberReader((job.archive, job.member) for job in member_queue.peek(len(member_queue)))
+            try:
+                with ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS) as pool:
+                    futures = [pool.submit(self._convert_members, member_queue) for _ in range(ARCHIVE_WORKERS)]
+                    for future in futures:
+                        future.result()
+            finally:
+                self.members.close()
+                self.members = None
+        self.job_queues = []
+
+    # Finishing
+    def copy_to_usb(self) -> str:
+        """Copy staged outputs to the stick, then point their jobs and Rekordbox entries at the copies.
+
+        Returns a note for the summary when files were left staged ("" otherwise).
+        """
+        export = self.export
+
+        def on_copy(done, total):
+            self.events.message(f"Copying {done} of {total} files to {export.target_dir.name}...")
+
+        copy_start = time.monotonic()
+        try:
+            placed = export.copy(on_progress=on_copy)
+        except Exception as e:
+            self.log(f"USB export stopped: {e}")
+            placed = {}
+        copied = sum(final.stat().st_size for final in placed.values())
+        seconds = time.monotonic() - copy_start
+        self.log(f"USB export: {len(placed)} file(s), {format_bytes(copied)} copied in "
+                 f"{format_duration(seconds)}"
+                 + (f", {len(export.pending)} left staged for the next export" if export.pending else ""))
+        errors = {export.staging_dir / name: error for name, error in export.errors}
+        for staged, error in errors.items():
+            self.log(f"  Not copied: {staged.relative_to(export.staging_dir)}: {error}")
+
+        for staged, job in self.staged_jobs:
+            final = placed.get(staged)
+            if final is None:
+                if staged in errors:
+                    self.events.status(job, f"Staged, not copied: {errors[staged]}")
+                continue
+            job.output_path = final
+            self.add_to_rekordbox(final, job.tags)
+            self.events.status(job, "Done")
+        if export.pending:
+            return f"USB export: {len(export.pending)} file(s) not copied yet, staged for the next export"
+        return ""
+
+    def write_loudness_report(self) -> None:
+        """Write loudness values for the batch to a CSV report in the output folder."""
+        if not self.loudness_report:
+            return
+
+        report_path = self.output_dir / "loudness_report.csv"
+        try:
+            with open(report_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["file", "integrated_lufs", "lra_lu", "true_peak_dbfs", "replaygain_db"])
+                for name, loudness in self.loudness_report:
+                    integrated = loudness.get('integrated', float('-inf'))
+                    gain = -18.0 - integrated if integrated != float('-inf') else ""
+                    writer.writerow([
+                        name,
+                        integrated,
+                        loudness.get('lra', ""),
+                        loudness.get('true_peak', ""),
+                        f"{gain:.2f}" if gain != "" else "",
+                    ])
+        except Exception as e:
+            self.log(f"Could not write loudness report: {e}")
+
+    def _finish(self) -> None:
+        """Save the batch's state, log its summaries and report the counts."""
+        log = self.log
+        if self.analyzer:
+            self.analyzer.close()
+            log(f"BPM/key analysis: {self.analyzer.analysed} analysed, {self.analyzer.cache.hits} from cache")
+
+        try:
+            record_throughput(self.mode_stats.audio[False], self.mode_stats.seconds[False])
+        except OSError as e:
+            log(f"Could not save throughput calibration: {e}")
+
+        usb_note = self.copy_to_usb() if self.export else ""
+        self.telemetry.emit("batch_finished", converted=self.converted, failed=self.failed,
+                            total=self.total_files, output_dir=str(self.output_dir),
+                            seconds=round(time.monotonic() - self.batch_start, 3))
+
+        # Background throughput against full speed - this batch's if it ran both ways,
+        # otherwise the speed remembered from earlier full-speed batches
+        background_note = self.mode_stats.summary(measured_throughput())
+        if background_note:
+            log(background_note)
+
+        self.ledger.save()
+        ledger_note = ""
+        if self.up_to_date or self.retagged:
+            ledger_note = f"Up to date: {len(self.up_to_date)}, retagged: {self.retagged} (not re-encoded)"
+            log(ledger_note)
+
+        # Files that failed every attempt - skipped by later batches until they change
+        self.quarantine.save()
+        quarantine_note = ""
+        if self.quarantine.added:
+            quarantine_note = f"Quarantined: {len(self.quarantine.added)} (use Convert Selected to retry)"
+            log(f"Quarantined {len(self.quarantine.added)} file(s) after {MAX_ATTEMPTS} attempts:")
+            for job, error in self.quarantine.added:
+                log(f"  {job.source}: {error}")
+        lossy_note = ""
+        if self.suspects:
+            lossy_note = (f"Lossy sources: {len(self.suspects)} suspect(s), {self.lossy_skipped} skipped"
+                          if self.lossy_skipped else f"Lossy sources: {len(self.suspects)} suspect(s), tagged")
+            log(lossy_note)
+        note = "\n".join(text for text in (usb_note, ledger_note, quarantine_note, lossy_note, background_note)
+                         if text)
+
+        if self.store:
+            try:
+                self.store.save()
+                freed = self.store.gc()
+                log(f"Output store: {self.store.hits} reused, {self.store.misses} encoded"
+                    + (f", {freed // (1024 * 1024)} MB freed" if freed else ""))
+            except Exception as e:
+                log(f"Output store cleanup failed: {e}")
+
+        if self.analyze_loudness:
+            self.write_loudness_report()
+
+        artwork_cache = self.artwork_cache
+        if artwork_cache and (artwork_cache.hits or artwork_cache.misses):
+            log(f"Artwork cache: {artwork_cache.hits} hit(s), {artwork_cache.misses} resized "
+                f"({artwork_cache.hit_rate:.0%} hit rate)")
+
+        if self.rekordbox:
+            try:
+                xml_path = self.rekordbox.write()
+                log(f"Rekordbox collection written to {xml_path} "
+                    f"({self.rekordbox.updated} updated, {self.rekordbox.unchanged} unchanged)")
+            except Exception as e:
+                log(f"Could not write Rekordbox collection: {e}")
+
+        self.events.complete(self.converted, self.failed, self.total_files, note)
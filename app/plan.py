@@ -0,0 +1,294 @@
+"""Conversion plan: every source probed once, shared by the preview and the converter."""
+from pathlib import Path
+
+from app.core import (
+    open_audio, tags_from_audio, build_filename_from_tags, source_total_samples, aiff_meta_bytes
+)
+from app.artwork import artwork_from_audio, artwork_digest
+from app.archive import Archive, is_archive, open_member
+from app.cue import CUE_FPS, find_cue_sheet, parse_cue
+from app.locality import ReadAhead, READAHEAD_FILES
+
+# Probed state a Job carries to another process (the conversion daemon) in to_wire()
+WIRE_FIELDS = ('tags', 'duration', 'sample_rate', 'channels', 'total_samples', 'meta_bytes',
+               'artwork_digest', 'clean_name', 'probe_error', 'status')
+# What probe() reads from the source file itself, before a CUE track narrows it
+PROBE_FIELDS = ('duration', 'sample_rate', 'channels', 'total_samples', 'meta_bytes',
+                'artwork_digest', 'probe_error')
+
+
+class Job:
+    """One planned conversion: source, probed stream info, tags and output name."""
+
+    def __init__(self, source: Path, archive: Path = None, member: str = None, cue=None):
+        self.source = source  # For archive members: archive path / member name, never opened
+        self.archive = archive  # ZIP/TAR holding the source, or None for plain files
+        self.member = member  # Member name inside the archive
+        self.cue = cue  # CueTrack when the job is one track cut from a longer source
+        self.stamp = None  # (size, mtime_ns) of the source when it was probed
+        self.tags = {}
+        self.duration = 0.0
+        self.sample_rate = 0
+        self.channels = 0
+        self.total_samples = 0  # Per channel, after encoder delay/padding
+        self.meta_bytes = 0  # Text chunks ffmpeg copies into the AIFF
+        self.artwork_digest = None  # SHA-1 of the embedded cover, if any
+        self.clean_name = source.stem  # Sanitized output name without extension
+        self.output_path = None  # Resolved when the job is converted
+        self.profile = None  # Conversion profile, set when the batch starts
+        self.probe_error = None  # Why tags/stream info could not be read, if they couldn't
+        self.preflight = None  # (verdict, reason) from the header check
+        self.lossy_cutoff = None  # Low-pass (Hz) of a FLAC that looks decoded from a lossy file
+        self.lossy_checked = False  # lossy_cutoff holds the lossy scan's verdict for this probe
+        self.status = "Pending"
+        self.item = None  # Treeview row id
+
+    @property
+    def display_name(self) -> str:
+        """Source name for the file list - CUE tracks add their track number."""
+        if self.cue is not None:
+            return f"{self.source.name} #{self.cue.number:02d}"
+        return self.source.name
+
+    @property
+    def key(self) -> str:
+        """Identifies the job across batches and processes - CUE tracks of one file add their cut."""
+        return f"{self.source}#{self.cue.span}" if self.cue is not None else str(self.source)
+
+    @property
+    def output_name(self) -> str:
+        """Planned output file name."""
+        return self.clean_name + ".aiff"
+
+    def open_source(self, members=None):
+        """Binary file object of the source - archive members are decompressed on the fly.
+
+        members is the batch's MemberReader, if it has one.
+        """
+        if self.archive is not None:
+            if members is not None:
+                return members.open(self.archive, self.member)
+            return open_member(self.archive, self.member)
+        return open(self.source, "rb")
+
+    def probe(self, fileobj=None) -> None:
+        """Read tags and stream info with a single open of the source.
+
+        Archive members are read through fileobj when the caller already has
+        the archive open, otherwise the member is opened on its own.
+        """
+        try:
+            self.stamp = self.current_stamp()
+        except OSError:
+            self.stamp = None
+        self.lossy_cutoff = None  # A changed source is scanned again
+        self.lossy_checked = False
+
+        self.tags = {}
+        self.artwork_digest = None
+        self.probe_error = None
+        own = None
+        try:
+            if self.archive is not None and fileobj is None:
+                fileobj = own = self.open_source()
+            audio = open_audio(self.source, fileobj)
+            if audio is not None:
+                self.tags = tags_from_audio(audio)
+                self.duration = audio.info.length
+                self.sample_rate = getattr(audio.info, 'sample_rate', 0)
+                self.channels = getattr(audio.info, 'channels', 0)
+                self.total_samples = source_total_samples(self.source, audio, fileobj)
+                self.meta_bytes = aiff_meta_bytes(audio)
+                artwork = artwork_from_audio(audio)
+                self.artwork_digest = artwork_digest(artwork) if artwork else None
+        except Exception as e:
+            # Keep going with the file name - the pre-flight check reports this
+            self.probe_error = str(e)[:200] or type(e).__name__
+        finally:
+            if own is not None:
+                own.close()
+        self._name()
+
+    def probe_from(self, probed: "Job") -> None:
+        """Take tags and stream info from a job that probed the same source file.
+
+        The tracks of a CUE sheet share one probe of their file this way,
+        each narrowing its own copy to the track.
+        """
+        try:
+            self.stamp = self.current_stamp()
+        except OSError:
+            self.stamp = None
+        self.lossy_cutoff = None  # A changed source is scanned again
+        self.lossy_checked = False
+        self.tags = dict(probed.tags)
+        for field in PROBE_FIELDS:
+            setattr(self, field, getattr(probed, field))
+        self._name()
+
+    def _name(self) -> None:
+        """Narrow the probed file to a CUE track, if there is one, and name the output."""
+        if self.cue is not None:
+            self._apply_cue()
+            # Untitled tracks fall back to "<file> - Track 03" rather than the file name alone
+            fallback = self.source.with_name(f"{self.source.stem} - Track {self.cue.number:02d}.cue")
+            self.clean_name = build_filename_from_tags(fallback, self.tags)
+        else:
+            self.clean_name = build_filename_from_tags(self.source, self.tags)
+
+    def _apply_cue(self) -> None:
+        """Narrow the probed file down to this job's track: its tags, length and sample count."""
+        track = self.cue
+        self.tags = track.tags(self.tags)
+        rate = self.sample_rate
+        if not rate:
+            return
+        start = track.start * rate // CUE_FPS
+        end = track.end * rate // CUE_FPS if track.end is not None else self.total_samples
+        self.total_samples = max(0, min(end, self.total_samples) - start)
+        self.duration = self.total_samples / rate
+
+    def to_wire(self) -> dict:
+        """The probed job as JSON, so another process can convert it without probing it again."""
+        wire = {field: getattr(self, field) for field in WIRE_FIELDS}
+        wire['source'] = str(self.source)
+        wire['archive'] = str(self.archive) if self.archive is not None else None
+        wire['member'] = self.member
+        wire['stamp'] = list(self.stamp) if self.stamp else None
+        if self.cue is not None:
+            wire['cue'] = {'sheet': str(self.cue.sheet.path), 'span': self.cue.span}
+        return wire
+
+    @classmethod
+    def from_wire(cls, wire: dict, sheets: dict = None) -> "Job":
+        """A job sent with to_wire(). CUE tracks are looked up again in their sheet by their cut.
+
+        sheets caches the parsed sheets {(sheet, audio file): CueSheet}, so the
+        tracks of one sheet share it. Raises ValueError for a track its sheet no
+        longer has.
+        """
+        source = Path(wire['source'])
+        cue = None
+        if wire.get('cue'):
+            sheet_path = Path(wire['cue']['sheet'])
+            if sheets is None:
+                sheets = {}
+            if (sheet_path, source) not in sheets:
+                try:
+                    sheets[(sheet_path, source)] = parse_cue(sheet_path, source)
+                except OSError as e:
+                    raise ValueError(f"could not read {sheet_path.name}: {e}")
+            sheet = sheets[(sheet_path, source)]
+            cue = next((track for track in sheet.tracks if track.span == wire['cue']['span']), None) if sheet else None
+            if cue is None:
+                raise ValueError(f"{sheet_path.name} no longer has the track {wire['cue']['span']}")
+        archive = Path(wire['archive']) if wire.get('archive') else None
+        job = cls(source, archive, wire.get('member'), cue)
+        for field in WIRE_FIELDS:
+            if field in wire:
+                setattr(job, field, wire[field])
+        job.stamp = tuple(wire['stamp']) if wire.get('stamp') else None
+        return job
+
+    def current_stamp(self) -> tuple:
+        """(size, mtime_ns) of the source or its archive; CUE tracks add their sheet's."""
+        st = (self.archive or self.source).stat()
+        if self.cue is None:
+            return (st.st_size, st.st_mtime_ns)
+        sheet = self.cue.sheet.path.stat()
+        return (st.st_size, st.st_mtime_ns, sheet.st_size, sheet.st_mtime_ns)
+
+    def is_stale(self) -> bool:
+        """True if the source (or its archive, or its CUE sheet) changed or vanished since it was probed."""
+        try:
+            return self.stamp != self.current_stamp()
+        except OSError:
+            return True
+
+
+class ConversionPlan:
+    """Ordered jobs for a batch, built once and refreshed only where sources changed."""
+
+    def __init__(self, jobs: list, inputs: list = None):
+        self.jobs = jobs
+        self.inputs = inputs if inputs is not None else [job.source for job in jobs]
+
+    @classmethod
+    def build(cls, files: list, readahead: bool = False, on_jobs=None) -> "ConversionPlan":
+        """Probe every source file; ZIP/TAR archives become one job per audio member,
+        files with a CUE sheet one job per track.
+
+        With readahead the heads of the next few files are requested from the
+        disk while each one is probed (for files in disk_order on hard disks).
+        on_jobs(jobs), if given, gets each file's jobs as soon as they are probed.
+        """
+        jobs = []
+        listing = {}  # Folder -> its .cue files, listed once
+        hints = ReadAhead() if readahead else None
+        for index, file_path in enumerate(files):
+            file_path = Path(file_path)
+            if hints:
+                hints.hint(files[index:index + READAHEAD_FILES])
+            if is_archive(file_path):
+                new_jobs = cls._archive_jobs(file_path)
+            else:
+                sheet = find_cue_sheet(file_path, listing)
+                if sheet is not None:
+                    new_jobs = cls._cue_jobs(sheet)
+                else:
+                    job = Job(file_path)
+                    job.probe()
+                    new_jobs = [job]
+            jobs.extend(new_jobs)
+            if on_jobs and new_jobs:
+                on_jobs(new_jobs)
+        return cls(jobs, [Path(f) for f in files])
+
+    @staticmethod
+    def _cue_jobs(sheet) -> list:
+        """One job per track of a CUE sheet, all reading the same source file - probed once."""
+        probed = Job(sheet.audio_path)
+        probed.probe()
+        jobs = []
+        for track in sheet.tracks:
+            job = Job(sheet.audio_path, cue=track)
+            job.probe_from(probed)
+            jobs.append(job)
+        # A sheet longer than its file leaves empty tracks at the end
+        return [job for job in jobs if job.total_samples > 0 or job.probe_error]
+
+    @staticmethod
+    def _archive_jobs(archive_path: Path) -> list:
+        """Probe every audio member through one archive handle, without extracting."""
+        jobs = []
+        try:
+            with Archive(archive_path) as archive:
+                for member in archive.members():
+                    job = Job(archive_path / member, archive_path, member)
+                    with archive.open(member) as stream:
+                        job.probe(stream)
+                    jobs.append(job)
+        except Exception as e:
+            print(f"Could not read archive {archive_path.name}: {e}")
+        return jobs
+
+    def sources(self) -> list:
+        """Input paths the plan was built from (archives, not their members)."""
+        return list(self.inputs)
+
+    def refresh(self) -> list:
+        """Re-probe jobs whose source changed since planning; returns those jobs.
+
+        The stale tracks of a CUE file share one probe of it.
+        """
+        stale = [job for job in self.jobs if job.is_stale()]
+        probed = {}  # CUE source -> plain probe of the file
+        for job in stale:
+            if job.cue is None:
+                job.probe()
+                continue
+            if job.source not in probed:
+                probed[job.source] = Job(job.source)
+                probed[job.source].probe()
+            job.probe_from(probed[job.source])
+        return stale
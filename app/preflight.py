@@ -0,0 +1,367 @@
+"""Pre-flight check: read just the headers of each source and sort out broken files before ffmpeg runs.
+
+Sources are memory-mapped, so only the pages actually inspected - the
+first and last few KB - are read from disk.
+"""
+import mmap
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from app.archive import MemberReader
+
+OK = "ok"
+SUSPECT = "suspect"
+BROKEN = "broken"
+
+PREFLIGHT_WORKERS = 8  # Header reads are I/O bound
+HEAD_BYTES = 256 * 1024  # How much of an archive member is read for its check
+TAIL_BYTES = 64 * 1024  # Where the last FLAC frame header is looked for
+MIN_AUDIO_BYTES = 1024
+
+_FLAC_BLOCK_SIZES = {1: 192, 2: 576, 3: 1152, 4: 2304, 5: 4608,
+                     8: 256, 9: 512, 10: 1024, 11: 2048, 12: 4096, 13: 8192, 14: 16384, 15: 32768}
+
+# MPEG audio header tables (kbps / Hz)
+_MP3_BITRATES = {
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+
+
+def _crc8(data: bytes) -> int:
+    """CRC-8 (polynomial 0x07) as used by FLAC frame headers."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _utf8_number(data: bytes, pos: int):
+    """Decode FLAC's UTF-8 style coded frame/sample number; returns (value, next pos) or None."""
+    if pos >= len(data):
+        return None
+    first = data[pos]
+    if first < 0x80:
+        return first, pos + 1
+    length = 0
+    mask = 0x80
+    while first & mask:
+        length += 1
+        mask >>= 1
+    if length < 2 or length > 7 or pos + length > len(data):
+        return None
+    value = first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        if byte & 0xC0 != 0x80:
+            return None
+        value = (value << 6) | (byte & 0x3F)
+    return value, pos + length
+
+
+def _flac_frame_start(data: bytes, pos: int, info: dict):
+    """First sample and block size of a FLAC frame header at pos, or None if it isn't one.
+
+    The header CRC-8 must match and its fields must agree with STREAMINFO, so
+    sync-like bytes inside compressed audio are not mistaken for a frame.
+    """
+    if pos + 6 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xFE != 0xF8:
+        return None
+    variable = data[pos + 1] & 1
+    size_code = data[pos + 2] >> 4
+    rate_code = data[pos + 2] & 0x0F
+    channel_code = data[pos + 3] >> 4
+    if size_code == 0 or rate_code == 15 or channel_code > 10 or data[pos + 3] & 1:
+        return None
+    if channel_code < 8 and channel_code + 1 != info['channels']:
+        return None
+    if channel_code >= 8 and info['channels'] != 2:
+        return None
+
+    decoded = _utf8_number(data, pos + 4)
+    if decoded is None:
+        return None
+    number, cursor = decoded
+
+    if size_code == 6:
+        if cursor + 1 > len(data):
+            return None
+        block_size = data[cursor] + 1
+        cursor += 1
+    elif size_code == 7:
+        if cursor + 2 > len(data):
+            return None
+        block_size = struct.unpack(">H", data[cursor:cursor + 2])[0] + 1
+        cursor += 2
+    else:
+        block_size = _FLAC_BLOCK_SIZES[size_code]
+    cursor += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+
+    if cursor >= len(data) or _crc8(data[pos:cursor]) != data[cursor]:
+        return None
+    start = number if variable else number * info['max_block']
+    return start, block_size
+
+
+def check_flac(data, size: int, whole: bool = True):
+    """Verdict for FLAC bytes: fLaC marker, STREAMINFO, first frame and truncation.
+
+    With whole=False data is only the head of the file and the length checks are skipped.
+    """
+    offset = 0
+    if data[:3] == b"ID3":
+        # Tolerated by most decoders but not by the spec
+        offset = 10 + _syncsafe(data[6:10])
+        if data[offset:offset + 4] != b"fLaC":
+            return BROKEN, "ID3 tag is not followed by a FLAC stream"
+        prefix = "ID3 tag in front of the FLAC stream"
+    else:
+        prefix = ""
+    if data[offset:offset + 4] != b"fLaC":
+        return BROKEN, f"not a FLAC file ({_sniff(data)})"
+
+    pos = offset + 4
+    header = data[pos:pos + 4]
+    if len(header) < 4 or header[0] & 0x7F != 0:
+        return BROKEN, "STREAMINFO block missing"
+    streaminfo = data[pos + 4:pos + 4 + 34]
+    if len(streaminfo) < 34:
+        return BROKEN, "truncated STREAMINFO"
+
+    min_block, max_block = struct.unpack(">HH", streaminfo[0:4])
+    packed = int.from_bytes(streaminfo[10:18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if sample_rate == 0 or max_block < 16 or min_block > max_block:
+        return BROKEN, "invalid STREAMINFO"
+    info = {'channels': channels, 'max_block': max_block}
+
+    # Walk the metadata blocks to the first audio frame
+    while True:
+        header = data[pos:pos + 4]
+        if len(header) < 4:
+            if not whole:
+                return OK, ""  # Metadata (cover art) runs past the head that was read
+            return BROKEN, "truncated metadata"
+        length = int.from_bytes(header[1:4], "big")
+        pos += 4 + length
+        if header[0] & 0x80:
+            break
+        if pos > size:
+            if not whole:
+                return OK, ""
+            return BROKEN, "metadata runs past the end of the file"
+
+    audio_bytes = size - pos
+    if audio_bytes < MIN_AUDIO_BYTES:
+        return BROKEN, "no audio frames"
+    if _flac_frame_start(data, pos, info) is None:
+        return BROKEN, "first audio frame is corrupt"
+
+    if not whole:
+        return (SUSPECT, prefix) if prefix else (OK, "")
+
+    if total_samples:
+        raw_bytes = total_samples * channels * bits // 8
+        if audio_bytes > raw_bytes * 1.1 + 65536:
+            return SUSPECT, "more audio data than STREAMINFO's length accounts for"
+
+        # Truncation: the last frame header in the tail must reach the declared length
+        tail = data[max(pos, size - TAIL_BYTES):size]
+        reached = None
+        index = tail.rfind(b"\xff")
+        while index >= 0:
+            frame = _flac_frame_start(tail, index, info)
+            if frame:
+                end = frame[0] + frame[1]
+                reached = end if reached is None else max(reached, end)
+            index = tail.rfind(b"\xff", 0, index)
+        if reached is not None and reached < total_samples:
+            return BROKEN, (f"truncated: audio stops at {reached / sample_rate:.1f}s "
+                            f"of {total_samples / sample_rate:.1f}s")
+    else:
+        return SUSPECT, "STREAMINFO has no length"
+
+    return (SUSPECT, prefix) if prefix else (OK, "")
+
+
+def _syncsafe(data: bytes) -> int:
+    """Decode an ID3v2 syncsafe integer."""
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3] if len(data) == 4 else 0
+
+
+def _mp3_frame(data, pos: int):
+    """(version, layer, frame bytes, sample rate, mono) of an MPEG audio header at pos, or None."""
+    if pos + 4 > len(data):
+        return None
+    header = struct.unpack(">I", data[pos:pos + 4])[0]
+    if header >> 21 != 0x7FF:
+        return None
+    version = {3: 1, 2: 2, 0: 25}.get((header >> 19) & 3)
+    layer = 4 - ((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 3
+    if version is None or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    if layer != 3:
+        return version, layer, 0, 0, False
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, 3)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header >> 9) & 1
+    frame_bytes = (144 if version == 1 else 72) * bitrate // sample_rate + padding
+    return version, layer, frame_bytes, sample_rate, (header >> 6) & 3 == 3
+
+
+def check_mp3(data, size: int, whole: bool = True):
+    """Verdict for MP3 bytes: sync, two consecutive layer III frames, Xing/VBRI length vs file size.
+
+    With whole=False data is only the head of the file and the length check is skipped.
+    """
+    offset = 0
+    if data[:3] == b"ID3":
+        offset = 10 + _syncsafe(data[6:10]) + (10 if len(data) > 5 and data[5] & 0x10 else 0)
+        if offset >= size:
+            return BROKEN, "ID3 tag but no audio"
+
+    # Another format under an .mp3 name (AAC, M4A, WAV...) fails here, not in ffmpeg
+    if not _mp3_frame(data, offset):
+        kind = _sniff(data[offset:])
+        if kind != "unknown contents":
+            return BROKEN, f"not an MP3 ({kind})"
+
+    # A little junk before the first frame is common; a lot means something else
+    window = data[offset:offset + 4096]
+    index = window.find(b"\xff")
+    frame = None
+    while index >= 0:
+        frame = _mp3_frame(window, index)
+        if frame:
+            break
+        index = window.find(b"\xff", index + 1)
+    if not frame:
+        return BROKEN, f"no MPEG audio frames ({_sniff(data[offset:])})"
+
+    version, layer, frame_bytes, sample_rate, mono = frame
+    if layer != 3:
+        return BROKEN, f"MPEG layer {layer} audio, not MP3"
+    start = offset + index
+
+    following = _mp3_frame(data, start + frame_bytes)
+    if start + frame_bytes < size and not following:
+        return BROKEN, "first frame is not followed by another - corrupt or not MP3"
+
+    verdict = (SUSPECT, f"{index} bytes of junk before the first frame") if index > 0 else (OK, "")
+
+    # Declared stream length from the Xing/Info or VBRI header
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = data[start + 4 + side_info:start + 4 + side_info + 16]
+    declared = None
+    if xing[:4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", xing[4:8])[0]
+        if flags & 2:
+            field = 12 if flags & 1 else 8
+            declared = struct.unpack(">I", xing[field:field + 4])[0]
+    else:
+        vbri = data[start + 36:start + 36 + 14]
+        if vbri[:4] == b"VBRI":
+            declared = struct.unpack(">I", vbri[10:14])[0]
+
+    if declared and whole:
+        available = size - start
+        if available < declared * 0.95:
+            return BROKEN, f"truncated: {available} of {declared} bytes of audio"
+    return verdict
+
+
+def _sniff(data) -> str:
+    """Best guess at what a mislabeled file really is."""
+    head = bytes(data[:12])
+    if head[4:8] == b"ftyp":
+        return "looks like MP4/M4A"
+    if head[:4] == b"RIFF":
+        return "looks like WAV"
+    if head[:4] == b"fLaC":
+        return "looks like FLAC"
+    if head[:4] == b"OggS":
+        return "looks like Ogg"
+    if head[:4] == b"FORM":
+        return "looks like AIFF"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "looks like AAC (ADTS)"
+    if head[:4] == b"ADIF":
+        return "looks like AAC (ADIF)"
+    if not head:
+        return "empty"
+    return "unknown contents"
+
+
+def check_bytes(data, size: int, suffix: str, whole: bool = True):
+    """Verdict for a source's bytes; whole=False when data is only the head of a larger file."""
+    if size == 0:
+        return BROKEN, "empty file"
+    if suffix == ".flac":
+        return check_flac(data, size, whole)
+    if suffix == ".mp3":
+        return check_mp3(data, size, whole)
+    return SUSPECT, "unknown file type"
+
+
+def check_job(job, members=None):
+    """(verdict, reason) for a planned job, reading only what the checks need.
+
+    members is a MemberReader for the batch's archive members.
+    """
+    suffix = job.source.suffix.lower()
+    try:
+        if job.archive is not None:
+            # Members can't be mapped; check the head only
+            with job.open_source(members) as f:
+                head = f.read(HEAD_BYTES)
+            verdict = check_bytes(head, len(head), suffix, whole=len(head) < HEAD_BYTES)
+        else:
+            with open(job.source, "rb") as f:
+                size = f.seek(0, 2)
+                if size == 0:
+                    return BROKEN, "empty file"
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    verdict = check_bytes(data, size, suffix)
+    except (OSError, ValueError) as e:
+        return BROKEN, f"unreadable: {e}"
+
+    if verdict[0] == OK and getattr(job, 'probe_error', None):
+        return SUSPECT, f"tags unreadable: {job.probe_error}"
+    return verdict
+
+
+class PreflightReport:
+    """Jobs sorted into ok / suspect / broken, with a reason for the last two."""
+
+    def __init__(self):
+        self.ok = []
+        self.suspect = []  # (job, reason) - converted, but worth a look
+        self.broken = []  # (job, reason) - skipped
+
+
+def preflight(jobs: list, workers: int = PREFLIGHT_WORKERS) -> PreflightReport:
+    """Check every job's headers in a thread pool; sets job.preflight to (verdict, reason)."""
+    report = PreflightReport()
+    archived = [(job.archive, job.member) for job in jobs if job.archive is not None]
+    members = MemberReader(archived)
+    # Every member is read, so a compressed TAR's walk hands them out in order
+    for archive_path, member in archived:
+        members.expect(archive_path, member)
+    with members, ThreadPoolExecutor(max_workers=workers) as pool:
+        verdicts = list(pool.map(lambda job: check_job(job, members), jobs))
+    for job, (verdict, reason) in zip(jobs, verdicts):
+        job.preflight = (verdict, reason)
+        if verdict == BROKEN:
+            report.broken.append((job, reason))
+        elif verdict == SUSPECT:
+            report.suspect.append((job, reason))
+        else:
+            report.ok.append(job)
+    return report
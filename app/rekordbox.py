@@ -0,0 +1,116 @@
+"""Rekordbox collection.xml export for converted AIFF files."""
+import json
+import os
+from datetime import date
+from pathlib import Path
+from urllib.parse import quote
+from xml.sax.saxutils import XMLGenerator
+
+from mutagen.aiff import AIFF
+
+COLLECTION_NAME = "collection.xml"
+CACHE_NAME = ".rekordbox_cache.json"  # Per-output attributes from earlier runs
+
+
+class RekordboxExporter:
+    """Keep a Rekordbox collection.xml in sync with an output folder.
+
+    Track attributes are cached next to the XML, keyed by output path and
+    stamped with the file's size and mtime. Only outputs whose stamp changed
+    are re-read; the XML itself is streamed out entry by entry, so no DOM is
+    ever built, even for 100k-track collections.
+    """
+
+    def __init__(self, output_dir: Path):
+        """Load attributes cached by earlier exports into this folder."""
+        self.output_dir = output_dir
+        self.xml_path = output_dir / COLLECTION_NAME
+        self.cache_path = output_dir / CACHE_NAME
+        self.entries = {}  # str(output path) -> {'stamp': [size, mtime_ns], 'attrs': {...}}
+        self.updated = 0
+        self.unchanged = 0
+
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def update(self, output_path: Path, tags: dict) -> None:
+        """Record a converted output, re-reading it only if it changed on disk."""
+        key = str(output_path.resolve())
+        st = output_path.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+
+        cached = self.entries.get(key)
+        if cached and cached.get('stamp') == stamp:
+            self.unchanged += 1
+            return
+
+        info = AIFF(str(output_path)).info
+        sample_rate = getattr(info, 'sample_rate', 44100)
+        channels = getattr(info, 'channels', 2)
+        bits = getattr(info, 'bits_per_sample', 16)
+
+        attrs = {
+            'Name': tags.get('title', '') or output_path.stem,
+            'Artist': tags.get('artist', ''),
+            'Album': tags.get('album', ''),
+            'Label': tags.get('label', ''),
+            'Year': tags.get('year', '')[:4],
+            'TrackNumber': tags.get('tracknumber', '').split('/')[0],
+            'Kind': "AIFF File",
+            'Size': str(st.st_size),
+            'TotalTime': str(int(round(info.length))),
+            'BitRate': str(sample_rate * channels * bits // 1000),
+            'SampleRate': str(sample_rate),
+            'DateAdded': date.today().isoformat(),
+            'Location': "file://localhost" + quote(key),
+        }
+
+        # Keep the original DateAdded when an existing entry is re-converted
+        if cached:
+            attrs['DateAdded'] = cached['attrs'].get('DateAdded', attrs['DateAdded'])
+
+        self.entries[key] = {'stamp': stamp, 'attrs': attrs}
+        self.updated += 1
+
+    def write(self) -> Path:
+        """Stream collection.xml and the attribute cache to disk."""
+        # Drop outputs that were deleted since the last export
+        self.entries = {k: v for k, v in self.entries.items() if os.path.exists(k)}
+
+        tmp_path = self.xml_path.with_name(self.xml_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            xml = XMLGenerator(f, encoding="utf-8", short_empty_elements=True)
+            xml.startDocument()
+            xml.startElement("DJ_PLAYLISTS", {'Version': "1.0.0"})
+            xml.ignorableWhitespace("\n  ")
+            xml.startElement("PRODUCT", {'Name': "rekordbox", 'Version': "6.0.0", 'Company': "AlphaTheta"})
+            xml.endElement("PRODUCT")
+            xml.ignorableWhitespace("\n  ")
+            xml.startElement("COLLECTION", {'Entries': str(len(self.entries))})
+
+            for track_id, entry in enumerate(self.entries.values(), 1):
+                attrs = {'TrackID': str(track_id), **entry['attrs']}
+                xml.ignorableWhitespace("\n    ")
+                xml.startElement("TRACK", attrs)
+                xml.endElement("TRACK")
+
+            xml.ignorableWhitespace("\n  ")
+            xml.endElement("COLLECTION")
+            xml.ignorableWhitespace("\n  ")
+            xml.startElement("PLAYLISTS", {})
+            xml.startElement("NODE", {'Type': "0", 'Name': "ROOT", 'Count': "0"})
+            xml.endElement("NODE")
+            xml.endElement("PLAYLISTS")
+            xml.ignorableWhitespace("\n")
+            xml.endElement("DJ_PLAYLISTS")
+            xml.ignorableWhitespace("\n")
+            xml.endDocument()
+        os.replace(tmp_path, self.xml_path)
+
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+
+        return self.xml_path
@@ -0,0 +1,111 @@
+"""Retry policy for failed ffmpeg runs, and the quarantine for files that keep failing.
+
+ffmpeg is no longer killed after a fixed time: the runner's watchdog kills it
+only when its reported output stops moving for stall_seconds(). A stalled or
+killed run, or one that failed with an I/O-type error, is transient and is
+retried with exponential backoff. A file that is still failing after
+MAX_ATTEMPTS is quarantined: listed in the run report and skipped by later
+batches until the file changes (or it is converted with "Convert Selected").
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from app.core import CACHE_DIR
+
+STALL_SECONDS = 60.0  # No progress for this long = hung
+MAX_ATTEMPTS = 3  # Runs per file before it is quarantined
+BACKOFF_SECONDS = 2.0  # Wait before the first retry; doubles each time
+
+# stderr text of failures that can go away on their own (busy disk, memory pressure, network shares)
+TRANSIENT_ERRORS = (
+    "Resource temporarily unavailable",
+    "Input/output error",
+    "Interrupted system call",
+    "Cannot allocate memory",
+    "Connection reset",
+    "Connection timed out",
+    "Stale file handle",
+)
+
+
+def stall_seconds() -> float:
+    """Stall interval - STALL_SECONDS unless AIFFMEPLEASE_STALL_SECONDS says otherwise."""
+    try:
+        return max(5.0, float(os.environ.get("AIFFMEPLEASE_STALL_SECONDS", STALL_SECONDS)))
+    except ValueError:
+        return STALL_SECONDS
+
+
+def is_transient(result) -> bool:
+    """True for a failed run worth retrying: stalled, killed by a signal, or an I/O-type error."""
+    if result.returncode == 0:
+        return False
+    if result.stalled or result.returncode < 0:
+        return True
+    return any(text in result.stderr for text in TRANSIENT_ERRORS)
+
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retrying after the given failed attempt (1-based)."""
+    return BACKOFF_SECONDS * 2 ** (attempt - 1)
+
+
+class Quarantine:
+    """Files that failed MAX_ATTEMPTS times, keyed by job (a CUE track by its cut, as in the
+    ledger) and stamped with the source's size and mtime.
+
+    An entry only applies while the stamp matches, so a replaced or repaired
+    file is tried again automatically.
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = path or CACHE_DIR / "quarantine.json"
+        self._lock = threading.Lock()
+        self.added = []  # (job, error) quarantined during this batch
+        self.dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def reason(self, job):
+        """Why a job is quarantined, or None if it isn't (or its source has changed since)."""
+        entry = self.entries.get(job.key)
+        if entry is None or job.stamp is None or entry.get('stamp') != list(job.stamp):
+            return None
+        return entry.get('error', "failed repeatedly")
+
+    def add(self, job, error: str, attempts: int) -> None:
+        with self._lock:
+            self.entries[job.key] = {
+                'stamp': list(job.stamp) if job.stamp else None,
+                'error': error,
+                'attempts': attempts,
+                'when': time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.added.append((job, error))
+            self.dirty = True
+
+    def remove(self, job) -> None:
+        """Forget a file that converted after all."""
+        with self._lock:
+            if self.entries.pop(job.key, None) is not None:
+                self.dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_name(self.path.name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.entries, f, indent=1)
+                os.replace(str(tmp), str(self.path))
+            except OSError as e:
+                print(f"Could not save quarantine list: {e}")
@@ -0,0 +1,123 @@
+"""In-memory inverted index over planned jobs for instant file-list filtering."""
+import bisect
+import re
+import unicodedata
+
+# Fields searchable as "field:term" - everything is also searchable without a prefix
+FIELDS = ('artist', 'title', 'album', 'label', 'year', 'file')
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text: str) -> list:
+    """Lowercase, accent-folded word tokens of a tag value or file name ("Björk" -> "bjork")."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return _WORD.findall(folded)
+
+
+class SearchIndex:
+    """Prefix-searchable inverted index: token -> the jobs containing it.
+
+    Tokens are (field, word) pairs. Every word is indexed twice, under its
+    field and under "" for unscoped terms, so "artist:da" and "da" are both
+    plain prefix ranges in one sorted token list. Jobs can be added while
+    rows stream in; the sorted list is rebuilt lazily on the first query
+    after a change, and per-term results are cached until the next change.
+    """
+
+    def __init__(self):
+        self._postings = {}  # (field, word) -> set of jobs
+        self._doc_tokens = {}  # job -> tokens, for removal
+        self._sorted = []
+        self._dirty = False
+        self._cache = {}  # (field, prefix) -> matching jobs, valid until the index changes
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    def clear(self) -> None:
+        """Forget every job."""
+        self._postings.clear()
+        self._doc_tokens.clear()
+        self._sorted = []
+        self._dirty = False
+        self._cache.clear()
+
+    def add(self, job) -> None:
+        """Index a job's tags, source file name and output name (re-indexes a known job)."""
+        self.remove(job)
+
+        values = {field: job.tags.get(field, '') for field in FIELDS if field != 'file'}
+        values['file'] = f"{job.source.stem} {job.clean_name}"
+
+        tokens = set()
+        for field, value in values.items():
+            for word in _words(value):
+                tokens.add(("", word))
+                tokens.add((field, word))
+
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = {job}
+                self._dirty = True
+            else:
+                postings.add(job)
+        self._doc_tokens[job] = tokens
+        self._cache.clear()
+
+    def remove(self, job) -> None:
+        """Drop a job from the index."""
+        if job in self._doc_tokens:
+            self._cache.clear()
+        for token in self._doc_tokens.pop(job, ()):
+            postings = self._postings[token]
+            postings.discard(job)
+            if not postings:
+                del self._postings[token]
+                self._dirty = True
+
+    def _prefix(self, term: tuple) -> set:
+        """Union of postings for every word in the term's field starting with its prefix."""
+        cached = self._cache.get(term)
+        if cached is not None:
+            return cached
+
+        if self._dirty:
+            self._sorted = sorted(self._postings)
+            self._dirty = False
+
+        field, prefix = term
+        matches = set()
+        start = bisect.bisect_left(self._sorted, term)
+        for token in self._sorted[start:]:
+            if token[0] != field or not token[1].startswith(prefix):
+                break
+            matches |= self._postings[token]
+        self._cache[term] = matches
+        return matches
+
+    def search(self, query: str):
+        """Jobs matching every term of the query, or None for an empty query.
+
+        Terms are word prefixes, optionally scoped to a field: "artist:dj label:toolroom".
+        """
+        terms = []
+        for raw in query.lower().split():
+            field, sep, rest = raw.partition(":")
+            if sep and field in FIELDS:
+                terms.extend((field, word) for word in _words(rest))
+            else:
+                terms.extend(("", word) for word in _words(raw))
+        if not terms:
+            return None
+
+        # Narrowest term first keeps the intersections small
+        results = sorted((self._prefix(term) for term in terms), key=len)
+        matches = set(results[0])
+        for other in results[1:]:
+            matches &= other
+            if not matches:
+                break
+        return matches
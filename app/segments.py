@@ -0,0 +1,179 @@
+"""Segmented conversion: a very long file decoded and encoded on every core at once.
+
+A single ffmpeg run decodes on one core, so a four-hour radio show takes
+as long on a 10-core machine as on a single core. Sources longer than
+segment_threshold() seconds are instead cut into whole-second time
+segments, each converted by its own ffmpeg process straight into its place
+in the output. ffmpeg writes the AIFF header, with the source's metadata,
+once. Every segment then writes raw PCM through a file descriptor already
+positioned at its byte offset, so there is no joining pass.
+
+Segments after the first start PREROLL_SECONDS early, and the pre-roll is
+trimmed off after resampling. The resampler has settled by the cut, so the
+joined audio is sample-for-sample the single-run output, with no click,
+gap or overlap. Only FLAC sources are segmented, because their seeks are
+sample-exact.
+"""
+import math
+import os
+import struct
+from pathlib import Path
+
+from app.core import OUTPUT_FRAME_BYTES, OUTPUT_SAMPLE_RATE
+from app.ffmpeg_runner import FFmpegResult
+
+SEGMENT_THRESHOLD = 1800.0  # Sources at least this long (seconds) are segmented
+MIN_SEGMENT_SECONDS = 120  # Shorter segments spend more on seeking and spawning than they save
+PREROLL_SECONDS = 1  # Decoded before each cut and trimmed off
+SEGMENT_SUFFIXES = (".flac",)
+
+
+def segment_threshold() -> float:
+    """Duration from which files are segmented: SEGMENT_THRESHOLD unless AIFFMEPLEASE_SEGMENT_SECONDS says otherwise (0 turns it off)."""
+    try:
+        return max(0.0, float(os.environ.get("AIFFMEPLEASE_SEGMENT_SECONDS", SEGMENT_THRESHOLD)))
+    except ValueError:
+        return SEGMENT_THRESHOLD
+
+
+def plan_segments(job, workers: int = None) -> list:
+    """(start, length) in whole seconds for each segment of a job, or [] to convert it in one run.
+
+    job.duration is the source's info.length. The last segment has length
+    None and runs to the end of the file, so a duration that is slightly off
+    never cuts audio.
+    """
+    threshold = segment_threshold()
+    if (not threshold or job.duration < threshold or job.archive is not None or job.cue is not None
+            or job.source.suffix.lower() not in SEGMENT_SUFFIXES):
+        return []
+    workers = workers or os.cpu_count() or 1
+    count = min(workers, int(job.duration // MIN_SEGMENT_SECONDS))
+    if count < 2:
+        return []
+    length = math.ceil(job.duration / count)
+    segments = [(index * length, length) for index in range(count - 1)]
+    segments.append(((count - 1) * length, None))
+    return segments
+
+
+def build_header_command(ffmpeg_path: str, audio_path: Path, output_path: Path) -> list:
+    """Build an ffmpeg command writing just the AIFF header (metadata included, no audio) for audio_path."""
+    return [
+        ffmpeg_path, "-y",
+        "-i", str(audio_path),
+        "-t", "0",
+        "-ar", "44100",
+        "-ac", "2",
+        "-c:a", "pcm_s16be",
+        "-map_metadata", "0",
+        "-map", "0:a",
+        "-f", "aiff",
+        str(output_path)
+    ]
+
+
+def build_segment_command(ffmpeg_path: str, audio_path: Path, start: int, length, fd: int) -> list:
+    """Build an ffmpeg command writing one segment of audio_path as raw PCM to file descriptor fd.
+
+    The input is seeked to PREROLL_SECONDS before start. The pre-roll and
+    everything after length are then cut by atrim in output samples, after
+    the resampler.
+    """
+    preroll = min(PREROLL_SECONDS, start)
+    trim = f"atrim=start_sample={preroll * OUTPUT_SAMPLE_RATE}"
+    if length is not None:
+        trim += f":end_sample={(preroll + length) * OUTPUT_SAMPLE_RATE}"
+    return [
+        ffmpeg_path, "-y",
+        "-ss", str(start - preroll),
+        "-i", str(audio_path),
+        "-map", "0:a",
+        "-af", f"aresample={OUTPUT_SAMPLE_RATE},{trim}",
+        "-ac", "2",
+        "-c:a", "pcm_s16be",
+        "-f", "s16be",
+        f"pipe:{fd}"
+    ]
+
+
+def _chunk_offsets(header: bytes) -> dict:
+    """Offset of each chunk ID in an AIFF header (FORM's children only)."""
+    offsets = {}
+    pos = 12
+    while pos + 8 <= len(header):
+        chunk_id = header[pos:pos + 4]
+        size = struct.unpack(">I", header[pos + 4:pos + 8])[0]
+        offsets[chunk_id] = pos
+        if chunk_id == b"SSND":
+            break  # The audio follows; nothing after it belongs to the header
+        pos += 8 + size + (size & 1)
+    return offsets
+
+
+def _finish_header(fd: int, header: bytes, frames: int) -> None:
+    """Patch the FORM size, COMM frame count and SSND size for frames of audio after the header."""
+    offsets = _chunk_offsets(header)
+    comm, ssnd = offsets[b"COMM"], offsets[b"SSND"]
+    data_bytes = frames * OUTPUT_FRAME_BYTES
+    os.pwrite(fd, struct.pack(">I", len(header) + data_bytes - 8), 4)
+    os.pwrite(fd, struct.pack(">I", frames), comm + 10)  # After the ID, size and channel count
+    os.pwrite(fd, struct.pack(">I", 8 + data_bytes), ssnd + 4)  # Offset and block size fields, then audio
+
+
+def convert_segmented(runner, ffmpeg_path: str, audio_path: Path, output_path: Path, segments: list,
+                      on_progress=None, stall_timeout: float = 60) -> FFmpegResult:
+    """Convert audio_path to output_path with one ffmpeg process per segment, all at once.
+
+    on_progress(seconds, done) gets the audio converted across all segments.
+    The result is the first failed segment's, or a success.
+    """
+    result = runner.run(build_header_command(ffmpeg_path, audio_path, output_path), stall_timeout=stall_timeout)
+    if result.returncode != 0:
+        return result
+    header = output_path.read_bytes()
+    if b"SSND" not in _chunk_offsets(header) or b"COMM" not in _chunk_offsets(header):
+        return FFmpegResult(1, f"Unexpected AIFF header from ffmpeg ({len(header)} bytes)")
+
+    # Each segment gets its own open file, positioned where its audio goes
+    fds = []
+    try:
+        ends = []
+        for start, length in segments:
+            fd = os.open(str(output_path), os.O_WRONLY)
+            fds.append(fd)
+            os.lseek(fd, len(header) + start * OUTPUT_SAMPLE_RATE * OUTPUT_FRAME_BYTES, os.SEEK_SET)
+            ends.append(None if length is None
+                        else len(header) + (start + length) * OUTPUT_SAMPLE_RATE * OUTPUT_FRAME_BYTES)
+        cmds = [build_segment_command(ffmpeg_path, audio_path, start, length, fd)
+                for (start, length), fd in zip(segments, fds)]
+
+        positions = [0.0] * len(segments)
+        finished = [False] * len(segments)
+
+        def segment_progress(index, position, done):
+            # Progress timestamps still count the pre-roll
+            positions[index] = max(0.0, position - min(PREROLL_SECONDS, segments[index][0]))
+            finished[index] = finished[index] or done
+            if on_progress:
+                on_progress(sum(positions), all(finished))
+
+        results = runner.run_all(cmds, on_progress=segment_progress, stall_timeout=stall_timeout,
+                                 pass_fds=[(fd,) for fd in fds])
+        for result in results:
+            if result.returncode != 0:
+                return result
+
+        # The fds share their offsets with the children, so each now points where its segment ended
+        for index, (fd, end) in enumerate(zip(fds, ends)):
+            written = os.lseek(fd, 0, os.SEEK_CUR)
+            if end is not None and written != end:
+                return FFmpegResult(1, f"Segment {index + 1} of {len(segments)} ended early "
+                                       f"({written} of {end} bytes)")
+        end = os.lseek(fds[-1], 0, os.SEEK_CUR)
+        os.ftruncate(fds[-1], end)
+        _finish_header(fds[-1], header, (end - len(header)) // OUTPUT_FRAME_BYTES)
+        return FFmpegResult(0, results[-1].stderr)
+    finally:
+        for fd in fds:
+            os.close(fd)
@@ -0,0 +1,226 @@
+"""Content-addressed store of converted outputs, shared by every output folder."""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from mutagen.flac import FLAC
+
+from app.core import CACHE_DIR
+
+FICLONE = 0x40049409  # Linux ioctl for reflinks (btrfs, XFS)
+
+
+def source_hash(file_path: Path) -> str:
+    """Hash of the source audio.
+
+    FLAC files carry an MD5 of the decoded audio in STREAMINFO, which costs
+    one header read and ignores tag edits. Everything else (and FLACs written
+    without the MD5) is hashed byte for byte.
+    """
+    if file_path.suffix.lower() == '.flac':
+        try:
+            md5 = FLAC(str(file_path)).info.md5_signature
+            if md5:
+                return f"flacmd5-{md5:032x}"
+        except Exception:
+            pass
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"sha256-{digest.hexdigest()}"
+
+
+def file_stamp(file_path: Path) -> str:
+    """Cheap identity of a file's current contents: device, inode, size and mtime."""
+    st = file_path.stat()
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _clone(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone where the filesystem supports it."""
+    if sys.platform == "darwin":
+        # APFS clonefile via cp -c
+        result = subprocess.run(["cp", "-c", str(src), str(dst)], capture_output=True)
+        return result.returncode == 0
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError:
+            try:
+                dst.unlink()
+            except OSError:
+                pass
+    return False
+
+
+def place(src: Path, dst: Path) -> str:
+    """Put a copy of src at dst as cheaply as possible; returns how it was done."""
+    try:
+        os.link(str(src), str(dst))
+        return "hardlink"
+    except OSError:
+        pass  # Other filesystem, or one without hard links (FAT32/exFAT)
+    if _clone(src, dst):
+        return "reflink"
+    shutil.copyfile(str(src), str(dst))
+    return "copy"
+
+
+def detach(path: Path) -> None:
+    """Give a hard-linked output its own copy before it is changed in place.
+
+    Crate copies from the store share one inode; retagging one of them must
+    not retag the others (or the store entry).
+    """
+    if path.stat().st_nlink < 2:
+        return
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if not _clone(path, tmp):
+        shutil.copyfile(str(path), str(tmp))
+    os.replace(str(tmp), str(path))
+
+
+class OutputStore:
+    """Converted AIFFs keyed by source audio hash plus conversion profile.
+
+    A crate folder that needs a track already converted for another crate
+    gets it hard-linked (or reflinked, or copied across filesystems) under
+    its own freshly built name instead of a new encode. Each entry's atime
+    is set on use and serves as the LRU clock for gc(); mtime is left alone
+    because hard-linked crate copies share it.
+
+    Sources are looked up by file stamp first (stamps.json maps each stamp
+    to the hash the source had when its output was added), so a source the
+    store has never seen is a miss without being read. Only a candidate
+    hit is confirmed by hashing.
+    """
+
+    def __init__(self, store_dir: Path = None, max_bytes: int = 20 * 1024 ** 3):
+        self.store_dir = store_dir or CACHE_DIR / "store"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.stamps_path = self.store_dir / "stamps.json"
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.stamps_path, "r", encoding="utf-8") as f:
+                self.stamps = json.load(f)  # file stamp -> source hash
+        except (OSError, ValueError):
+            self.stamps = {}
+
+    def find(self, audio_path: Path, profile: str):
+        """Key of the stored output for a source under a conversion profile, or None on a miss."""
+        stamp = file_stamp(audio_path)
+        with self._lock:
+            known = self.stamps.get(stamp)
+        if known is None or not self._entry(f"{known}-{profile}").exists():
+            self.misses += 1
+            return None
+        # Same stamp - confirm the audio, in case the file was rewritten within the mtime's resolution
+        if source_hash(audio_path) != known:
+            with self._lock:
+                self.stamps.pop(stamp, None)
+                self._dirty = True
+            self.misses += 1
+            return None
+        return f"{known}-{profile}"
+
+    def _entry(self, key: str) -> Path:
+        """Path of an entry, sharded by the first two hex digits of the source hash."""
+        shard = key.split("-", 1)[1][:2]
+        return self.store_dir / shard / f"{key}.aiff"
+
+    def fetch(self, key: str, output_path: Path):
+        """Place a stored output at output_path; returns the method used, or None on a miss."""
+        entry = self._entry(key)
+        try:
+            st = entry.stat()
+        except OSError:
+            self.misses += 1
+            return None
+
+        method = place(entry, output_path)
+        os.utime(str(entry), (time.time(), st.st_mtime))
+        self.hits += 1
+        return method
+
+    def add(self, audio_path: Path, profile: str, output_path: Path) -> None:
+        """Record a freshly converted output of a source under a conversion profile."""
+        try:
+            stamp = file_stamp(audio_path)
+            digest = source_hash(audio_path)  # Just decoded by ffmpeg, so usually read from the page cache
+        except OSError as e:
+            print(f"Could not add {output_path.name} to the output store: {e}")
+            return
+        with self._lock:
+            self.stamps[stamp] = digest
+            self._dirty = True
+
+        entry = self._entry(f"{digest}-{profile}")
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(entry.name + f".{os.getpid()}.tmp")
+        try:
+            place(output_path, tmp)
+            os.replace(str(tmp), str(entry))
+        except OSError as e:
+            print(f"Could not add {output_path.name} to the output store: {e}")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+    def save(self) -> None:
+        """Write the stamps of the sources added since the store was opened."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = self.stamps_path.with_name(self.stamps_path.name + f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.stamps, f)
+            os.replace(str(tmp), str(self.stamps_path))
+            self._dirty = False
+
+    def gc(self) -> int:
+        """Evict least recently used entries until the store fits max_bytes; returns bytes freed.
+
+        An entry that crate copies still link to leaves the store but keeps
+        its data on disk, so only entries with no other links count as freed.
+        """
+        entries = []
+        total = 0
+        for entry in self.store_dir.glob("*/*.aiff"):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_atime, st.st_size, st.st_nlink, entry))
+            total += st.st_size
+
+        evicted = 0
+        freed = 0
+        for _, size, links, entry in sorted(entries):
+            if total - evicted <= self.max_bytes:
+                break
+            try:
+                entry.unlink()  # Crate copies that are hard links keep their data
+            except OSError:
+                continue
+            evicted += size
+            if links == 1:
+                freed += size
+        return freed
@@ -0,0 +1,247 @@
+"""Structured event log and Prometheus metrics for unattended conversions.
+
+Both are off unless configured. In the GUI:
+    AIFFMEPLEASE_EVENT_LOG=/var/log/aiff/events.jsonl   append JSON-lines events
+    AIFFMEPLEASE_METRICS_PORT=9464                       serve GET /metrics on localhost
+Workers take the same settings as --event-log and --metrics-port.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Per-file wall time buckets in seconds - a 6 minute track takes 1-5 s, a DJ mix a minute or more
+LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+LATENCY_WINDOW = 1000  # Recent files behind the p95 gauge
+PREFIX = "aiffmeplease"
+
+
+class EventLog:
+    """Append-only JSON-lines file, one object per event, safe to share between threads."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)  # Line buffered for tail -f
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        """Write one event with a Unix timestamp."""
+        line = json.dumps(dict(ts=round(time.time(), 3), event=event, **fields), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Metrics:
+    """Counters, gauges and a latency histogram, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = {}  # result -> count
+        self.exit_codes = {}  # ffmpeg exit code -> count
+        self.bytes_written = 0
+        self.audio_seconds = 0.0
+        self.queue_depth = 0
+        self.in_progress = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+        self.busy_since = None  # Start of the current batch, for files/sec
+        self.batch_files = 0
+        self.last_rate = 0.0  # Files/sec of the last finished batch
+
+    def record(self, event: str, fields: dict) -> None:
+        """Update the metrics from a conversion event."""
+        with self._lock:
+            if event in ("job_queued", "job_started") and self.busy_since is None:
+                # A worker's batch starts with its first lease - the coordinator queues its jobs
+                self.busy_since = time.monotonic()
+                self.batch_files = 0
+            if event == "job_queued":
+                self.queue_depth += 1
+            elif event == "job_started":
+                self.queue_depth = max(0, self.queue_depth - 1)
+                self.in_progress += 1
+            elif event == "lease_expired":
+                self.in_progress = max(0, self.in_progress - 1)
+            elif event in ("job_finished", "job_failed"):
+                self.in_progress = max(0, self.in_progress - 1)
+                result = fields.get('result', "converted") if event == "job_finished" else "failed"
+                self.files[result] = self.files.get(result, 0) + 1
+                self.batch_files += 1
+                if 'exit_code' in fields:
+                    code = str(fields['exit_code'])
+                    self.exit_codes[code] = self.exit_codes.get(code, 0) + 1
+                self.bytes_written += fields.get('bytes', 0)
+                self.audio_seconds += fields.get('audio_seconds', 0.0)
+
+                seconds = fields.get('seconds')
+                if seconds is not None:
+                    for i, bound in enumerate(LATENCY_BUCKETS):
+                        if seconds <= bound:
+                            self.buckets[i] += 1
+                    self.latency_sum += seconds
+                    self.latency_count += 1
+                    self.recent.append(seconds)
+            elif event == "job_skipped":
+                self.files["skipped"] = self.files.get("skipped", 0) + 1
+            elif event == "batch_finished":
+                self.last_rate = self._rate()
+                self.queue_depth = 0
+                self.in_progress = 0
+                self.busy_since = None
+
+    def _rate(self) -> float:
+        """Files finished per second since the current batch was queued."""
+        if self.busy_since is None:
+            return self.last_rate
+        elapsed = time.monotonic() - self.busy_since
+        return self.batch_files / elapsed if elapsed > 0 else 0.0
+
+    def _p95(self) -> float:
+        """95th percentile of recent per-file latencies (nearest rank)."""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def render(self) -> str:
+        """Prometheus exposition text."""
+        with self._lock:
+            rate = self._rate()
+            lines = [
+                f"# HELP {PREFIX}_files_total Files finished, by result.",
+                f"# TYPE {PREFIX}_files_total counter",
+            ]
+            for result, count in sorted(self.files.items()):
+                lines.append(f'{PREFIX}_files_total{{result="{result}"}} {count}')
+            lines += [
+                f"# HELP {PREFIX}_ffmpeg_exit_codes_total ffmpeg runs, by exit code.",
+                f"# TYPE {PREFIX}_ffmpeg_exit_codes_total counter",
+            ]
+            for code, count in sorted(self.exit_codes.items()):
+                lines.append(f'{PREFIX}_ffmpeg_exit_codes_total{{code="{code}"}} {count}')
+            lines += [
+                f"# HELP {PREFIX}_output_bytes_total Bytes of AIFF written.",
+                f"# TYPE {PREFIX}_output_bytes_total counter",
+                f"{PREFIX}_output_bytes_total {self.bytes_written}",
+                f"# HELP {PREFIX}_audio_seconds_total Seconds of audio converted.",
+                f"# TYPE {PREFIX}_audio_seconds_total counter",
+                f"{PREFIX}_audio_seconds_total {self.audio_seconds:.3f}",
+                f"# HELP {PREFIX}_queue_depth Files waiting in the current batch.",
+                f"# TYPE {PREFIX}_queue_depth gauge",
+                f"{PREFIX}_queue_depth {self.queue_depth}",
+                f"# HELP {PREFIX}_in_progress Files being converted right now.",
+                f"# TYPE {PREFIX}_in_progress gauge",
+                f"{PREFIX}_in_progress {self.in_progress}",
+                f"# HELP {PREFIX}_files_per_second Files finished per second in the current (or last) batch.",
+                f"# TYPE {PREFIX}_files_per_second gauge",
+                f"{PREFIX}_files_per_second {rate:.4f}",
+                f"# HELP {PREFIX}_file_seconds_p95 95th percentile per-file latency, last "
+                f"{LATENCY_WINDOW} files.",
+                f"# TYPE {PREFIX}_file_seconds_p95 gauge",
+                f"{PREFIX}_file_seconds_p95 {self._p95():.3f}",
+                f"# HELP {PREFIX}_file_seconds Wall time per file.",
+                f"# TYPE {PREFIX}_file_seconds histogram",
+            ]
+            for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+                lines.append(f'{PREFIX}_file_seconds_bucket{{le="{bound}"}} {count}')
+            lines += [
+                f'{PREFIX}_file_seconds_bucket{{le="+Inf"}} {self.latency_count}',
+                f"{PREFIX}_file_seconds_sum {self.latency_sum:.3f}",
+                f"{PREFIX}_file_seconds_count {self.latency_count}",
+            ]
+            return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood stdout
+
+
+def serve_metrics(metrics: Metrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; returns the server (port 0 picks a free one)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class Telemetry:
+    """Fans conversion events out to the event log and the metrics; both optional.
+
+    Lives as long as the process so counters keep counting across batches,
+    the way a scraper expects.
+    """
+
+    def __init__(self, event_log: Path = None, metrics_port: int = None, host: str = "127.0.0.1"):
+        self.log = None
+        self.metrics = None
+        self.server = None
+        if event_log:
+            try:
+                self.log = EventLog(Path(event_log))
+            except OSError as e:
+                print(f"Could not open event log {event_log}: {e}")
+        if metrics_port is not None:
+            self.metrics = Metrics()
+            try:
+                self.server = serve_metrics(self.metrics, metrics_port, host)
+            except OSError as e:
+                print(f"Could not serve metrics on port {metrics_port}: {e}")
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        """Configure from AIFFMEPLEASE_EVENT_LOG and AIFFMEPLEASE_METRICS_PORT."""
+        port = os.environ.get("AIFFMEPLEASE_METRICS_PORT", "").strip()
+        try:
+            port = int(port) if port else None
+        except ValueError:
+            print(f"Ignoring invalid AIFFMEPLEASE_METRICS_PORT: {port}")
+            port = None
+        return cls(os.environ.get("AIFFMEPLEASE_EVENT_LOG") or None, port)
+
+    @property
+    def enabled(self) -> bool:
+        return self.log is not None or self.metrics is not None
+
+    def emit(self, event: str, **fields) -> None:
+        """Record an event: job_queued, job_started, job_finished, job_failed, job_skipped,
+        lease_expired, batch_finished."""
+        if self.metrics:
+            self.metrics.record(event, fields)
+        if self.log:
+            try:
+                self.log.emit(event, **fields)
+            except (OSError, ValueError) as e:
+                print(f"Could not write event log: {e}")
+
+    def close(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.log:
+            self.log.close()
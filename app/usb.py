@@ -0,0 +1,296 @@
+"""USB export: encode to local scratch space, then copy to the stick in large sequential writes.
+
+ffmpeg patches the AIFF header after writing the audio, and those small
+seek-and-write cycles crawl on FAT32/exFAT flash. With a UsbExport the batch
+writes into a staging folder under CACHE_DIR instead, and copy() moves the
+finished files over one at a time, largest first, each preallocated and
+written front to back. fsync runs at checkpoints rather than per file; at
+each checkpoint the copies are read back from the stick, checked against
+the hash taken when they were staged, and only then renamed into place.
+
+A manifest in the staging folder lists the staged files not yet on the
+stick, so an interrupted export (pulled stick, crash, full disk) picks up
+where it stopped the next time that folder is exported to.
+"""
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+
+from app.core import CACHE_DIR, sanitize_filename
+
+COPY_CHUNK = 8 * 1024 * 1024  # Bytes per copy call - large sequential writes are what flash wants
+CHECKPOINT_BYTES = 256 * 1024 * 1024  # fsync + verify after this much...
+CHECKPOINT_FILES = 32  # ...or this many files, whichever comes first
+MANIFEST_NAME = "manifest.json"
+PART_SUFFIX = ".part"
+F_NOCACHE = 48  # macOS fcntl command, for Pythons whose fcntl module doesn't name it
+
+
+def file_hash(path: Path, drop_cache: bool = False) -> str:
+    """SHA-256 of a file; drop_cache reads it back from the device instead of the page cache.
+
+    Linux evicts the file's (already synced) pages first. macOS has no such
+    call, so the file is read with F_NOCACHE, which skips the cache for pages
+    not in it yet - pages still cached from the copy may be read from memory,
+    so there the check is best effort. Elsewhere the cache is read as is.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if drop_cache and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        elif drop_cache and sys.platform == "darwin":
+            import fcntl
+            try:
+                fcntl.fcntl(f.fileno(), getattr(fcntl, "F_NOCACHE", F_NOCACHE), 1)
+            except OSError:
+                pass
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int) -> None:
+    """Copy size bytes between file descriptors with the cheapest call the OS offers.
+
+    copy_file_range lets the kernel move the data without a trip through
+    user space; sendfile does the same on older Linux kernels; plain
+    read/write is the fallback everywhere else.
+    """
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                copied = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - offset))
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError as e:
+            # Cross-filesystem copies are refused by some kernels - fall through
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if offset < size and sys.platform.startswith("linux"):
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        try:
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, min(COPY_CHUNK, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                raise
+    if offset < size:
+        os.lseek(src_fd, offset, os.SEEK_SET)
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < size:
+            chunk = os.read(src_fd, min(COPY_CHUNK, size - offset))
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                written = os.write(dst_fd, view)
+                view = view[written:]
+            offset += len(chunk)
+    if offset != size:
+        raise OSError(f"short copy: {offset} of {size} bytes")
+
+
+def _fsync_dir(path: Path) -> None:
+    """Persist renames in a folder (not possible on every OS/filesystem - best effort)."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class UsbExport:
+    """Outputs for one target folder, staged locally and copied over in bulk."""
+
+    def __init__(self, target_dir: Path, staging_root: Path = None):
+        self.target_dir = target_dir
+        key = hashlib.sha1(str(target_dir.resolve()).encode("utf-8")).hexdigest()[:16]
+        self.staging_dir = (staging_root or CACHE_DIR / "usb") / key
+        self.manifest_path = self.staging_dir / MANIFEST_NAME
+        self._lock = threading.Lock()  # Archive members are staged from several threads
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+
+        # {relative path: {'size': bytes, 'sha256': hex}} - staged, complete, not yet on the stick
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.pending = json.load(f)
+        except (OSError, ValueError):
+            self.pending = {}
+        self.resumed = len(self.pending)
+        self.errors = []  # (relative path, error) for files the last copy() left staged
+
+        # Anything else in staging is a partial encode from a run that died; half-written
+        # copies on the stick are from a copy that never reached its checkpoint
+        for path in self.staging_dir.rglob("*.aiff"):
+            if path.relative_to(self.staging_dir).as_posix() not in self.pending:
+                path.unlink()
+        for folder in {(target_dir / rel).parent for rel in self.pending}:
+            for path in folder.glob(f".*.aiff{PART_SUFFIX}"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def pending_paths(self) -> list:
+        """Final paths of the files still waiting from an earlier export - their names are taken."""
+        return [self.target_dir / rel for rel in self.pending]
+
+    def staging_path(self, final_path: Path) -> Path:
+        """Where to encode an output that will end up at final_path on the stick."""
+        return self.staging_dir / final_path.relative_to(self.target_dir)
+
+    def prepare(self, folders) -> None:
+        """Create the staging counterparts of the batch's output folders (once per batch)."""
+        for folder in folders:
+            self.staging_path(folder).mkdir(parents=True, exist_ok=True)
+
+    def add(self, output_path: Path) -> None:
+        """Mark a staged output as complete - from now on it survives until it is on the stick."""
+        entry = {'size': output_path.stat().st_size, 'sha256': file_hash(output_path)}
+        with self._lock:
+            self.pending[output_path.relative_to(self.staging_dir).as_posix()] = entry
+            self._save()
+
+    def _save(self) -> None:
+        """Write the manifest atomically."""
+        tmp = self.manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.pending, f)
+        os.replace(str(tmp), str(self.manifest_path))
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(entry['size'] for entry in self.pending.values())
+
+    def copy(self, on_progress=None, verify: bool = True) -> dict:
+        """Copy every pending file to the stick; returns {staging path: final path} for those copied.
+
+        on_progress(done, total) is called after each file. Files that fail to
+        copy, sync or verify stay staged for the next export and are listed in
+        errors.
+        """
+        self.errors = []
+        names = sorted(self.pending, key=lambda n: self.pending[n]['size'], reverse=True)
+        free = shutil.disk_usage(str(self.target_dir)).free
+        if self.pending_bytes > free:
+            raise OSError(errno.ENOSPC, f"Not enough space on {self.target_dir}: "
+                          f"{self.pending_bytes // (1024 * 1024)} MB to copy, "
+                          f"{free // (1024 * 1024)} MB free")
+
+        for folder in {(self.target_dir / name).parent for name in names}:
+            folder.mkdir(parents=True, exist_ok=True)
+
+        placed = {}
+        batch = []  # (relative path, fd, part path) written since the last checkpoint
+        batch_bytes = 0
+        try:
+            for done, name in enumerate(names, 1):
+                src = self.staging_dir / name
+                final = self.target_dir / name
+                part = final.with_name(f".{final.name}{PART_SUFFIX}")
+                size = self.pending[name]['size']
+                fd = os.open(str(part), os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o644)
+                try:
+                    if hasattr(os, "posix_fallocate") and size:
+                        try:
+                            # One contiguous allocation up front instead of cluster by cluster
+                            os.posix_fallocate(fd, 0, size)
+                        except OSError:
+                            pass
+                    src_fd = os.open(str(src), os.O_RDONLY)
+                    try:
+                        _copy_fd(src_fd, fd, size)
+                    finally:
+                        os.close(src_fd)
+                except OSError as e:
+                    os.close(fd)
+                    self.errors.append((name, f"could not copy it: {e}"))
+                    try:
+                        part.unlink()
+                    except OSError:
+                        pass
+                    continue
+                batch.append((name, fd, part))
+                batch_bytes += size
+                if batch_bytes >= CHECKPOINT_BYTES or len(batch) >= CHECKPOINT_FILES:
+                    # The checkpoint owns (and closes) the fds from here on, even if it fails
+                    checked, batch, batch_bytes = batch, [], 0
+                    placed.update(self._checkpoint(checked, verify))
+                if on_progress:
+                    on_progress(done, len(names))
+            checked, batch = batch, []
+            placed.update(self._checkpoint(checked, verify))
+        finally:
+            for _, fd, _ in batch:
+                os.close(fd)
+        return placed
+
+    def _checkpoint(self, batch: list, verify: bool) -> dict:
+        """fsync, verify and rename a batch of copies, then drop them from staging.
+
+        Closes every fd in the batch, whatever else fails.
+        """
+        placed = {}
+        unsynced = {}  # name -> fsync error; those copies are not placed
+        for name, fd, part in batch:
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                unsynced[name] = f"could not sync it: {e}"
+            finally:
+                os.close(fd)
+        for name, _, part in batch:
+            try:
+                if name in unsynced:
+                    raise OSError(unsynced[name])
+                if verify and file_hash(part, drop_cache=True) != self.pending[name]['sha256']:
+                    raise OSError(f"{name} does not match its staged copy")
+                final = self.target_dir / name
+                if final.exists():
+                    # Something took the name while this batch was converting
+                    final = self._free_name(final.parent, final.stem)
+                os.replace(str(part), str(final))
+            except OSError as e:
+                self.errors.append((name, unsynced.get(name) or f"could not place it: {e}"))
+                try:
+                    part.unlink()
+                except OSError:
+                    pass
+                continue
+            placed[self.staging_dir / name] = final
+        for folder in {final.parent for final in placed.values()}:
+            _fsync_dir(folder)
+
+        with self._lock:
+            for staged in placed:
+                self.pending.pop(staged.relative_to(self.staging_dir).as_posix(), None)
+                try:
+                    staged.unlink()
+                except OSError:
+                    pass
+            self._save()
+        return placed
+
+    def _free_name(self, folder: Path, clean_name: str) -> Path:
+        """First free "name (n).aiff" in a folder on the stick."""
+        counter = 1
+        while True:
+            final = folder / (sanitize_filename(f"{clean_name} ({counter})") + ".aiff")
+            if not final.exists():
+                return final
+            counter += 1
@@ -0,0 +1,45 @@
+"""Shared fixtures: a private cache directory and FLAC files made with ffmpeg.
+
+app.core reads the cache location from HOME when it is imported, so HOME
+is pointed at a temporary folder before any app module loads.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="aiffmeplease-test-home-")
+os.environ.setdefault("AIFFMEPLEASE_STALL_SECONDS", "10")
+
+
+@pytest.fixture
+def ffmpeg():
+    """Path to ffmpeg; tests that encode are skipped without it."""
+    path = shutil.which("ffmpeg")
+    if path is None:
+        pytest.skip("ffmpeg is not installed")
+    return path
+
+
+def make_audio(ffmpeg: str, path: Path, seconds: float = 2.0, rate: int = 44100,
+               frequency: int = 440, tags: dict = None) -> Path:
+    """Write a stereo sine tone as FLAC or MP3 (by path suffix), with the given tags."""
+    cmd = [ffmpeg, "-v", "error", "-y", "-f", "lavfi",
+           "-i", f"sine=frequency={frequency}:sample_rate={rate}:duration={seconds}",
+           "-ac", "2"]
+    for key, value in (tags or {}).items():
+        cmd += ["-metadata", f"{key}={value}"]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(cmd + [str(path)], check=True)
+    return path
+
+
+@pytest.fixture
+def make_flac(ffmpeg, tmp_path):
+    """Factory for FLAC files in tmp_path/src: make_flac(name, seconds=2.0, rate=44100, **tags)."""
+    def make(name: str, seconds: float = 2.0, rate: int = 44100, frequency: int = 440, **tags):
+        return make_audio(ffmpeg, tmp_path / "src" / name, seconds, rate, frequency, tags)
+    return make
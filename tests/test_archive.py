@@ -0,0 +1,126 @@
+"""Archive members: each compressed TAR is streamed once per batch, not inflated once per member."""
+import random
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.archive import Archive, MemberReader, open_member
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+
+from test_pipeline import RecordedEvents
+
+
+@pytest.fixture
+def album(make_flac, tmp_path):
+    """A .tar.gz of six FLACs, and the bytes of each member."""
+    sources = [make_flac(f"{n}.flac", seconds=1, frequency=220 * n, artist="A", title=f"T{n}") for n in range(1, 7)]
+    path = tmp_path / "album.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        for source in sources:
+            tar.add(source, arcname=f"album/{source.name}")
+    return path, {f"album/{source.name}": source.read_bytes() for source in sources}
+
+
+@pytest.fixture
+def tar_opens(monkeypatch):
+    """Modes tarfile.open is called with."""
+    modes = []
+    real_open = tarfile.open
+
+    def counting_open(name=None, mode="r", *args, **kwargs):
+        modes.append(mode)
+        return real_open(name, mode, *args, **kwargs)
+    monkeypatch.setattr(tarfile, "open", counting_open)
+    return modes
+
+
+def test_reader_walks_a_compressed_tar_once(album, tar_opens):
+    path, members = album
+
+    def read(name):
+        with reader.open(path, name) as f:
+            return f.read()
+
+    with MemberReader((path, name) for name in members) as reader:
+        for name in members:
+            reader.expect(path, name)  # As the batch does when it pops each member's job
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert list(pool.map(read, members)) == list(members.values())
+
+    assert tar_opens.count("r|*") == 1
+    assert "r:*" not in tar_opens  # No member had to be opened on its own
+
+
+def test_members_out_of_order_are_opened_on_their_own(album, tar_opens):
+    path, members = album
+    names = list(members)
+    random.Random(1).shuffle(names)
+
+    def read(name):
+        with reader.open(path, name) as f:
+            return f.read()
+
+    with MemberReader((path, name) for name in members) as reader:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert list(pool.map(read, names)) == [members[name] for name in names]
+
+    assert tar_opens.count("r|*") == 1
+    assert 0 < tar_opens.count("r:*") < len(members)
+
+
+def test_member_opened_again_after_the_walk(album):
+    path, members = album
+    name = next(iter(members))
+    with MemberReader([(path, name)]) as reader:
+        reader.open(path, name).close()
+        with reader.open(path, name) as f:
+            assert f.read() == members[name]
+
+
+def test_open_member_uses_cached_headers(album, monkeypatch):
+    path, members = album
+    with Archive(path) as archive:
+        archive.members()
+
+    def rescan(self):
+        raise AssertionError("archive headers were read again")
+    monkeypatch.setattr(tarfile.TarFile, "getmembers", rescan)
+    for name, data in members.items():
+        with open_member(path, name) as f:
+            assert f.read() == data
+
+
+def test_batch_converts_a_compressed_tar(album, ffmpeg, tmp_path, tar_opens):
+    path, members = album
+    plan = ConversionPlan.build([path])
+    events = RecordedEvents()
+    del tar_opens[:]
+
+    ConversionBatch(plan.jobs, tmp_path / "out", ffmpeg, {}, events).run()
+
+    assert events.result == (6, 0, 6)
+    assert len(list((tmp_path / "out").rglob("*.aiff"))) == 6
+    assert tar_opens.count("r|*") == 2  # Pre-flight check and conversion
+    assert "r:*" not in tar_opens
+
+
+def test_batch_streams_a_compressed_tar_without_temp_files(album, ffmpeg, tmp_path, monkeypatch):
+    path, members = album
+    plan = ConversionPlan.build([path])
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(scratch))
+
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("a member was copied to a temp file")
+    for name in ("SpooledTemporaryFile", "TemporaryFile", "NamedTemporaryFile", "mkstemp"):
+        monkeypatch.setattr(tempfile, name, no_temp_files)
+
+    events = RecordedEvents()
+    ConversionBatch(plan.jobs, tmp_path / "out", ffmpeg, {}, events).run()
+
+    assert events.result == (6, 0, 6)
+    assert list(scratch.iterdir()) == []
@@ -0,0 +1,22 @@
+"""Artwork cache shared by conversion threads."""
+import subprocess
+import threading
+
+from app.artwork import ArtworkCache
+
+
+def test_one_resize_per_cover_across_threads(ffmpeg, tmp_path):
+    cover = subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "color=red:size=1200x1200",
+                            "-frames:v", "1", "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1"],
+                           capture_output=True, check=True).stdout
+    cache = ArtworkCache(ffmpeg, tmp_path / "artwork")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(cover))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4 and len(set(results)) == 1 and results[0]
+    assert cache.misses == 1
+    assert len(list((tmp_path / "artwork").glob("*.jpg"))) == 1
@@ -0,0 +1,90 @@
+"""Background mode: the CPU duty cycle and the I/O token bucket, timed without waiting."""
+import asyncio
+import signal
+import time
+
+import pytest
+
+import app.background
+from app.background import DUTY_PERIOD, MIN_CPU_SHARE, Throttle
+
+
+class FakeProcess:
+    """A child that exits when told to."""
+
+    pid = 12345
+
+    def __init__(self):
+        self.exit = asyncio.Event()
+
+    async def wait(self):
+        await self.exit.wait()
+        return 0
+
+
+def test_share_is_clamped():
+    assert Throttle(enabled=False, cpu_share=0.2).share == 1.0
+    assert Throttle(enabled=True, cpu_share=0.2).share == 0.2
+    assert Throttle(enabled=True, cpu_share=0.0).share == MIN_CPU_SHARE
+    assert Throttle(enabled=True, cpu_share=3.0).share == 1.0
+
+
+def test_duty_cycle(monkeypatch):
+    throttle = Throttle(enabled=True, cpu_share=0.25)
+    signals = []
+    timeouts = []
+    reniced = []
+    real_wait = asyncio.wait
+    monkeypatch.setattr(app.background.os, "kill", lambda pid, sig: signals.append(sig))
+    monkeypatch.setattr(throttle, "renice", reniced.append)
+
+    async def run():
+        proc = FakeProcess()
+
+        async def wait(futures, timeout):
+            timeouts.append(timeout)
+            if len(timeouts) == 6:
+                proc.exit.set()  # Exits during its third pause
+            return await real_wait(futures, timeout=0.5 if proc.exit.is_set() else 0)
+        monkeypatch.setattr(app.background.asyncio, "wait", wait)
+        await throttle.govern(proc)
+
+    asyncio.run(run())
+
+    assert timeouts == pytest.approx([DUTY_PERIOD * 0.25, DUTY_PERIOD * 0.75] * 3)
+    assert signals == [signal.SIGSTOP, signal.SIGCONT] * 3  # Never left stopped
+    assert reniced == [FakeProcess.pid]
+
+
+def test_governor_returns_when_the_child_exits():
+    throttle = Throttle(enabled=True, cpu_share=0.5)
+
+    async def run():
+        proc = FakeProcess()
+        proc.exit.set()
+        start = time.monotonic()
+        await throttle.govern(proc)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < DUTY_PERIOD / 2
+
+
+def test_token_bucket_delays(monkeypatch):
+    throttle = Throttle(enabled=True, io_mbps=1.0)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+    monkeypatch.setattr(app.background.asyncio, "sleep", sleep)
+
+    async def run():
+        await throttle.throttle_io(512 * 1024)
+        await throttle.throttle_io(512 * 1024)  # Queued behind the first half megabyte
+        throttle._io_clock = time.monotonic() - 5  # Idle since: no burst credit is saved up
+        await throttle.throttle_io(256 * 1024)
+        throttle.io_mbps = 0  # No cap
+        await throttle.throttle_io(10 * 1024 * 1024)
+
+    asyncio.run(run())
+
+    assert delays == pytest.approx([0.5, 1.0, 0.25], abs=0.05)
@@ -0,0 +1,26 @@
+"""The single-file ffmpeg command."""
+import subprocess
+
+import pytest
+from mutagen.aiff import AIFF
+
+from app.core import build_ffmpeg_command, parse_loudness
+
+
+def pcm(ffmpeg, path):
+    """Decoded samples of an AIFF, as raw bytes."""
+    return subprocess.run([ffmpeg, "-v", "error", "-i", str(path), "-f", "s16le", "pipe:1"],
+                          capture_output=True, check=True).stdout
+
+
+@pytest.mark.parametrize("rate", [44100, 48000, 96000])
+def test_loudness_leaves_the_audio_alone(ffmpeg, make_flac, tmp_path, rate):
+    source = make_flac(f"tone-{rate}.flac", seconds=3, rate=rate)
+    plain, measured = tmp_path / "plain.aiff", tmp_path / "measured.aiff"
+    subprocess.run(build_ffmpeg_command(ffmpeg, source, plain), capture_output=True, check=True)
+    result = subprocess.run(build_ffmpeg_command(ffmpeg, source, measured, analyze_loudness=True),
+                            capture_output=True, text=True, check=True)
+
+    assert parse_loudness(result.stderr)['integrated'] is not None
+    assert AIFF(str(measured)).info.sample_rate == AIFF(str(plain)).info.sample_rate == 44100
+    assert pcm(ffmpeg, measured) == pcm(ffmpeg, plain)
@@ -0,0 +1,100 @@
+"""CUE sheets: per-track loudness and BPM/key from the one shared decode, and sheet edits."""
+import subprocess
+
+import pytest
+from mutagen.aiff import AIFF
+
+import app.plan
+from app.analysis import HAS_NUMPY
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+from app.retry import Quarantine
+
+from test_pipeline import RecordedEvents
+
+SHEET = """PERFORMER "DJ Test"
+TITLE "Mix"
+FILE "mix.flac" WAVE
+  TRACK 01 AUDIO
+    TITLE "Quiet"
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    TITLE "Loud"
+    INDEX 01 00:12:00
+"""
+
+
+@pytest.fixture
+def mix(ffmpeg, tmp_path):
+    """A 24 s mix: 12 s of quiet clicks at 100 BPM, then 12 s of loud clicks at 150 BPM, and its sheet."""
+    folder = tmp_path / "src"
+    folder.mkdir()
+    click = "gt(mod(t,{period}),0.0)*lt(mod(t,{period}),0.02)*sin(2*PI*880*t)"
+    expression = (f"if(lt(t,12),0.05*{click.format(period=0.6)},"
+                  f"0.8*{click.format(period=0.4)})")
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", f"aevalsrc='{expression}':s=44100:d=24",
+                    "-ac", "2", str(folder / "mix.flac")], check=True)
+    (folder / "mix.cue").write_text(SHEET)
+    return folder / "mix.flac"
+
+
+def convert(mix, ffmpeg, output_dir, options):
+    plan = ConversionPlan.build([mix])
+    assert [job.cue.number for job in plan.jobs] == [1, 2]
+    events = RecordedEvents()
+    batch = ConversionBatch(plan.jobs, output_dir, ffmpeg, options, events)
+    batch.run()
+    assert events.result == (2, 0, 2)
+    return batch, {str(AIFF(str(p)).tags["TIT2"]): AIFF(str(p)).tags for p in output_dir.glob("*.aiff")}
+
+
+def test_each_track_gets_its_own_loudness(mix, ffmpeg, tmp_path):
+    batch, tags = convert(mix, ffmpeg, tmp_path / "out", {'analyze_loudness': True})
+
+    report = dict(batch.loudness_report)
+    assert len(report) == 2
+    quiet, loud = (report[name]['integrated'] for name in ("DJ Test - Quiet.aiff", "DJ Test - Loud.aiff"))
+    assert loud - quiet > 15
+    gains = {title: str(tag["TXXX:REPLAYGAIN_TRACK_GAIN"]) for title, tag in tags.items()}
+    assert gains["Quiet"] != gains["Loud"]
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="NumPy is not installed")
+def test_each_track_gets_its_own_bpm(mix, ffmpeg, tmp_path):
+    _, tags = convert(mix, ffmpeg, tmp_path / "out", {'analyze_bpm_key': True})
+
+    assert int(str(tags["Quiet"]["TBPM"])) == pytest.approx(100, abs=2)
+    assert int(str(tags["Loud"]["TBPM"])) == pytest.approx(150, abs=2)
+
+
+def test_sheet_edit_makes_tracks_stale(mix):
+    job = ConversionPlan.build([mix]).jobs[0]
+    assert not job.is_stale()
+    sheet = mix.with_name("mix.cue")
+    sheet.write_text(SHEET.replace('"Quiet"', '"Quieter"'))
+    assert job.is_stale()
+
+
+def test_mix_is_probed_once(mix, monkeypatch):
+    opened = []
+    real_open_audio = app.plan.open_audio
+    monkeypatch.setattr(app.plan, "open_audio", lambda path, fileobj=None: opened.append(path) or
+                        real_open_audio(path, fileobj))
+
+    jobs = ConversionPlan.build([mix]).jobs
+
+    assert opened == [mix]
+    assert [job.clean_name for job in jobs] == ["DJ Test - Quiet", "DJ Test - Loud"]
+    assert [job.total_samples for job in jobs] == [12 * 44100, 12 * 44100]
+
+
+def test_quarantine_holds_one_track(mix, tmp_path):
+    quarantine = Quarantine(tmp_path / "quarantine.json")
+    quiet, loud = ConversionPlan.build([mix]).jobs
+
+    quarantine.add(quiet, "broken cut", 3)
+    assert quarantine.reason(quiet) == "broken cut"
+    assert quarantine.reason(loud) is None
+
+    quarantine.remove(loud)
+    assert quarantine.reason(quiet) == "broken cut"
@@ -0,0 +1,58 @@
+"""Conversion daemon: headless, and converting the jobs a client planned without probing them again."""
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from app.daemon import ConversionService, _Server, _Handler
+from app.daemon_client import DaemonClient
+from app.plan import ConversionPlan, Job
+
+
+def test_daemon_does_not_need_tk():
+    code = "import sys, app.daemon; sys.exit('tkinter' in sys.modules or 'app.gui' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+@pytest.fixture
+def daemon(ffmpeg, tmp_path):
+    """A running service and a client for it, on a socket in tmp_path."""
+    service = ConversionService(ffmpeg)
+    path = tmp_path / "daemon.sock"
+    server = _Server(str(path), _Handler)
+    server.service = service
+    threads = [threading.Thread(target=server.serve_forever, daemon=True),
+               threading.Thread(target=service.run, daemon=True)]
+    for thread in threads:
+        thread.start()
+    yield DaemonClient.connect(path)
+    service.stop()
+    server.shutdown()
+    server.server_close()
+
+
+def test_submitted_jobs_are_not_probed_again(daemon, make_flac, tmp_path, monkeypatch):
+    plan = ConversionPlan.build([make_flac("a.flac", artist="A", title="One"),
+                                 make_flac("b.flac", artist="A", title="Two")])
+
+    def probe(self, fileobj=None):
+        raise AssertionError(f"{self.source.name} was probed again")
+    monkeypatch.setattr(Job, "probe", probe)
+
+    events = list(daemon.submit(plan.jobs, tmp_path / "out", {}, watch=True))
+
+    finished = events[-1]
+    assert finished['event'] == "finished"
+    assert (finished['converted'], finished['failed']) == (2, 0)
+    statuses = {e['job']: e['status'] for e in events if e.get('event') == "status"}
+    assert statuses == {job.key: "Done" for job in plan.jobs}
+    assert sorted(p.name for p in (tmp_path / "out").glob("*.aiff")) == ["A - One.aiff", "A - Two.aiff"]
+
+
+def test_job_wire_round_trip(make_flac):
+    job = ConversionPlan.build([make_flac("a.flac", artist="A", title="One")]).jobs[0]
+    copy = Job.from_wire(job.to_wire())
+    for field in ('source', 'stamp', 'tags', 'duration', 'sample_rate', 'total_samples', 'clean_name', 'key'):
+        assert getattr(copy, field) == getattr(job, field)
+    assert not copy.is_stale()
@@ -0,0 +1,78 @@
+"""Distributed conversion on localhost: a coordinator, two workers and a lease that runs out."""
+import json
+import socket
+import threading
+import time
+
+from app.distributed import Coordinator, serve, run_worker
+from app.telemetry import Telemetry
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for(port: int) -> None:
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def events(path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_expired_lease_leaves_one_output(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac(f"{n}.flac", seconds=0.5, artist="A", title=f"Track {n}") for n in range(3)]
+    output_dir = tmp_path / "out"
+    # ffmpeg that starts too late to renew its lease in time
+    slow = tmp_path / "slow-ffmpeg"
+    slow.write_text(f"#!/bin/sh\nsleep 2\nexec {ffmpeg} \"$@\"\n")
+    slow.chmod(0o755)
+
+    coordinator_log = Telemetry(tmp_path / "coordinator.jsonl")
+    coordinator = Coordinator(sources, output_dir, lease_seconds=0.5, max_attempts=5,
+                              telemetry=coordinator_log, log=lambda text: None)
+    port = free_port()
+    finished = {}
+    server = threading.Thread(target=lambda: finished.update(serve(coordinator, "127.0.0.1", port)))
+    server.start()
+    wait_for(port)
+    url = f"http://127.0.0.1:{port}"
+
+    worker_log = Telemetry(tmp_path / "workers.jsonl")
+    converted = {}
+
+    def work(name, ffmpeg_path):
+        converted[name] = run_worker(url, name, ffmpeg_path, poll_interval=0.1, telemetry=worker_log,
+                                     log=lambda text: None)
+
+    workers = [threading.Thread(target=work, args=("slow", str(slow)))]
+    workers[0].start()
+    time.sleep(0.3)  # The slow worker leases the first job
+    workers.append(threading.Thread(target=work, args=("fast", ffmpeg)))
+    workers[1].start()
+    for thread in workers + [server]:
+        thread.join(30)
+    coordinator_log.close()
+    worker_log.close()
+
+    assert finished['done'] == 3 and finished['failed'] == 0
+    assert finished['workers']['slow']['expired'] >= 1
+    assert converted == {'slow': 0, 'fast': 3}
+    # The slow worker's late copy was thrown away, not numbered next to the real one
+    assert sorted(p.name for p in output_dir.iterdir()) == [f"A - Track {n}.aiff" for n in range(3)]
+
+    batch = [event['event'] for event in events(tmp_path / "coordinator.jsonl")]
+    assert batch.count("lease_expired") >= 1
+    assert batch.count("job_queued") == 3 + batch.count("lease_expired")
+    assert batch.count("job_finished") == 3
+    ran = events(tmp_path / "workers.jsonl")
+    assert "job_queued" not in {event['event'] for event in ran}
+    assert [event['result'] for event in ran if event['event'] == "job_finished" and event['worker'] == "slow"] \
+        == ["discarded"] * batch.count("lease_expired")
@@ -0,0 +1,47 @@
+"""Dry run: the rename map and collision reasons, and a projected size that matches the real outputs."""
+from app.dryrun import dry_run, report_lines
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+
+from test_pipeline import RecordedEvents
+
+
+def test_rename_map_and_collisions(make_flac, tmp_path):
+    sources = [make_flac("a.flac", seconds=0.5, artist="A", title="One"),
+               make_flac("b.flac", seconds=0.5, artist="A", title="One"),
+               make_flac("c.flac", seconds=0.5, artist="A", title="Two"),
+               make_flac("d.flac", seconds=0.5, artist="B", title="Three")]
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    (output_dir / "a - two.aiff").write_bytes(b"")  # Same name to a case-insensitive disk
+
+    report = dry_run(ConversionPlan.build(sources).jobs, output_dir)
+
+    assert [(source.name, path.relative_to(output_dir).as_posix()) for source, path in report.renames] == [
+        ("a.flac", "A - One.aiff"),
+        ("b.flac", "A - One (1).aiff"),
+        ("c.flac", "A - Two (1).aiff"),
+        ("d.flac", "B - Three.aiff"),
+    ]
+    assert [(source.name, wanted, final, reason) for source, wanted, final, reason in report.collisions] == [
+        ("b.flac", "A - One.aiff", "A - One (1).aiff", "duplicate"),
+        ("c.flac", "A - Two.aiff", "A - Two (1).aiff", "exists"),
+    ]
+    assert "  b.flac: A - One.aiff duplicate, will be written as A - One (1).aiff" in report_lines(report)
+    assert sorted(p.name for p in output_dir.iterdir()) == ["a - two.aiff"]  # Nothing written
+
+
+def test_projected_size_is_the_converted_size(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", seconds=1.3, artist="A", title="One", comment="Promo"),
+               make_flac("b.flac", seconds=2.0, artist="B", title="Two")]
+    plan = ConversionPlan.build(sources)
+    output_dir = tmp_path / "out"
+
+    report = dry_run(plan.jobs, output_dir)
+    ConversionBatch(plan.jobs, output_dir, ffmpeg, {}, RecordedEvents()).run()
+
+    # Projections leave out the ID3 chunk written after the encode
+    written = sum(path.stat().st_size for path in output_dir.glob("*.aiff"))
+    id3 = sum(len(path.read_bytes()) - path.read_bytes().index(b"ID3 ") for path in output_dir.glob("*.aiff"))
+    assert report.output_bytes == written - id3
+    assert report.audio_seconds == 3.3
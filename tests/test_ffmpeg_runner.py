@@ -0,0 +1,48 @@
+"""The ffmpeg runner's stall watchdog."""
+import time
+
+from app.background import DUTY_PERIOD, Throttle
+from app.core import build_ffmpeg_command
+from app.ffmpeg_runner import FFmpegRunner
+
+
+def test_run_returns_when_ffmpeg_exits(make_flac, ffmpeg, tmp_path):
+    source = make_flac("short.flac", seconds=0.3)
+    runner = FFmpegRunner()
+    try:
+        start = time.monotonic()
+        for n in range(5):
+            result = runner.run(build_ffmpeg_command(ffmpeg, source, tmp_path / f"{n}.aiff"))
+            assert result.returncode == 0
+        elapsed = time.monotonic() - start
+    finally:
+        runner.close()
+    assert elapsed < 2.5  # The watchdog used to hold every run until its next one-second check
+
+
+def test_throttled_run_returns_when_ffmpeg_exits(make_flac, ffmpeg, tmp_path):
+    source = make_flac("short.flac", seconds=0.3)
+    runner = FFmpegRunner(Throttle())
+    try:
+        start = time.monotonic()
+        for n in range(20):
+            assert runner.run(build_ffmpeg_command(ffmpeg, source, tmp_path / f"{n}.aiff")).returncode == 0
+        elapsed = time.monotonic() - start
+    finally:
+        runner.close()
+    assert elapsed < 20 * DUTY_PERIOD * 0.75  # The CPU governor used to finish its period first
+
+
+def test_stalled_process_is_killed(tmp_path):
+    # A "ffmpeg" that never reports progress; the runner's -progress arguments are ignored
+    script = tmp_path / "hang"
+    script.write_text("#!/bin/sh\nexec sleep 30\n")
+    script.chmod(0o755)
+    runner = FFmpegRunner()
+    try:
+        start = time.monotonic()
+        result = runner.run([str(script)], stall_timeout=0.5)
+    finally:
+        runner.close()
+    assert result.stalled
+    assert time.monotonic() - start < 10
@@ -0,0 +1,67 @@
+"""Short files grouped into shared ffmpeg runs - and when they are not."""
+import pytest
+
+import app.pipeline
+from app.analysis import HAS_NUMPY
+from app.background import Throttle
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+
+from test_pipeline import RecordedEvents
+
+
+@pytest.fixture
+def shorts(make_flac):
+    return [make_flac(f"{n}.flac", seconds=0.5, artist="A", title=f"Shot {n}") for n in range(4)]
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Files per ffmpeg run: convert_group and convert_job calls, in order."""
+    calls = []
+    real_group, real_job = ConversionBatch.convert_group, ConversionBatch.convert_job
+
+    def group(self, items, runner, queue):
+        calls.append(len(items))
+        return real_group(self, items, runner, queue)
+
+    def job(self, i, job, runner, queue):
+        calls.append(1)
+        return real_job(self, i, job, runner, queue)
+    monkeypatch.setattr(ConversionBatch, "convert_group", group)
+    monkeypatch.setattr(ConversionBatch, "convert_job", job)
+    return calls
+
+
+def convert(sources, ffmpeg, tmp_path, options, throttle=None):
+    events = RecordedEvents()
+    ConversionBatch(ConversionPlan.build(sources).jobs, tmp_path / "out", ffmpeg, dict(options, group_size=32),
+                    events, throttle=throttle).run()
+    return events
+
+
+def test_short_files_share_one_run(shorts, ffmpeg, tmp_path, runs):
+    events = convert(shorts, ffmpeg, tmp_path, {})
+    assert runs == [4]
+    assert events.result == (4, 0, 4)
+
+
+def test_failed_group_is_redone_file_by_file(shorts, ffmpeg, tmp_path, runs, monkeypatch):
+    monkeypatch.setattr(app.pipeline, "build_group_command", lambda path, pairs: [path, "-bad-option"])
+    events = convert(shorts, ffmpeg, tmp_path, {})
+    assert runs == [4, 1, 1, 1, 1]
+    assert events.result == (4, 0, 4)
+    assert set(events.statuses.values()) == {"Done"}
+
+
+def test_io_cap_turns_grouping_off(shorts, ffmpeg, tmp_path, runs):
+    events = convert(shorts, ffmpeg, tmp_path, {}, Throttle(enabled=True, io_mbps=500))
+    assert runs == [1, 1, 1, 1]
+    assert events.result == (4, 0, 4)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="NumPy is not installed")
+def test_bpm_key_analysis_turns_grouping_off(shorts, ffmpeg, tmp_path, runs):
+    events = convert(shorts, ffmpeg, tmp_path, {'analyze_bpm_key': True})
+    assert runs == [1, 1, 1, 1]
+    assert events.result == (4, 0, 4)
@@ -0,0 +1,81 @@
+"""JobQueue: plan order, promotions (lazily deleted heap entries), taking jobs out and delayed retries."""
+import time
+
+from app.jobqueue import JobQueue
+
+
+def drain(queue) -> list:
+    jobs = []
+    while True:
+        job = queue.pop()
+        if job is None:
+            return jobs
+        jobs.append(job)
+
+
+def test_pops_in_plan_order():
+    queue = JobQueue(list("abcde"))
+    assert queue.peek(3) == list("abc")
+    assert drain(queue) == list("abcde")
+    assert len(queue) == 0
+
+
+def test_promotions_go_first_newest_first():
+    queue = JobQueue(list("abcdef"))
+    assert queue.promote(["e", "c"]) == ["e", "c"]
+    assert queue.promote(["f", "x"]) == ["f"]  # Not queued - not moved
+
+    assert len(queue) == 6  # Superseded entries aren't counted
+    assert queue.peek(6) == list("fecabd")
+    assert drain(queue) == list("fecabd")
+
+
+def test_promoting_again_leaves_one_entry():
+    queue = JobQueue(list("abc"))
+    queue.promote(["c"])
+    queue.promote(["c", "b"])
+    assert drain(queue) == list("cba")
+
+
+def test_take_removes_pending_jobs():
+    queue = JobQueue(list("abcd"))
+    queue.promote(["c"])
+    queue.retry(queue.pop(), delay=60)  # "c" waits out a backoff
+
+    assert queue.take(["c", "d", "x"]) == ["d", "c"]
+    assert queue.take(["d"]) == []  # Already taken
+    assert drain(queue) == list("ab")
+
+
+def test_retries_wait_for_their_backoff_behind_queued_jobs():
+    queue = JobQueue(list("ab"))
+    first = queue.pop()
+    start = time.monotonic()
+    queue.retry(first, delay=0.2)
+
+    assert len(queue) == 2
+    assert queue.pop() == "b"
+    assert queue.pop() == "a"  # Only the retry is left: pop waits for it
+    assert time.monotonic() - start >= 0.2
+    assert queue.pop() is None
+
+
+def test_due_retries_queue_behind_promotions_and_plan_order():
+    queue = JobQueue(list("abc"))
+    queue.retry(queue.pop(), delay=0)
+    queue.promote(["c"])
+
+    assert drain(queue) == list("cba")
+
+
+def short(job) -> bool:
+    return job.startswith("s")
+
+
+def test_pop_group_stops_at_the_first_job_that_does_not_match():
+    queue = JobQueue(["s1", "s2", "long", "s3"])
+
+    assert queue.pop_group(8, short) == ["s1", "s2"]
+    assert queue.pop_group(8, short) == ["long"]
+    assert queue.pop_group(8, short) == ["s3"]
+    assert queue.pop_group(8, short) == []
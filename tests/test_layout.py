@@ -0,0 +1,49 @@
+"""OutputNames: collision numbering in each folder, case-insensitively, across threads."""
+import threading
+
+from app.layout import OutputNames
+
+
+def test_taken_names_are_numbered(tmp_path):
+    (tmp_path / "Artist - Track.aiff").write_bytes(b"")
+    (tmp_path / "Artist - Track (1).aiff").write_bytes(b"")
+    names = OutputNames()
+
+    assert names.claim(tmp_path, "Artist - Track") == tmp_path / "Artist - Track (2).aiff"
+    assert names.claim(tmp_path, "Artist - Track") == tmp_path / "Artist - Track (3).aiff"
+    assert names.claim(tmp_path, "Other") == tmp_path / "Other.aiff"
+    assert names.count(tmp_path) == 5
+
+
+def test_names_differing_only_in_case_collide(tmp_path):
+    names = OutputNames()
+    assert names.claim(tmp_path, "DJ Mix") == tmp_path / "DJ Mix.aiff"
+    assert names.claim(tmp_path, "dj mix") == tmp_path / "dj mix (1).aiff"
+
+
+def test_folders_are_numbered_separately(tmp_path):
+    names = OutputNames()
+    assert names.claim(tmp_path / "A", "Track") == tmp_path / "A" / "Track.aiff"
+    assert names.claim(tmp_path / "B", "Track") == tmp_path / "B" / "Track.aiff"  # Not created yet
+    assert names.claim(tmp_path / "A", "Track") == tmp_path / "A" / "Track (1).aiff"
+
+
+def test_released_name_is_claimed_again(tmp_path):
+    names = OutputNames()
+    first = names.claim(tmp_path, "Track")
+    names.claim(tmp_path, "Track")
+    names.release(first)
+    assert names.claim(tmp_path, "Track") == first
+
+
+def test_concurrent_claims_get_distinct_names(tmp_path):
+    names = OutputNames()
+    claimed = []
+    threads = [threading.Thread(target=lambda: claimed.append(names.claim(tmp_path, "Track"))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(claimed)) == 16
+    assert tmp_path / "Track (15).aiff" in claimed
@@ -0,0 +1,91 @@
+"""Output ledger: cheap audio fingerprints, and kept outputs following the layout."""
+import pytest
+from mutagen.aiff import AIFF, AIFFFile
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3, TIT2
+
+import app.ledger
+from app.layout import OutputLayout
+from app.ledger import audio_hash
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+
+from conftest import make_audio
+from test_pipeline import RecordedEvents
+
+
+@pytest.fixture
+def mp3(ffmpeg, tmp_path):
+    """An MP3 of about 1 MB."""
+    return make_audio(ffmpeg, tmp_path / "long.mp3", seconds=60, tags={'title': "Long"})
+
+
+def test_mp3_fingerprint_samples_the_audio(mp3, monkeypatch):
+    monkeypatch.setattr(app.ledger, "SAMPLE_BYTES", 128 * 1024)
+    read = []
+    real_hash_range = app.ledger._hash_range
+    monkeypatch.setattr(app.ledger, "_hash_range",
+                        lambda path, start, end: read.append(end - start) or real_hash_range(path, start, end))
+    audio_hash(mp3)
+
+    assert mp3.stat().st_size > 6 * app.ledger.SAMPLE_BYTES
+    assert sum(read) == 2 * app.ledger.SAMPLE_BYTES
+
+
+def test_mp3_fingerprint_ignores_tags(mp3):
+    before = audio_hash(mp3)
+    tags = ID3(str(mp3))
+    tags.add(TIT2(encoding=3, text=["A much longer title than the one before"]))
+    tags.save()
+    assert audio_hash(mp3) == before
+
+
+def test_new_layout_moves_up_to_date_outputs(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", artist="A", title="One", genre="House")]
+    output_dir = tmp_path / "out"
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, {}, RecordedEvents()).run()
+
+    events = RecordedEvents()
+    options = {'layout': OutputLayout("genre")}
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, options, events).run()
+
+    assert list(events.statuses.values()) == ["Up to date"]
+    assert [p.relative_to(output_dir).as_posix() for p in output_dir.rglob("*.aiff")] == ["House/A - One.aiff"]
+    assert any(line.startswith("Moved A - One.aiff") for line in events.lines)
+
+
+def test_kept_outputs_stay_in_a_full_bucket(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac(f"{n}.flac", artist="A", title=str(n)) for n in range(3)]
+    output_dir = tmp_path / "out"
+    options = {'layout': OutputLayout("alphabetical", bucket_size=3)}
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, options, RecordedEvents()).run()
+
+    events = RecordedEvents()
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, options, events).run()
+
+    assert set(events.statuses.values()) == {"Up to date"}
+    assert not any(line.startswith("Moved") for line in events.lines)
+    assert {p.parent.name for p in output_dir.rglob("*.aiff")} == {"A"}
+
+
+def test_retag_rewrites_the_aiff_text_chunks(make_flac, ffmpeg, tmp_path):
+    source = make_flac("a.flac", artist="A", title="Tpyo", author="A")
+    output_dir = tmp_path / "out"
+    ConversionBatch(ConversionPlan.build([source]).jobs, output_dir, ffmpeg, {}, RecordedEvents()).run()
+    flac = FLAC(str(source))
+    flac['title'] = "Typo fixed"
+    flac['artist'] = "B"
+    flac.save()
+
+    events = RecordedEvents()
+    ConversionBatch(ConversionPlan.build([source]).jobs, output_dir, ffmpeg, {}, events).run()
+
+    assert list(events.statuses.values()) == ["Retagged"]
+    assert [p.name for p in output_dir.glob("*.aiff")] == ["B - Typo fixed.aiff"]
+    with open(output_dir / "B - Typo fixed.aiff", "rb") as f:
+        aiff = AIFFFile(f)
+        assert aiff['NAME'].read().rstrip(b"\0") == b"Typo fixed"
+        assert aiff['AUTH'].read().rstrip(b"\0") == b"B"
+    retagged = AIFF(str(output_dir / "B - Typo fixed.aiff"))
+    assert str(retagged.tags["TIT2"]) == "Typo fixed"
+    assert retagged.info.length == pytest.approx(2.0, abs=0.01)
@@ -0,0 +1,43 @@
+"""Read order for spinning disks: on-disk sorting and read-ahead hints."""
+import os
+
+import pytest
+
+import app.locality
+from app.locality import ReadAhead, disk_order
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = [tmp_path / f"{name}.flac" for name in "abcd"]
+    for path in paths:
+        path.write_bytes(b"x" * 4096)
+    return paths
+
+
+def test_sorted_by_physical_offset_then_inode(files, monkeypatch):
+    a, b, c, d = files
+    offsets = {a: 300, b: None, c: 100, d: None}  # b and d: no FIEMAP
+    monkeypatch.setattr(app.locality, "physical_offset", lambda path: offsets[path])
+    missing = a.with_name("gone.flac")
+
+    ordered = disk_order([missing, a, b, c, d])
+
+    by_inode = sorted([b, d], key=lambda path: os.stat(path).st_ino)
+    assert ordered == [c, a] + by_inode + [missing]
+
+
+def test_real_offsets_give_every_file_a_place(files):
+    assert sorted(disk_order(files)) == sorted(files)
+
+
+@pytest.mark.skipif(not app.locality.HAS_FADVISE, reason="no posix_fadvise")
+def test_each_file_is_hinted_once_sequential_first(files, monkeypatch):
+    advice = []
+    monkeypatch.setattr(os, "posix_fadvise", lambda fd, offset, length, kind: advice.append((length, kind)))
+    readahead = ReadAhead(length=1024)
+
+    readahead.hint(files[:2])
+    readahead.hint(files[1:3] + [files[0].with_name("gone.flac")])
+
+    assert advice == [(0, os.POSIX_FADV_SEQUENTIAL), (1024, os.POSIX_FADV_WILLNEED)] * 3
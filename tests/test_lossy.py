@@ -0,0 +1,60 @@
+"""Fake-lossless detection: a FLAC decoded from an MP3 is flagged, a real one is not."""
+import subprocess
+
+import pytest
+
+import app.lossy
+from app.lossy import LossyScanner
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+
+from test_pipeline import RecordedEvents
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def noise(ffmpeg, tmp_path):
+    """Factory for 15 s of stereo white noise as FLAC: noise(name, via_mp3=False)."""
+    def make(name, via_mp3=False):
+        (tmp_path / "src").mkdir(exist_ok=True)
+        path = tmp_path / "src" / name
+        source = ["-f", "lavfi", "-i", "anoisesrc=duration=15:color=white:sample_rate=44100:amplitude=0.5",
+                  "-ac", "2"]
+        if via_mp3:
+            # 128 kbps MP3s are low-passed at about 16 kHz, and decoding keeps the cliff
+            mp3 = path.with_suffix(".mp3")
+            subprocess.run([ffmpeg, "-v", "error", "-y"] + source + ["-b:a", "128k", str(mp3)], check=True)
+            source = ["-i", str(mp3)]
+        subprocess.run([ffmpeg, "-v", "error", "-y"] + source + [str(path)], check=True)
+        return path
+    return make
+
+
+def test_low_passed_flac_is_flagged(noise, ffmpeg):
+    plan = ConversionPlan.build([noise("transcode.flac", via_mp3=True), noise("master.flac")])
+    scanner = LossyScanner(ffmpeg, workers=1)
+
+    suspects = scanner.flag(plan.jobs)
+
+    transcode, master = plan.jobs
+    assert scanner.errors == []
+    assert list(suspects) == [transcode]
+    assert 15000 <= transcode.lossy_cutoff <= 17000
+    assert master.lossy_cutoff is None
+    assert transcode.lossy_checked and master.lossy_checked
+
+
+def test_batch_keeps_the_file_lists_verdicts(noise, ffmpeg, tmp_path, monkeypatch):
+    plan = ConversionPlan.build([noise("transcode.flac", via_mp3=True), noise("master.flac")])
+    LossyScanner(ffmpeg, workers=1).flag(plan.jobs)
+
+    def rescan(*args):
+        raise AssertionError("a checked file was scanned again")
+    monkeypatch.setattr(app.lossy.LossyScanner, "scan", rescan)
+    events = RecordedEvents()
+    ConversionBatch(plan.jobs, tmp_path / "out", ffmpeg, {'lossy_mode': "skip"}, events).run()
+
+    assert events.statuses[str(plan.jobs[0].source)].startswith("Skipped: Lossy?")
+    assert events.statuses[str(plan.jobs[1].source)] == "Done"
+    assert [p.name for p in (tmp_path / "out").glob("*.aiff")] == ["master.aiff"]
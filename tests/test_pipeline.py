@@ -0,0 +1,50 @@
+"""ConversionBatch end to end, without a window."""
+from mutagen.aiff import AIFF
+
+from app.pipeline import ConversionBatch, BatchEvents
+from app.plan import ConversionPlan
+
+
+class RecordedEvents(BatchEvents):
+    """Keeps every event for the assertions."""
+
+    def __init__(self):
+        self.statuses = {}
+        self.lines = []
+        self.result = None
+
+    def status(self, job, text):
+        self.statuses[job.key] = text
+
+    def log(self, text):
+        self.lines.append(text)
+
+    def complete(self, converted, failed, total, note=""):
+        self.result = (converted, failed, total)
+
+
+def test_batch_converts_and_tags(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", artist="Artist", title="One"),
+               make_flac("b.flac", artist="Artist", title="Two")]
+    plan = ConversionPlan.build(sources)
+    events = RecordedEvents()
+    output_dir = tmp_path / "out"
+
+    ConversionBatch(plan.jobs, output_dir, ffmpeg, {}, events).run()
+
+    assert events.result == (2, 0, 2)
+    assert set(events.statuses.values()) == {"Done"}
+    assert sorted(p.name for p in output_dir.glob("*.aiff")) == ["Artist - One.aiff", "Artist - Two.aiff"]
+    assert str(AIFF(str(output_dir / "Artist - One.aiff")).tags["TIT2"]) == "One"
+
+
+def test_second_batch_keeps_outputs(make_flac, ffmpeg, tmp_path):
+    plan = ConversionPlan.build([make_flac("a.flac", artist="Artist", title="One")])
+    output_dir = tmp_path / "out"
+    ConversionBatch(plan.jobs, output_dir, ffmpeg, {}, RecordedEvents()).run()
+
+    events = RecordedEvents()
+    ConversionBatch(ConversionPlan.build(plan.sources()).jobs, output_dir, ffmpeg, {}, events).run()
+
+    assert list(events.statuses.values()) == ["Up to date"]
+    assert events.result == (1, 0, 1)
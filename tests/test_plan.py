@@ -0,0 +1,15 @@
+"""Building a plan: jobs handed over file by file while the rest are probed."""
+from app.plan import ConversionPlan
+
+
+def test_jobs_are_reported_as_each_file_is_probed(make_flac, tmp_path):
+    sources = [make_flac(f"{n}.flac", seconds=0.5, artist="A", title=f"Track {n}") for n in range(3)]
+    (tmp_path / "src" / "notes.flac").write_bytes(b"not audio")
+    batches = []
+
+    plan = ConversionPlan.build(sources + [tmp_path / "src" / "notes.flac"],
+                                on_jobs=lambda jobs: batches.append(list(jobs)))
+
+    assert [len(jobs) for jobs in batches] == [1, 1, 1, 1]
+    assert [job for jobs in batches for job in jobs] == plan.jobs
+    assert plan.jobs[-1].probe_error
@@ -0,0 +1,61 @@
+"""Pre-flight check: verdicts on sound, truncated and mislabeled sources from their headers alone."""
+import subprocess
+
+import pytest
+
+from app.plan import ConversionPlan
+from app.preflight import preflight, BROKEN, OK
+
+from conftest import make_audio
+
+
+def truncate(path, fraction: float):
+    data = path.read_bytes()
+    path.write_bytes(data[:int(len(data) * fraction)])
+    return path
+
+
+@pytest.fixture
+def sources(make_flac, ffmpeg, tmp_path):
+    """One sound and one damaged file of each kind, by name."""
+    src = tmp_path / "src"
+    files = {
+        'good.flac': make_flac("good.flac", seconds=3),
+        'good.mp3': make_audio(ffmpeg, src / "good.mp3", seconds=3),
+        'truncated.flac': truncate(make_flac("truncated.flac", seconds=3), 0.5),
+        'truncated.mp3': truncate(make_audio(ffmpeg, src / "truncated.mp3", seconds=3), 0.5),
+        'empty.flac': src / "empty.flac",
+        'garbage.flac': src / "garbage.flac",
+        'wav.mp3': src / "wav.mp3",
+    }
+    files['empty.flac'].write_bytes(b"")
+    files['garbage.flac'].write_bytes(bytes(range(256)) * 64)
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "sine=duration=1", "-f", "wav",
+                    str(files['wav.mp3'])], check=True)
+
+    # A FLAC whose first audio frame was overwritten: the metadata ends where the first frame sync is
+    corrupt = make_flac("corrupt.flac", seconds=3)
+    data = bytearray(corrupt.read_bytes())
+    first_frame = data.index(b"\xff\xf8", 42)
+    data[first_frame:first_frame + 16] = b"\x00" * 16
+    corrupt.write_bytes(bytes(data))
+    files['corrupt.flac'] = corrupt
+    return files
+
+
+def test_verdicts(sources):
+    plan = ConversionPlan.build(list(sources.values()))
+
+    report = preflight(plan.jobs)
+
+    verdicts = {job.source.name: job.preflight for job in plan.jobs}
+    assert verdicts['good.flac'] == (OK, "")
+    assert verdicts['good.mp3'] == (OK, "")
+    assert verdicts['truncated.flac'][0] == BROKEN and verdicts['truncated.flac'][1].startswith("truncated: audio stops")
+    assert verdicts['truncated.mp3'][0] == BROKEN and verdicts['truncated.mp3'][1].startswith("truncated:")
+    assert verdicts['empty.flac'] == (BROKEN, "empty file")
+    assert verdicts['garbage.flac'] == (BROKEN, "not a FLAC file (unknown contents)")
+    assert verdicts['wav.mp3'] == (BROKEN, "not an MP3 (looks like WAV)")
+    assert verdicts['corrupt.flac'] == (BROKEN, "first audio frame is corrupt")
+    assert sorted(job.source.name for job in report.ok) == ["good.flac", "good.mp3"]
+    assert len(report.broken) == len(sources) - 2
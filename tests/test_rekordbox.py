@@ -0,0 +1,65 @@
+"""Rekordbox export: collection.xml parses back to the converted outputs, and stays in sync."""
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, urlparse
+
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+from app.rekordbox import RekordboxExporter
+
+from test_pipeline import RecordedEvents
+
+
+def tracks(xml_path) -> dict:
+    """TRACK attributes by the output path their Location points at."""
+    root = ET.parse(xml_path).getroot()
+    collection = root.find("COLLECTION")
+    found = {}
+    for track in collection.findall("TRACK"):
+        location = urlparse(track.get("Location"))
+        assert location.scheme == "file" and location.netloc == "localhost"
+        found[unquote(location.path)] = track.attrib
+    assert int(collection.get("Entries")) == len(found)
+    return found
+
+
+def test_collection_round_trip(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", seconds=2.0, artist="Björk & Friends", title="<Army> of \"Me\"",
+                         album="Post", date="1995-06-13", tracknumber="3/11", label="One Little Indian"),
+               make_flac("b.flac", seconds=1.0, rate=48000, artist="B", title="Two")]
+    output_dir = tmp_path / "out"
+
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, {'export_rekordbox': True},
+                    RecordedEvents()).run()
+
+    found = tracks(output_dir / "collection.xml")
+    outputs = {str(path.resolve()): path for path in output_dir.glob("*.aiff")}
+    assert set(found) == set(outputs)
+    first = next(attrs for attrs in found.values() if attrs['Artist'] == "Björk & Friends")
+    assert first['Name'] == "<Army> of \"Me\""
+    assert (first['Album'], first['Label'], first['Year'], first['TrackNumber']) == \
+        ("Post", "One Little Indian", "1995", "3")
+    assert (first['Kind'], first['TotalTime'], first['SampleRate'], first['BitRate']) == \
+        ("AIFF File", "2", "44100", "1411")
+    for key, attrs in found.items():
+        assert attrs['Size'] == str(outputs[key].stat().st_size)
+    assert sorted(int(attrs['TrackID']) for attrs in found.values()) == [1, 2]
+
+
+def test_unchanged_outputs_keep_their_entries(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", seconds=0.5, artist="A", title="One"),
+               make_flac("b.flac", seconds=0.5, artist="B", title="Two")]
+    output_dir = tmp_path / "out"
+    ConversionBatch(ConversionPlan.build(sources).jobs, output_dir, ffmpeg, {'export_rekordbox': True},
+                    RecordedEvents()).run()
+    before = tracks(output_dir / "collection.xml")
+
+    (output_dir / "B - Two.aiff").unlink()
+    exporter = RekordboxExporter(output_dir)
+    exporter.update(output_dir / "A - One.aiff", {'title': "Renamed"})
+    exporter.write()
+
+    assert (exporter.updated, exporter.unchanged) == (0, 1)
+    (key, attrs), = tracks(output_dir / "collection.xml").items()
+    assert key == str((output_dir / "A - One.aiff").resolve())
+    assert attrs['Name'] == "One"  # Cached, since the file didn't change
+    assert attrs['DateAdded'] == before[key]['DateAdded']
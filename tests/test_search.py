@@ -0,0 +1,74 @@
+"""SearchIndex: prefix, field-scoped and accent-folded queries over the file list."""
+from pathlib import Path
+
+import pytest
+
+from app.plan import Job
+from app.search import SearchIndex
+
+
+def job(name: str, **tags) -> Job:
+    planned = Job(Path("/music") / f"{name}.flac")
+    planned.tags = tags
+    planned.clean_name = f"{tags.get('artist', '')} - {tags.get('title', name)}"
+    return planned
+
+
+@pytest.fixture
+def jobs():
+    return {
+        'bjork': job("01", artist="Björk", title="Army of Me", label="One Little Indian", year="1995"),
+        'daft': job("02", artist="Daft Punk", title="Da Funk", label="Virgin", year="1995"),
+        'dj': job("track_03", artist="DJ Koze", title="Pick Up", label="Pampa", year="2018"),
+    }
+
+
+@pytest.fixture
+def index(jobs):
+    index = SearchIndex()
+    for planned in jobs.values():
+        index.add(planned)
+    return index
+
+
+def test_prefixes_match_any_field(index, jobs):
+    assert index.search("da") == {jobs['daft']}
+    assert index.search("p") == {jobs['daft'], jobs['dj']}  # Punk; Pick, Pampa
+    assert index.search("1995") == {jobs['bjork'], jobs['daft']}
+    assert index.search("track_0") == {jobs['dj']}  # Source file name
+    assert index.search("zzz") == set()
+
+
+def test_every_term_must_match(index, jobs):
+    assert index.search("1995 virgin") == {jobs['daft']}
+    assert index.search("koze army") == set()
+
+
+def test_field_scoped_terms(index, jobs):
+    assert index.search("label:p") == {jobs['dj']}
+    assert index.search("title:p") == {jobs['dj']}
+    assert index.search("artist:da") == {jobs['daft']}
+    assert index.search("artist:funk") == set()
+    # An unknown field is an ordinary term
+    assert index.search("genre:da") == set()
+
+
+def test_accents_and_case_are_folded(index, jobs):
+    assert index.search("BJORK") == {jobs['bjork']}
+    assert index.search("artist:björ") == {jobs['bjork']}
+
+
+def test_empty_query_filters_nothing(index):
+    assert index.search("") is None
+    assert index.search("  :: ") is None
+
+
+def test_reindexed_and_removed_jobs(index, jobs):
+    jobs['daft'].tags['artist'] = "Thomas Bangalter"
+    index.add(jobs['daft'])
+    assert index.search("artist:daft") == set()
+    assert index.search("bangalter") == {jobs['daft']}
+
+    index.remove(jobs['dj'])
+    assert index.search("p") == {jobs['daft']}
+    assert len(index) == 2
@@ -0,0 +1,48 @@
+"""Segmented conversion: the joined segments are the single-run output, sample for sample."""
+import pytest
+from mutagen.aiff import AIFFFile
+
+from app.core import build_ffmpeg_command
+from app.ffmpeg_runner import FFmpegRunner
+from app.plan import ConversionPlan
+from app.segments import convert_segmented, plan_segments
+
+
+@pytest.fixture
+def runner():
+    runner = FFmpegRunner()
+    yield runner
+    runner.close()
+
+
+def frames_and_pcm(path) -> tuple:
+    """(COMM frame count, PCM bytes of SSND) of an AIFF."""
+    with open(path, "rb") as f:
+        aiff = AIFFFile(f)
+        frames = int.from_bytes(aiff['COMM'].read()[2:6], "big")
+        return frames, aiff['SSND'].read()[8:]  # Offset and block size come first
+
+
+@pytest.mark.parametrize("rate", [44100, 48000])
+def test_segments_join_into_the_single_run_output(make_flac, ffmpeg, runner, tmp_path, rate):
+    source = make_flac("long.flac", seconds=20.5, rate=rate, frequency=997, artist="A", title="Mix")
+    single = tmp_path / "single.aiff"
+    assert runner.run(build_ffmpeg_command(ffmpeg, source, single)).returncode == 0
+
+    segmented = tmp_path / "segmented.aiff"
+    result = convert_segmented(runner, ffmpeg, source, segmented, [(0, 7), (7, 7), (14, None)])
+
+    assert result.returncode == 0, result.stderr
+    frames, pcm = frames_and_pcm(segmented)
+    assert frames == frames_and_pcm(single)[0] == round(20.5 * 44100)
+    assert pcm == frames_and_pcm(single)[1]
+
+
+def test_long_files_are_cut_into_whole_second_segments(make_flac, monkeypatch):
+    monkeypatch.setenv("AIFFMEPLEASE_SEGMENT_SECONDS", "300")
+    job = ConversionPlan.build([make_flac("short.flac", seconds=1.0)]).jobs[0]
+    assert plan_segments(job, workers=4) == []
+
+    job.duration = 1000.5
+    assert plan_segments(job, workers=4) == [(0, 251), (251, 251), (502, 251), (753, None)]
+    assert plan_segments(job, workers=1) == []
@@ -0,0 +1,85 @@
+"""Output store: stamp-first lookups and what gc() really frees."""
+import os
+
+import pytest
+
+import app.store
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+from app.store import OutputStore
+
+from test_pipeline import RecordedEvents
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OutputStore(tmp_path / "store")
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "track.mp3"
+    path.write_bytes(b"ID3" + bytes(4096))
+    return path
+
+
+def output(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(bytes(size))
+    return path
+
+
+def test_unknown_source_is_a_miss_without_reading_it(store, source, monkeypatch):
+    def hash_it(path):
+        raise AssertionError("the source was hashed")
+    monkeypatch.setattr(app.store, "source_hash", hash_it)
+
+    assert store.find(source, "p") is None
+    assert store.misses == 1
+
+
+def test_added_source_is_found_by_stamp_and_confirmed(store, source, tmp_path, monkeypatch):
+    store.add(source, "p", output(tmp_path, "out.aiff", 100))
+    store.save()
+
+    hashed = []
+    real_hash = app.store.source_hash
+    monkeypatch.setattr(app.store, "source_hash", lambda path: hashed.append(path) or real_hash(path))
+    reopened = OutputStore(store.store_dir)
+    key = reopened.find(source, "p")
+    assert key is not None and hashed == [source]
+    assert reopened.find(source, "other profile") is None
+    assert reopened.fetch(key, tmp_path / "crate.aiff") == "hardlink"
+
+
+def test_rewritten_source_with_the_same_stamp_is_a_miss(store, source, tmp_path):
+    store.add(source, "p", output(tmp_path, "out.aiff", 100))
+    st = source.stat()
+    source.write_bytes(b"ID3" + b"\1" * 4096)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert store.find(source, "p") is None
+
+
+def test_gc_counts_only_entries_without_crate_links(tmp_path):
+    store = OutputStore(tmp_path / "store", max_bytes=0)
+    for name, size in (("a.mp3", 1000), ("b.mp3", 3000)):
+        source = tmp_path / name
+        source.write_bytes(name.encode() * 10)
+        store.add(source, "p", output(tmp_path, f"{name}.aiff", size))
+    os.unlink(tmp_path / "a.mp3.aiff")  # Only the store holds a's output; b's is still in a crate
+
+    assert store.gc() == 1000
+    assert not list(store.store_dir.glob("*/*.aiff"))
+
+
+def test_second_folder_links_the_stored_output(make_flac, ffmpeg, tmp_path):
+    sources = [make_flac("a.flac", artist="A", title="One")]
+    ConversionBatch(ConversionPlan.build(sources).jobs, tmp_path / "crate1", ffmpeg, {'use_store': True},
+                    RecordedEvents()).run()
+    events = RecordedEvents()
+    ConversionBatch(ConversionPlan.build(sources).jobs, tmp_path / "crate2", ffmpeg, {'use_store': True},
+                    events).run()
+
+    assert list(events.statuses.values()) == ["Done (hardlink)"]
+    assert (tmp_path / "crate2" / "A - One.aiff").stat().st_nlink == 3  # Both crates and the store entry
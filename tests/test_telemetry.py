@@ -0,0 +1,75 @@
+"""Event log and /metrics, scraped the way Prometheus would."""
+import json
+import re
+import urllib.request
+
+import pytest
+
+from app.pipeline import ConversionBatch
+from app.plan import ConversionPlan
+from app.telemetry import Telemetry, LATENCY_BUCKETS, PREFIX
+
+from test_pipeline import RecordedEvents
+
+
+@pytest.fixture
+def telemetry(tmp_path):
+    telemetry = Telemetry(tmp_path / "events.jsonl", metrics_port=0)
+    yield telemetry
+    telemetry.close()
+
+
+def scrape(telemetry) -> dict:
+    """Samples of /metrics by name and labels, e.g. {'aiffmeplease_files_total{result="failed"}': 1.0}."""
+    port = telemetry.server.server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_converted_file_is_counted(telemetry, make_flac, ffmpeg, tmp_path):
+    plan = ConversionPlan.build([make_flac("a.flac", seconds=1.0, artist="A", title="One")])
+
+    ConversionBatch(plan.jobs, tmp_path / "out", ffmpeg, {}, RecordedEvents(), telemetry=telemetry).run()
+
+    samples = scrape(telemetry)
+    assert samples[f'{PREFIX}_files_total{{result="converted"}}'] == 1
+    assert samples[f'{PREFIX}_ffmpeg_exit_codes_total{{code="0"}}'] == 1
+    assert samples[f"{PREFIX}_output_bytes_total"] == (tmp_path / "out" / "A - One.aiff").stat().st_size
+    assert samples[f"{PREFIX}_audio_seconds_total"] == pytest.approx(1.0, abs=0.01)
+    assert samples[f"{PREFIX}_queue_depth"] == 0
+    assert samples[f"{PREFIX}_in_progress"] == 0
+    assert samples[f"{PREFIX}_file_seconds_count"] == 1
+
+    logged = [json.loads(line)['event'] for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert logged == ["job_queued", "job_started", "job_finished", "batch_finished"]
+
+
+def test_latency_histogram_buckets(telemetry):
+    for _ in range(4):
+        telemetry.emit("job_queued", source="x")
+    for seconds in (0.2, 0.7, 3.0, 400.0):
+        telemetry.emit("job_started", source="x")
+        telemetry.emit("job_finished", source="x", exit_code=0, seconds=seconds, bytes=10)
+    telemetry.emit("job_queued", source="y")
+    telemetry.emit("job_started", source="y")
+    telemetry.emit("job_failed", source="y", exit_code=1, seconds=1.5)
+
+    samples = scrape(telemetry)
+    buckets = {float(re.search(r'le="([^"]+)"', name).group(1)): count
+               for name, count in samples.items() if name.startswith(f"{PREFIX}_file_seconds_bucket")}
+    # Cumulative: 0.2 | 0.7 | 1.5 | 3.0 | ... | 400 only in +Inf
+    assert list(buckets) == list(LATENCY_BUCKETS) + [float("inf")]
+    assert list(buckets.values()) == [1, 2, 3, 4, 4, 4, 4, 4, 4, 5]
+    assert samples[f"{PREFIX}_file_seconds_sum"] == pytest.approx(405.4)
+    assert samples[f'{PREFIX}_files_total{{result="converted"}}'] == 4
+    assert samples[f'{PREFIX}_files_total{{result="failed"}}'] == 1
+    assert samples[f'{PREFIX}_ffmpeg_exit_codes_total{{code="1"}}'] == 1
+    assert samples[f"{PREFIX}_output_bytes_total"] == 40
+    assert samples[f"{PREFIX}_queue_depth"] == 0
+    assert samples[f"{PREFIX}_file_seconds_p95"] == 400.0
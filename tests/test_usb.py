@@ -0,0 +1,88 @@
+"""USB export: staging, checkpointed copies, resuming and rejecting bad copies."""
+import json
+
+import pytest
+
+import app.usb
+from app.usb import UsbExport, MANIFEST_NAME, PART_SUFFIX
+
+
+@pytest.fixture
+def stick(tmp_path):
+    (tmp_path / "stick").mkdir()
+    return tmp_path / "stick"
+
+
+def stage(export, stick, name, data):
+    """Encode stand-in: write a staged output and mark it complete."""
+    path = export.staging_path(stick / name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    export.add(path)
+    return path
+
+
+def test_copies_in_checkpoints(stick, tmp_path, monkeypatch):
+    monkeypatch.setattr(app.usb, "CHECKPOINT_FILES", 2)
+    export = UsbExport(stick, tmp_path / "staging")
+    staged = {name: stage(export, stick, name, bytes([n]) * (1000 * (n + 1)))
+              for n, name in enumerate(["A/one.aiff", "A/two.aiff", "B/three.aiff"])}
+    checkpoints = []
+    real_checkpoint = UsbExport._checkpoint
+    monkeypatch.setattr(UsbExport, "_checkpoint",
+                        lambda self, batch, verify: checkpoints.append(len(batch)) or real_checkpoint(self, batch, verify))
+
+    placed = export.copy()
+
+    assert checkpoints == [2, 1]
+    assert placed == {staged[name]: stick / name for name in staged}
+    for name, path in staged.items():
+        assert not path.exists()
+    assert (stick / "B" / "three.aiff").read_bytes() == bytes([2]) * 3000
+    assert export.errors == [] and export.pending == {}
+    assert json.loads((export.staging_dir / MANIFEST_NAME).read_text()) == {}
+    assert not list(stick.rglob(f"*{PART_SUFFIX}"))
+
+
+def test_resumes_after_a_partial_run(stick, tmp_path):
+    first = UsbExport(stick, tmp_path / "staging")
+    stage(first, stick, "one.aiff", b"1" * 500)
+    stage(first, stick, "two.aiff", b"2" * 500)
+    # The run died mid-copy: a half-written copy on the stick, a half-encoded file in staging
+    (stick / f".one.aiff{PART_SUFFIX}").write_bytes(b"1" * 100)
+    (first.staging_dir / "three.aiff").write_bytes(b"partial")
+
+    export = UsbExport(stick, tmp_path / "staging")
+
+    assert export.resumed == 2
+    assert not (stick / f".one.aiff{PART_SUFFIX}").exists()
+    assert not (export.staging_dir / "three.aiff").exists()
+    assert sorted(p.name for p in export.copy().values()) == ["one.aiff", "two.aiff"]
+    assert (stick / "one.aiff").read_bytes() == b"1" * 500
+
+
+def test_corrupted_copy_stays_staged(stick, tmp_path):
+    export = UsbExport(stick, tmp_path / "staging")
+    good = stage(export, stick, "good.aiff", b"g" * 800)
+    bad = stage(export, stick, "bad.aiff", b"b" * 800)
+    bad.write_bytes(b"x" * 800)  # No longer what was hashed when it was staged
+
+    placed = export.copy()
+
+    assert placed == {good: stick / "good.aiff"}
+    assert [name for name, _ in export.errors] == ["bad.aiff"]
+    assert "does not match" in export.errors[0][1]
+    assert not (stick / "bad.aiff").exists() and not list(stick.glob(f".*{PART_SUFFIX}"))
+    assert bad.exists() and list(export.pending) == ["bad.aiff"]
+
+
+def test_failed_checkpoint_closes_each_fd_once(stick, tmp_path, monkeypatch):
+    export = UsbExport(stick, tmp_path / "staging")
+    stage(export, stick, "one.aiff", b"1" * 500)
+
+    def fail(path):
+        raise OSError("folder sync failed")
+    monkeypatch.setattr(app.usb, "_fsync_dir", fail)
+
+    with pytest.raises(OSError, match="folder sync failed"):
+        export.copy()